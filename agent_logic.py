@@ -1,9 +1,14 @@
 import os
-import sys
 import re
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import closing
 from datetime import date
 from typing import List, Dict, Any, Union, TypedDict, Annotated
-import operator
 
 # Carrega variáveis de ambiente
 from dotenv import load_dotenv
@@ -11,46 +16,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # --- IMPORTAÇÕES DE UTILS ---
-try:
-    from utils.supabase_client import (
-        buscar_parcelas_vencendo_hoje,
-        atualizar_status_pagamento,
-        buscar_parcela_atual,
-        baixar_pdf_bytes,
-        buscar_apolice_inteligente
-    )
-except ImportError as e:
-    print(f"✗ Erro ao importar utils.supabase_client: {e}")
-    sys.exit(1)
+from utils.supabase_client import (
+    buscar_parcelas_vencendo_hoje,
+    atualizar_status_pagamento,
+    buscar_parcela_atual,
+    baixar_pdf_bytes,
+    buscar_apolice_inteligente
+)
 
 try:
     from utils.pdf_parser import extrair_codigo_de_barras
 except ImportError:
     extrair_codigo_de_barras = None
 
-import requests
-
-# --- IMPORTAÇÕES LANGCHAIN E LANGGRAPH ---
-try:
-    from langchain_openai import ChatOpenAI
-    from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage
-    from langchain_core.tools import tool
-    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-
-    from langgraph.graph import StateGraph, END
-    from langgraph.prebuilt import ToolNode
-    from langgraph.checkpoint.memory import MemorySaver
-    from langgraph.graph.message import add_messages
-
-    print("✓ Bibliotecas LangGraph e OpenAI carregadas com sucesso.")
-except ImportError as e:
-    print(f"✗ Erro Crítico: {e}")
-    sys.exit(1)
+# LangChain, LangGraph e OpenAI só são importados em obter_agente(), no primeiro uso:
+# importar este módulo (app.py, scheduler.py) não carrega nada disso.
 
 
 # --- 1. DEFINIÇÃO DAS FERRAMENTAS (COM DOCSTRINGS CORRIGIDAS) ---
+# Funções comuns; viram ferramentas do LangChain (tool) só quando o agente é montado.
 
-@tool
 def descobrir_numero_apolice(termo_busca: str) -> str:
     """
     Busca dados da apólice vigente pelo PLACA, NOME ou CPF.
@@ -75,13 +60,11 @@ def descobrir_numero_apolice(termo_busca: str) -> str:
     """
 
 
-@tool
 def buscar_clientes_com_vencimento_hoje() -> Union[List[Dict[str, Any]], str]:
     """Busca no banco de dados todas as parcelas de seguro que vencem hoje."""
     return buscar_parcelas_vencendo_hoje()
 
 
-@tool
 def enviar_lembrete_whatsapp(numero_telefone: str, nome_cliente: str, data_vencimento: str, valor_parcela: float,
                              numero_apolice: str, placa: str) -> str:
     """
@@ -98,7 +81,6 @@ def enviar_lembrete_whatsapp(numero_telefone: str, nome_cliente: str, data_venci
     return "Função de envio de WhatsApp acionada (Simulação)."
 
 
-@tool
 def obter_contato_especialista(intencao_usuario: str) -> str:
     """
     Retorna o contato do especialista baseado no assunto.
@@ -115,7 +97,6 @@ def obter_contato_especialista(intencao_usuario: str) -> str:
         return "Para Auto, Vida e outros, fale com a **Mara**: (11) 94516-2002."
 
 
-@tool
 def solicitar_autorizacao_leidiane(numero_apolice: str, placa: str, cliente_afirmou_pagamento: bool) -> str:
     """
     ACIONAR QUANDO: Cliente afirma que pagou uma parcela antiga (>25 dias).
@@ -137,7 +118,6 @@ def solicitar_autorizacao_leidiane(numero_apolice: str, placa: str, cliente_afir
     )
 
 
-@tool
 def obter_codigo_de_barras_boleto(numero_apolice: str, mes_referencia: int = 0) -> str:
     """
     Obtém código de barras do boleto.
@@ -146,19 +126,32 @@ def obter_codigo_de_barras_boleto(numero_apolice: str, mes_referencia: int = 0)
         numero_apolice: O número da apólice encontrada.
         mes_referencia: (Opcional) Se o usuário pedir um mês específico (ex: 12 para Dezembro). Se não, use 0.
     """
+    return consultar_boleto(numero_apolice, mes_referencia)[1]
+
+
+def consultar_boleto(numero_apolice: str, mes_referencia: int = 0):
+    """
+    Núcleo de obter_codigo_de_barras_boleto. Retorna (situacao, texto, resposta_cliente):
+    situacao em 'ok', 'nao_encontrado', 'sem_pdf', 'pendencia_antiga', 'bloqueio', 'vencido' ou
+    'sem_codigo'; texto é o que a ferramenta devolve ao LLM (com instruções ao agente) e
+    resposta_cliente o que pode ir direto ao cliente (roteador).
+    """
     print(f"🛠️ TOOL: Gerar Boleto {numero_apolice} (Mês ref: {mes_referencia})")
 
     parcela = buscar_parcela_atual(numero_apolice, mes_referencia)
 
     if not parcela:
-        return f"Não encontrei boletos pendentes para a apólice {numero_apolice}."
+        texto = f"Não encontrei boletos pendentes para a apólice {numero_apolice}."
+        return "nao_encontrado", texto, texto
 
     caminho_pdf = parcela.get('caminho_pdf_boletos')
     data_vencimento_str = parcela.get('data_vencimento_atual') or parcela.get('data_vencimento')
     nome_seguradora = str(parcela.get('seguradora', '')).lower()
     placa = parcela.get('apolices', {}).get('placa', 'Não informada')
 
-    if not caminho_pdf: return "PDF do boleto não encontrado."
+    if not caminho_pdf and not parcela.get('linha_digitavel'):
+        return "sem_pdf", "PDF do boleto não encontrado.", \
+            "Não encontrei o carnê desta apólice no sistema. Fale com a **Leidiane**: (62) 9300-6461."
 
     hoje = date.today()
     if isinstance(data_vencimento_str, str):
@@ -180,30 +173,33 @@ def obter_codigo_de_barras_boleto(numero_apolice: str, mes_referencia: int = 0)
 
     # CENÁRIO 1: Agente descobre a pendência antiga pela primeira vez
     if dias_atraso > 25 and mes_referencia == 0:
-        return (
+        pergunta = f"Consta uma pendência antiga de {data_vencimento.strftime('%B')}. Ela já foi paga?"
+        return "pendencia_antiga", (
             f"⚠️ **ALERTA DE SISTEMA**\n"
             f"Consta parcela vencida em **{data_vencimento.strftime('%d/%m/%Y')}** ({dias_atraso} dias atrás).\n\n"
-            f"🛑 **INSTRUÇÃO:** Pergunte ao cliente: 'Consta uma pendência antiga de {data_vencimento.strftime('%B')}. Ela já foi paga?'"
-        )
+            f"🛑 **INSTRUÇÃO:** Pergunte ao cliente: '{pergunta}'"
+        ), pergunta
 
     # CENÁRIO 2: Agente tenta pegar o mês atual (mes_referencia > 0)
     # Isso significa que o cliente disse "SIM, JÁ PAGUEI".
     if dias_atraso > 25 and mes_referencia > 0:
-        return (
+        return "bloqueio", (
             f"⛔ **BLOQUEIO DE SEGURANÇA ATIVO**\n"
             f"O sistema detectou um atraso crítico de {dias_atraso} dias na parcela anterior.\n"
             f"Mesmo com a afirmação do cliente, **NÃO ENTREGUE O CÓDIGO DE BARRAS.**\n"
             f"Risco de apólice cancelada na Cia.\n\n"
             f"👉 **AÇÃO OBRIGATÓRIA:** Chame IMEDIATAMENTE a ferramenta `solicitar_autorizacao_leidiane`."
-        )
+        ), ("Por segurança, preciso validar sua apólice na Seguradora antes de liberar o boleto. "
+            "Fale com a **Leidiane**: (62) 9300-6461.")
 
     # Se passou da tolerância simples
     if dias_atraso > tolerancia:
         nome_exibicao = "Essor" if "essor" in nome_seguradora else "Kovr"
-        return (
+        texto = (
             f"⚠️ **Boleto Vencido há {dias_atraso} dias.**\n"
             f"A {nome_exibicao} só aceita até {tolerancia} dias. Fale com a LEIDIANE."
         )
+        return "vencido", texto, texto
 
     # =========================================================================
     # EXTRAÇÃO (Só libera se estiver tudo 100% em dia)
@@ -213,22 +209,26 @@ def obter_codigo_de_barras_boleto(numero_apolice: str, mes_referencia: int = 0)
     if dias_atraso > 0:
         aviso_cobertura = f"\n\n⚠️ **ATENÇÃO:** Você está SEM COBERTURA até a baixa bancária."
 
-    if extrair_codigo_de_barras:
+    data_fmt = data_vencimento.strftime('%d/%m/%Y')
+    # Código gravado na parcela quando o carnê foi anexado; o PDF só é lido se ainda não foi indexado
+    codigo = parcela.get('linha_digitavel')
+    if not codigo and extrair_codigo_de_barras and caminho_pdf:
         pdf_bytes = baixar_pdf_bytes(caminho_pdf)
         if pdf_bytes:
-            data_fmt = data_vencimento.strftime('%d/%m/%Y')
             codigo = extrair_codigo_de_barras(pdf_bytes, data_fmt)
-            if codigo:
-                return (
-                    f"Aqui está o boleto com vencimento em **{data_fmt}**:{aviso_cobertura}\n\n"
-                    f"```text\n{codigo}\n```\n\n"
-                    f"📋 _(Clique para copiar)_"
-                )
 
-    return f"Boleto válido, mas não li o código."
+    if codigo:
+        texto = (
+            f"Aqui está o boleto com vencimento em **{data_fmt}**:{aviso_cobertura}\n\n"
+            f"```text\n{codigo}\n```\n\n"
+            f"📋 _(Clique para copiar)_"
+        )
+        return "ok", texto, texto
+
+    return "sem_codigo", "Boleto válido, mas não li o código.", \
+        "Não consegui ler o código deste boleto. Fale com a **Leidiane**: (62) 9300-6461."
 
 
-@tool
 def marcar_parcela_como_paga(numero_apolice: str) -> str:
     """Registra a baixa de pagamento de uma parcela (Simulação)."""
     return "Esta função deve ser usada apenas com confirmação visual do comprovante."
@@ -238,7 +238,7 @@ def marcar_parcela_como_paga(numero_apolice: str) -> str:
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
-tools = [
+FERRAMENTAS = [
     buscar_clientes_com_vencimento_hoje,
     enviar_lembrete_whatsapp,
     obter_codigo_de_barras_boleto,
@@ -248,23 +248,14 @@ tools = [
     solicitar_autorizacao_leidiane  # <--- NOVA FERRAMENTA DE VALIDAÇÃO
 ]
 
-llm_with_tools = None
-if OPENAI_API_KEY:
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=OPENAI_API_KEY)
-    llm_with_tools = llm.bind_tools(tools)
-else:
-    print("⚠️ ALERTA: OPENAI_API_KEY não encontrada.")
-
 
 # --- PROMPT DO SISTEMA (PERSONALIDADE SEGURA) ---
 
-class AgentState(TypedDict):
-    messages: Annotated[list, add_messages]
-
-
-hoje_str = date.today().strftime("%d/%m/%Y")
+def montar_system_prompt() -> str:
+    # Calculado a cada chamada: o processo do Streamlit fica de pé por vários dias
+    hoje_str = date.today().strftime("%d/%m/%Y")
 
-system_prompt = f"""Você é o Agente da MOREIRASEG. Hoje é {hoje_str}.
+    return f"""Você é o Agente da MOREIRASEG. Hoje é {hoje_str}.
 
 ### 🛑 PROTOCOLO DE SEGURANÇA - LEIA COM ATENÇÃO:
 
@@ -288,45 +279,471 @@ system_prompt = f"""Você é o Agente da MOREIRASEG. Hoje é {hoje_str}.
 """
 
 
-# --- CONSTRUÇÃO DO GRAFO ---
+# --- CONSTRUÇÃO DO GRAFO (SOB DEMANDA) ---
 
-def chatbot_node(state: AgentState):
-    return {"messages": [llm_with_tools.invoke([SystemMessage(content=system_prompt)] + state["messages"])]}
+_agente = None
+_agente_lock = threading.Lock()
+_checkpointer = None
 
+# --- MEMÓRIA POR CONVERSA ---
+# Cada conversa (sessão do Streamlit, execução diária da cobrança) tem o seu
+# thread_id; o histórico fica em SQLite para sobreviver a reinícios e é apagado depois de ocioso.
+AGENTE_CHECKPOINT_DB = os.environ.get("AGENTE_CHECKPOINT_DB",
+                                      os.path.join(tempfile.gettempdir(), "moreiraseg_agente.sqlite3"))
+AGENTE_THREAD_TTL_SEGUNDOS = int(os.environ.get("AGENTE_THREAD_TTL_HORAS", 24)) * 3600
+# Frequência máxima da varredura de conversas ociosas
+AGENTE_LIMPEZA_INTERVALO_SEGUNDOS = 300
 
-tool_node = ToolNode(tools)
+_ultima_limpeza = 0.0
+_limpeza_lock = threading.Lock()
 
-workflow = StateGraph(AgentState)
-workflow.add_node("agent", chatbot_node)
-workflow.add_node("tools", tool_node)
-workflow.set_entry_point("agent")
 
+def thread_id_cobranca(dia: date = None) -> str:
+    """Uma conversa por dia para o fluxo de cobrança (agendador das 09:00 e botões manuais)."""
+    return f"cobranca-{(dia or date.today()).isoformat()}"
 
-def should_continue(state: AgentState):
-    last_message = state["messages"][-1]
-    if last_message.tool_calls:
-        return "tools"
-    return END
 
+def _conectar_registro() -> sqlite3.Connection:
+    conn = sqlite3.connect(AGENTE_CHECKPOINT_DB, timeout=5, check_same_thread=False)
+    conn.execute("CREATE TABLE IF NOT EXISTS agente_threads (thread_id TEXT PRIMARY KEY, ultimo_uso REAL NOT NULL)")
+    return conn
+
+
+def _criar_checkpointer():
+    """SqliteSaver (pacote langgraph-checkpoint-sqlite) se instalado; senão MemorySaver."""
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        return SqliteSaver(_conectar_registro())
+    except ImportError:
+        from langgraph.checkpoint.memory import MemorySaver
+        print("Aviso: langgraph-checkpoint-sqlite não instalado; histórico do agente só em memória.")
+        return MemorySaver()
+
+
+def _apagar_thread(thread_id: str):
+    if hasattr(_checkpointer, "delete_thread"):
+        _checkpointer.delete_thread(thread_id)
+    elif hasattr(_checkpointer, "storage"):
+        # MemorySaver de versões antigas
+        _checkpointer.storage.pop(thread_id, None)
+    elif hasattr(_checkpointer, "conn"):
+        with _checkpointer.conn:
+            _checkpointer.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            _checkpointer.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+
+def _registrar_uso_e_limpar(thread_id: str):
+    """Marca o uso da conversa e, no máximo a cada poucos minutos, apaga as que passaram do TTL."""
+    global _ultima_limpeza
+    agora = time.time()
+    try:
+        with _limpeza_lock, closing(_conectar_registro()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO agente_threads (thread_id, ultimo_uso) VALUES (?, ?)",
+                         (thread_id, agora))
+            if agora - _ultima_limpeza < AGENTE_LIMPEZA_INTERVALO_SEGUNDOS:
+                return
+            _ultima_limpeza = agora
+            ociosas = [linha[0] for linha in conn.execute(
+                "SELECT thread_id FROM agente_threads WHERE ultimo_uso < ?", (agora - AGENTE_THREAD_TTL_SEGUNDOS,))]
+            for ociosa in ociosas:
+                _apagar_thread(ociosa)
+                conn.execute("DELETE FROM agente_threads WHERE thread_id = ?", (ociosa,))
+    except sqlite3.Error as e:
+        print(f"Aviso: registro de conversas do agente indisponível: {e}")
+
+
+# --- CONTEXTO ENVIADO AO MODELO ---
+# Conversas longas não podem crescer sem limite: antes de cada chamada ao LLM o grafo passa
+# pelo nó "contexto", que mantém os últimos turnos inteiros, resume resultados antigos de
+# ferramentas e remove os turnos mais velhos até o total caber no orçamento de tokens.
+AGENTE_TURNOS_INTEGRAIS = int(os.environ.get("AGENTE_TURNOS_INTEGRAIS", 4))
+AGENTE_ORCAMENTO_TOKENS = int(os.environ.get("AGENTE_ORCAMENTO_TOKENS", 6000))
+# Tamanho do resumo de um resultado de ferramenta fora dos turnos integrais
+RESUMO_FERRAMENTA_MAX_CARACTERES = 200
+MARCADOR_RESUMO = "[resumo] "
+
+_codificador = None
+
+
+def contar_tokens(texto: str) -> int:
+    """Tokens pelo tiktoken (local) se instalado; senão a aproximação de 4 caracteres por token."""
+    global _codificador
+    if _codificador is None:
+        try:
+            import tiktoken
+            try:
+                _codificador = tiktoken.encoding_for_model("gpt-4o-mini")
+            except KeyError:
+                _codificador = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _codificador = False
+    if _codificador:
+        return len(_codificador.encode(texto, disallowed_special=()))
+    return len(texto) // 4 + 1
+
+
+def _tokens_da_mensagem(mensagem) -> int:
+    conteudo = mensagem.content if isinstance(mensagem.content, str) else str(mensagem.content)
+    # ~4 tokens de estrutura por mensagem (papel, separadores), mais os argumentos das chamadas de ferramenta
+    chamadas = getattr(mensagem, "tool_calls", None) or []
+    extras = sum(contar_tokens(str(chamada.get("args", ""))) + 4 for chamada in chamadas)
+    return contar_tokens(conteudo) + 4 + extras
+
+
+def _separar_turnos(mensagens: list) -> list:
+    """Agrupa as mensagens em turnos: cada HumanMessage abre um turno com as respostas e ferramentas que seguem."""
+    turnos = []
+    for mensagem in mensagens:
+        if mensagem.type == "human" or not turnos:
+            turnos.append([])
+        turnos[-1].append(mensagem)
+    return turnos
+
+
+def _resumir_resultado(conteudo) -> str:
+    texto = " ".join(str(conteudo).split())
+    if len(texto) > RESUMO_FERRAMENTA_MAX_CARACTERES:
+        texto = texto[:RESUMO_FERRAMENTA_MAX_CARACTERES].rstrip() + "…"
+    return MARCADOR_RESUMO + texto
+
+
+def ajustar_contexto(mensagens: list, tokens_fixos: int = 0):
+    """
+    Decide o que muda no histórico antes da chamada ao modelo.
+    Retorna (resumos, remover): resultados de ferramenta antigos reescritos em forma curta
+    (mesmo id, substituem o original) e os ids dos turnos antigos que não cabem no orçamento.
+    Turnos saem inteiros, para nunca separar uma chamada de ferramenta do seu resultado.
+    """
+    turnos = _separar_turnos(mensagens)
+    antigos = turnos[:-AGENTE_TURNOS_INTEGRAIS] if AGENTE_TURNOS_INTEGRAIS > 0 else turnos[:-1]
+
+    resumos = {}
+    for turno in antigos:
+        for mensagem in turno:
+            if (mensagem.type == "tool" and isinstance(mensagem.content, str)
+                    and not mensagem.content.startswith(MARCADOR_RESUMO)
+                    and len(mensagem.content) > RESUMO_FERRAMENTA_MAX_CARACTERES):
+                resumos[mensagem.id] = mensagem.model_copy(update={"content": _resumir_resultado(mensagem.content)})
+
+    custos = [sum(_tokens_da_mensagem(resumos.get(m.id, m)) for m in turno) for turno in turnos]
+    total = tokens_fixos + sum(custos)
+    remover = []
+    # O turno atual nunca sai, mesmo que sozinho passe do orçamento
+    for turno, custo in zip(turnos[:-1], custos[:-1]):
+        if total <= AGENTE_ORCAMENTO_TOKENS:
+            break
+        remover.extend(m.id for m in turno)
+        total -= custo
+
+    resumos = {id_: m for id_, m in resumos.items() if id_ not in remover}
+    return list(resumos.values()), remover
+
+
+def _construir_agente():
+    from langchain_openai import ChatOpenAI
+    from langchain_core.messages import SystemMessage, RemoveMessage
+    from langchain_core.tools import tool
 
-workflow.add_conditional_edges("agent", should_continue, ["tools", END])
-workflow.add_edge("tools", "agent")
+    from langgraph.graph import StateGraph, END
+    from langgraph.prebuilt import ToolNode
+    from langgraph.graph.message import add_messages
 
-memory = MemorySaver()
-app = workflow.compile(checkpointer=memory)
+    class AgentState(TypedDict):
+        messages: Annotated[list, add_messages]
 
-print("✓ LangGraph Configurado: Fluxo de Validação Humana (Leidiane) Ativo.")
+    tools = [tool(funcao) for funcao in FERRAMENTAS]
+    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=OPENAI_API_KEY)
+    llm_with_tools = llm.bind_tools(tools)
+
+    def contexto_node(state: AgentState):
+        tokens_prompt = contar_tokens(montar_system_prompt())
+        resumos, remover = ajustar_contexto(state["messages"], tokens_prompt)
+        return {"messages": resumos + [RemoveMessage(id=id_) for id_ in remover]}
+
+    def chatbot_node(state: AgentState):
+        return {"messages": [llm_with_tools.invoke([SystemMessage(content=montar_system_prompt())] + state["messages"])]}
+
+    def should_continue(state: AgentState):
+        last_message = state["messages"][-1]
+        if last_message.tool_calls:
+            return "tools"
+        return END
+
+    workflow = StateGraph(AgentState)
+    workflow.add_node("contexto", contexto_node)
+    workflow.add_node("agent", chatbot_node)
+    workflow.add_node("tools", ToolNode(tools))
+    workflow.set_entry_point("contexto")
+    workflow.add_edge("contexto", "agent")
+    workflow.add_conditional_edges("agent", should_continue, ["tools", END])
+    # Resultados de ferramenta podem ser grandes: o orçamento é conferido de novo antes do modelo
+    workflow.add_edge("tools", "contexto")
+
+    global _checkpointer
+    _checkpointer = _criar_checkpointer()
+    return workflow.compile(checkpointer=_checkpointer)
+
+
+def obter_agente():
+    """
+    Grafo compilado do agente, montado na primeira chamada e reaproveitado depois.
+    Levanta RuntimeError sem OPENAI_API_KEY e ImportError se faltar LangChain/LangGraph.
+    """
+    global _agente
+    if _agente is not None:
+        return _agente
+    with _agente_lock:
+        if _agente is None:
+            if not OPENAI_API_KEY:
+                raise RuntimeError("OPENAI_API_KEY não encontrada.")
+            _agente = _construir_agente()
+    return _agente
+
+
+# --- ROTEADOR DETERMINÍSTICO (ANTES DO GRAFO) ---
+# Pedidos diretos ("boleto da apólice 1002800150679", uma placa solta, um CPF) são atendidos
+# chamando as ferramentas e respondendo por modelo de texto, sem nenhuma ida ao LLM.
+# A decisão é tomada só pelo texto, antes de qualquer consulta: o que o roteador aceita ele
+# responde sempre (inclusive a pergunta da pendência antiga, que o LLM continua no turno
+# seguinte com o histórico); o resto segue para o LangGraph sem nada consultado.
+
+PADRAO_APOLICE = re.compile(r'\b\d{10,20}\b')
+PADRAO_CPF = re.compile(r'\b\d{3}\.\d{3}\.\d{3}-\d{2}\b|\b\d{11}\b')
+# Mercosul (ABC1D23) e modelo antigo (ABC-1234)
+PADRAO_PLACA = re.compile(r'\b[A-Z]{3}-?\d[A-Z0-9]\d{2}\b', re.IGNORECASE)
+PADRAO_INTENCAO_BOLETO = re.compile(
+    r'\bboleto\b|c[óo]digo\s+de\s+barras|linha\s+digit[áa]vel|\b(?:segunda|2[ªa]?)\s+via\b', re.IGNORECASE)
+# Palavras que podem acompanhar o pedido sem mudar o sentido; qualquer outra manda para o LLM
+PALAVRAS_NEUTRAS = {
+    "oi", "ola", "olá", "bom", "boa", "dia", "tarde", "noite", "por", "favor", "pf", "pfv", "obrigado", "obrigada",
+    "o", "a", "os", "as", "um", "uma", "da", "do", "de", "dos", "das", "meu", "minha", "me", "para", "pra", "com",
+    "apolice", "apólice", "placa", "cpf", "numero", "número", "nº", "n", "carro", "veiculo", "veículo",
+    "boleto", "codigo", "código", "barras", "linha", "digitavel", "digitável", "segunda", "via", "2", "2ª", "2a",
+    "quero", "queria", "preciso", "manda", "mande", "envia", "envie", "passa", "passe", "gerar", "gera", "qual", "é",
+    "consulta", "consultar", "buscar", "busca", "ver", "dados",
+}
+
+_estatisticas_roteador = {"mensagens": 0, "roteadas": 0, "tempo_roteadas_s": 0.0, "tempo_llm_s": 0.0}
+_estatisticas_lock = threading.Lock()
+
+
+def _cpf_valido(digitos: str) -> bool:
+    if len(digitos) != 11 or len(set(digitos)) == 1:
+        return False
+    for tamanho in (9, 10):
+        soma = sum(int(d) * (tamanho + 1 - i) for i, d in enumerate(digitos[:tamanho]))
+        if (soma * 10 % 11) % 10 != int(digitos[tamanho]):
+            return False
+    return True
+
+
+def _reconhecer(comando: str):
+    """
+    ('apolice'|'placa'|'cpf', valor, pede_boleto) para mensagens curtas com uma única entidade
+    e nada além de palavras neutras; None para o resto.
+    """
+    entidades = []
+    for match in PADRAO_CPF.finditer(comando):
+        digitos = re.sub(r'\D', '', match.group())
+        # 11 dígitos soltos só contam como CPF se o dígito verificador bater; senão podem ser apólice
+        if _cpf_valido(digitos):
+            entidades.append(("cpf", match.group(), match.span()))
+    for match in PADRAO_APOLICE.finditer(comando):
+        if not any(tipo == "cpf" and ini <= match.start() < fim for tipo, _, (ini, fim) in entidades):
+            entidades.append(("apolice", match.group(), match.span()))
+    for match in PADRAO_PLACA.finditer(comando):
+        entidades.append(("placa", re.sub(r'-', '', match.group()).upper(), match.span()))
+    if len(entidades) != 1:
+        return None
+
+    tipo, valor, (inicio, fim) = entidades[0]
+    resto = (comando[:inicio] + " " + comando[fim:]).lower()
+    palavras = re.findall(r'[\wªº]+', resto)
+    if any(p not in PALAVRAS_NEUTRAS for p in palavras):
+        return None
+    return tipo, valor, bool(PADRAO_INTENCAO_BOLETO.search(comando))
+
+
+def _formatar_apolices(resultados: list) -> str:
+    linhas = []
+    for apolice in resultados:
+        vigencia = apolice.get('data_inicio_vigencia') or "-"
+        if isinstance(vigencia, str) and len(vigencia) >= 10:
+            vigencia = date.fromisoformat(vigencia[:10]).strftime('%d/%m/%Y')
+        linhas.append(f"- Apólice **{apolice.get('numero_apolice')}** — {apolice.get('cliente')} | "
+                      f"placa {apolice.get('placa') or '-'} | {apolice.get('seguradora') or '-'} | "
+                      f"início {vigencia} | {apolice.get('status') or '-'}")
+    return "\n".join(linhas)
+
+
+def _responder_por_regras(comando: str):
+    """Resposta pronta para pedidos diretos, ou None (sem nenhuma consulta feita) para seguir ao LangGraph."""
+    reconhecido = _reconhecer(comando)
+    if not reconhecido:
+        return None
+    tipo, valor, pede_boleto = reconhecido
+
+    if tipo == "apolice" and pede_boleto:
+        return consultar_boleto(valor)[2]
+
+    resultados = buscar_apolice_inteligente(valor)
+    if not resultados:
+        return "Não encontrei nenhuma apólice com esse dado."
+    # Mesma regra dada ao modelo: vale a apólice com início de vigência mais recente
+    resultados = sorted(resultados, key=lambda a: str(a.get('data_inicio_vigencia') or ''), reverse=True)
+    if not pede_boleto:
+        titulo = "Encontrei esta apólice" if len(resultados) == 1 else "Encontrei estas apólices"
+        return f"{titulo}:\n\n{_formatar_apolices(resultados)}"
+
+    return consultar_boleto(str(resultados[0].get('numero_apolice')))[2]
+
+
+# Turnos respondidos pelo roteador ainda fora do histórico do grafo. Entram junto com a próxima
+# mensagem da conversa que for para o LLM: o caminho rápido não carrega LangChain nem toca o checkpoint.
+MAX_CONVERSAS_PENDENTES = 500
+_turnos_pendentes = OrderedDict()  # thread_id -> [(comando, resposta), ...]
+_pendentes_lock = threading.Lock()
+
+
+def _guardar_turno_roteado(thread_id: str, comando: str, resposta: str):
+    with _pendentes_lock:
+        turnos = _turnos_pendentes.pop(thread_id, [])
+        turnos.append((comando, resposta))
+        # Além dos turnos integrais o nó "contexto" descartaria mesmo
+        _turnos_pendentes[thread_id] = turnos[-max(AGENTE_TURNOS_INTEGRAIS, 1):]
+        while len(_turnos_pendentes) > MAX_CONVERSAS_PENDENTES:
+            _turnos_pendentes.popitem(last=False)
+
+
+def _mensagens_de_entrada(thread_id: str, comando: str) -> list:
+    """Turnos roteados pendentes desta conversa (pares pergunta/resposta) seguidos do comando atual."""
+    from langchain_core.messages import HumanMessage, AIMessage
+
+    with _pendentes_lock:
+        turnos = _turnos_pendentes.pop(thread_id, [])
+    mensagens = []
+    for pergunta, resposta in turnos:
+        mensagens += [HumanMessage(content=pergunta), AIMessage(content=resposta)]
+    return mensagens + [HumanMessage(content=comando)]
+
+
+def rotear(comando: str, thread_id: str = None):
+    """Tenta responder sem o LLM. Retorna a resposta, ou None se o pedido precisa do LangGraph."""
+    inicio = time.perf_counter()
+    try:
+        resposta = _responder_por_regras(comando)
+    except Exception as e:
+        print(f"Aviso: roteador falhou, seguindo para o agente: {e}")
+        resposta = None
+    if resposta is not None:
+        with _estatisticas_lock:
+            _estatisticas_roteador["mensagens"] += 1
+            _estatisticas_roteador["roteadas"] += 1
+            _estatisticas_roteador["tempo_roteadas_s"] += time.perf_counter() - inicio
+        if thread_id:
+            _guardar_turno_roteado(thread_id, comando, resposta)
+    return resposta
+
+
+def _registrar_tempo_llm(inicio: float):
+    with _estatisticas_lock:
+        _estatisticas_roteador["mensagens"] += 1
+        _estatisticas_roteador["tempo_llm_s"] += time.perf_counter() - inicio
+
+
+def estatisticas_roteador() -> Dict[str, Any]:
+    """Taxa de acerto do roteador e latência média de cada caminho (roteador x LangGraph), em ms."""
+    with _estatisticas_lock:
+        e = dict(_estatisticas_roteador)
+    via_llm = e["mensagens"] - e["roteadas"]
+    return {
+        "mensagens": e["mensagens"],
+        "roteadas": e["roteadas"],
+        "taxa_roteador": round(e["roteadas"] / e["mensagens"], 3) if e["mensagens"] else 0.0,
+        "latencia_media_roteador_ms": round(1000 * e["tempo_roteadas_s"] / e["roteadas"], 1) if e["roteadas"] else None,
+        "latencia_media_llm_ms": round(1000 * e["tempo_llm_s"] / via_llm, 1) if via_llm else None,
+    }
 
 
 # --- 3. INTERFACE ---
 
-def executar_agente(comando: str) -> str:
-    if not llm_with_tools: return "Erro: Agente sem API Key."
-    config = {"configurable": {"thread_id": "sessao_segura_v3"}}
+def executar_agente(comando: str, thread_id: str = None) -> str:
+    """
+    Envia 'comando' para a conversa 'thread_id' e devolve a resposta final.
+    Sem thread_id, a chamada é avulsa (não herda nem deixa histórico para outras).
+    """
+    resposta = rotear(comando, thread_id)
+    if resposta is not None:
+        return resposta
+
+    if not OPENAI_API_KEY: return "Erro: Agente sem API Key."
+    thread_id = thread_id or f"avulso-{uuid.uuid4().hex}"
+    config = {"configurable": {"thread_id": thread_id}}
 
+    inicio = time.perf_counter()
     try:
-        input_message = HumanMessage(content=comando)
-        output = app.invoke({"messages": [input_message]}, config=config)
+        agente = obter_agente()
+        _registrar_uso_e_limpar(thread_id)
+        output = agente.invoke({"messages": _mensagens_de_entrada(thread_id, comando)}, config=config)
         return output["messages"][-1].content
     except Exception as e:
-        return f"Erro técnico: {str(e)}"
\ No newline at end of file
+        return f"Erro técnico: {str(e)}"
+    finally:
+        _registrar_tempo_llm(inicio)
+
+
+# Texto mostrado na interface enquanto cada ferramenta roda
+ROTULOS_FERRAMENTAS = {
+    "descobrir_numero_apolice": "consultando apólice…",
+    "obter_codigo_de_barras_boleto": "buscando o código de barras do boleto…",
+    "buscar_clientes_com_vencimento_hoje": "verificando vencimentos de hoje…",
+    "enviar_lembrete_whatsapp": "enviando lembrete pelo WhatsApp…",
+    "marcar_parcela_como_paga": "registrando pagamento…",
+    "obter_contato_especialista": "localizando o especialista…",
+    "solicitar_autorizacao_leidiane": "pedindo autorização à Leidiane…",
+}
+
+
+def transmitir_agente(comando: str, thread_id: str = None):
+    """
+    Como executar_agente, mas gerando eventos à medida que o grafo avança:
+      ("token", trecho)       pedaço da resposta do modelo, assim que chega;
+      ("ferramenta", rotulo)  uma ferramenta começou a rodar (ex.: "consultando apólice…");
+      ("fim", resposta)       resposta final completa (último evento);
+      ("erro", mensagem)      falha; nenhum outro evento vem depois.
+    """
+    resposta = rotear(comando, thread_id)
+    if resposta is not None:
+        yield ("token", resposta)
+        yield ("fim", resposta)
+        return
+
+    if not OPENAI_API_KEY:
+        yield ("erro", "Erro: Agente sem API Key.")
+        return
+    thread_id = thread_id or f"avulso-{uuid.uuid4().hex}"
+    config = {"configurable": {"thread_id": thread_id}}
+
+    inicio = time.perf_counter()
+    try:
+        agente = obter_agente()
+        _registrar_uso_e_limpar(thread_id)
+        resposta = ""
+        for modo, dados in agente.stream({"messages": _mensagens_de_entrada(thread_id, comando)}, config=config,
+                                         stream_mode=["messages", "updates"]):
+            if modo == "messages":
+                trecho, metadados = dados
+                if metadados.get("langgraph_node") == "agent" and isinstance(trecho.content, str) and trecho.content:
+                    resposta += trecho.content
+                    yield ("token", trecho.content)
+            elif modo == "updates":
+                for mensagem in ((dados or {}).get("agent") or {}).get("messages", []):
+                    for chamada in getattr(mensagem, "tool_calls", None) or []:
+                        # O texto antes de uma chamada de ferramenta não é a resposta final
+                        resposta = ""
+                        yield ("ferramenta", ROTULOS_FERRAMENTAS.get(chamada["name"], f"executando {chamada['name']}…"))
+        yield ("fim", resposta)
+    except Exception as e:
+        yield ("erro", f"Erro técnico: {str(e)}")
+    finally:
+        _registrar_tempo_llm(inicio)
@@ -1,65 +1,262 @@
 # api.py - Versão Robusta com Logging Melhorado
-from fastapi import FastAPI, HTTPException
-import psycopg2
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from psycopg2.extras import DictCursor
-import os
+from contextlib import asynccontextmanager, contextmanager
+import base64
+import datetime
+import decimal
+import json
 import logging
+import threading
+
+from utils.db_pool import PoolConexoes, PoolEsgotadoError
 
 # Configuração do logging para vermos mensagens detalhadas no Cloud Run
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Moreiraseg API")
+# Pool de conexões criado no startup e fechado no shutdown (ver lifespan)
+db_pool: PoolConexoes = None
+_db_pool_lock = threading.Lock()
+
+
+def _obter_pool() -> PoolConexoes:
+    """Retorna o pool, criando-o se o startup não conseguiu (ex.: banco fora do ar no boot)."""
+    global db_pool
+    if db_pool is not None:
+        return db_pool
+    with _db_pool_lock:
+        if db_pool is None:
+            try:
+                # Lê as credenciais EXCLUSIVAMENTE das variáveis de ambiente configuradas no Cloud Run
+                db_pool = PoolConexoes.a_partir_do_ambiente()
+                logger.info(f"Pool de conexões criado (min={db_pool.minconn}, max={db_pool.maxconn}).")
+            except KeyError as e:
+                logger.error(f"Variável de ambiente não encontrada: {e}")
+                raise HTTPException(status_code=500,
+                                    detail=f"Configuração do servidor incompleta: falta a variável {e}.")
+            except Exception as e:
+                logger.error(f"Erro ao conectar ao banco de dados: {e}")
+                raise HTTPException(status_code=500, detail="Não foi possível conectar ao banco de dados.")
+    return db_pool
 
-def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados PostgreSQL."""
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     try:
-        # Lê as credenciais EXCLUSIVAMENTE das variáveis de ambiente configuradas no Cloud Run
-        conn = psycopg2.connect(
-            host=os.environ["DB_HOST"],
-            dbname=os.environ["DB_NAME"],
-            user=os.environ["DB_USER"],
-            password=os.environ["DB_PASS"],
-            port=os.environ.get("DB_PORT", 5432)
-        )
-        logger.info("Conexão com o banco de dados estabelecida com sucesso.")
-        return conn
-    except KeyError as e:
-        logger.error(f"Variável de ambiente não encontrada: {e}")
-        raise HTTPException(status_code=500, detail=f"Configuração do servidor incompleta: falta a variável {e}.")
-    except Exception as e:
-        logger.error(f"Erro ao conectar ao banco de dados: {e}")
-        raise HTTPException(status_code=500, detail="Não foi possível conectar ao banco de dados.")
+        _obter_pool()
+    except HTTPException:
+        # Sobe mesmo assim; o pool será criado na primeira requisição
+        logger.warning("Pool de conexões não criado no startup; nova tentativa na primeira requisição.")
+    yield
+    if db_pool is not None:
+        db_pool.fechar()
+        logger.info("Pool de conexões encerrado.")
+
+
+app = FastAPI(title="Moreiraseg API", lifespan=lifespan)
+
+
+@contextmanager
+def _traduzir_pool_esgotado(pool: PoolConexoes):
+    """Único ponto que converte o pool esgotado em HTTP 503."""
+    try:
+        yield
+    except PoolEsgotadoError as e:
+        logger.error(f"Pool de conexões esgotado: {e} {pool.estatisticas()}")
+        raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente em instantes.")
+
+
+def _checkout_conexao():
+    """Retira uma conexão do pool; quem chama fica responsável por devolvê-la (db_pool.devolver)."""
+    pool = _obter_pool()
+    with _traduzir_pool_esgotado(pool):
+        return pool.obter()
+
+
+@contextmanager
+def conexao_db():
+    """Empresta uma conexão do pool para o endpoint (PoolConexoes.conexao: commit, rollback e devolução)."""
+    pool = _obter_pool()
+    with _traduzir_pool_esgotado(pool), pool.conexao() as conn:
+        yield conn
+
 
 @app.get("/")
 def read_root():
     """Endpoint raiz para verificar se a API está online."""
     return {"status": "Moreiraseg API está online!"}
 
+
+@app.get("/metrics/pool")
+def get_metricas_pool():
+    """Uso do pool de conexões (em uso, pico, tempo de espera) para dimensionar DB_POOL_MIN/MAX."""
+    if db_pool is None:
+        return {"status": "pool não inicializado"}
+    return db_pool.estatisticas()
+
+
+COLUNAS_APOLICES = """
+    id, numero_apolice, cliente, seguradora, status,
+    data_final_de_vigencia, placa, valor_da_parcela
+"""
+# Ordem estável para a paginação por chave: (data_final_de_vigencia, id), nulos no fim
+ORDEM_APOLICES = "data_final_de_vigencia DESC NULLS LAST, id DESC"
+# Tamanho de página quando só 'after' é informado; sem 'limit' nem 'after' vem a base inteira
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+# Linhas trazidas do servidor por ida ao banco no modo streaming
+STREAM_ITERSIZE = 1000
+
+
+def _serializar_valor(valor):
+    """Converte tipos do psycopg2 que o json padrão não entende."""
+    if isinstance(valor, (datetime.date, datetime.datetime)):
+        return valor.isoformat()
+    if isinstance(valor, decimal.Decimal):
+        return float(valor)
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _codificar_cursor(row):
+    """Gera o cursor opaco 'after' a partir da última linha da página."""
+    data_final = row["data_final_de_vigencia"]
+    payload = [data_final.isoformat() if data_final else None, row["id"]]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def _decodificar_cursor(cursor):
+    try:
+        preenchido = cursor + "=" * (-len(cursor) % 4)
+        data_final, ultimo_id = json.loads(base64.urlsafe_b64decode(preenchido.encode()))
+        if data_final is not None:
+            data_final = datetime.date.fromisoformat(data_final)
+        return data_final, int(ultimo_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Parâmetro 'after' inválido.")
+
+
+def _filtro_keyset(after):
+    """Cláusula WHERE que continua a ordenação ORDEM_APOLICES logo após o cursor."""
+    if not after:
+        return "", []
+    data_final, ultimo_id = _decodificar_cursor(after)
+    if data_final is None:
+        # Já estamos no bloco de datas nulas (que vem por último)
+        return "WHERE data_final_de_vigencia IS NULL AND id < %s", [ultimo_id]
+    return (
+        "WHERE data_final_de_vigencia < %s"
+        " OR (data_final_de_vigencia = %s AND id < %s)"
+        " OR data_final_de_vigencia IS NULL",
+        [data_final, data_final, ultimo_id],
+    )
+
+
+class _PosseConexaoStream:
+    """
+    Decide quem devolve a conexão do streaming: o gerador, se chegou a começar, ou a
+    BackgroundTask da resposta, se o cliente desconectou antes do corpo (o gerador nunca roda).
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._dono = None
+
+    def assumir_pelo_stream(self) -> bool:
+        with self._lock:
+            if self._dono is None:
+                self._dono = "stream"
+            return self._dono == "stream"
+
+    def liberar_se_nao_iniciado(self):
+        with self._lock:
+            if self._dono is not None:
+                return
+            self._dono = "background"
+        db_pool.devolver(self._conn)
+
+
+def _stream_apolices_ndjson(conn, posse):
+    """Gera todas as apólices como NDJSON usando um cursor nomeado (lado servidor)."""
+    if not posse.assumir_pelo_stream():
+        return
+    try:
+        with conn.cursor(name="apolices_stream", cursor_factory=DictCursor) as cur:
+            cur.itersize = STREAM_ITERSIZE
+            cur.execute(f"SELECT {COLUNAS_APOLICES} FROM apolices ORDER BY {ORDEM_APOLICES};")
+            total = 0
+            for row in cur:
+                total += 1
+                yield json.dumps(dict(row), default=_serializar_valor, ensure_ascii=False) + "\n"
+            logger.info(f"Streaming de /apolices/ concluído: {total} apólices enviadas.")
+    except Exception as e:
+        # O status 200 já foi enviado; só resta registrar e encerrar o stream
+        logger.error(f"Erro durante o streaming de apólices: {e}", exc_info=True)
+    finally:
+        db_pool.devolver(conn)
+
+
 @app.get("/apolices/")
-def get_todas_as_apolices():
+def get_todas_as_apolices(
+        response: Response,
+        limit: int = Query(None, ge=1, le=LIMITE_MAXIMO),
+        after: str = Query(None, description="Cursor devolvido no cabeçalho X-Next-Cursor da página anterior."),
+        formato: str = Query("json", pattern="^(json|ndjson)$"),
+):
     """
-    Busca e retorna todas as apólices do banco de dados.
+    Busca as apólices do banco de dados, com paginação opcional por chave em (data_final_de_vigencia, id).
+
+    - formato=json sem 'limit' nem 'after': devolve todas as apólices, como sempre foi.
+    - formato=json com 'limit' e/ou 'after': devolve até 'limit' apólices (LIMITE_PADRAO se
+      omitido); se houver mais, o cabeçalho X-Next-Cursor traz o valor a passar em 'after'
+      para a próxima página.
+    - formato=ndjson: devolve a base inteira, uma apólice por linha, em streaming
+      (ignora 'limit' e 'after').
     """
-    logger.info("Recebido pedido para /apolices/")
+    logger.info(f"Recebido pedido para /apolices/ (formato={formato}, limit={limit}, after={after})")
+
+    if formato == "ndjson":
+        # A conexão sai do pool antes do stream para que uma falha ainda vire HTTP 500/503;
+        # o gerador a devolve ao terminar, ou a BackgroundTask, se o corpo nunca começar.
+        conn = _checkout_conexao()
+        posse = _PosseConexaoStream(conn)
+        return StreamingResponse(_stream_apolices_ndjson(conn, posse), media_type="application/x-ndjson",
+                                 background=BackgroundTask(posse.liberar_se_nao_iniciado))
+
+    paginado = limit is not None or bool(after)
+    limit = limit or LIMITE_PADRAO
+    where, params = _filtro_keyset(after)
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            # Query atualizada para buscar todas as colunas que o Streamlit precisa
-            cur.execute("""
-                SELECT 
-                    id, numero_apolice, cliente, seguradora, status, 
-                    data_final_de_vigencia, placa, valor_da_parcela 
-                FROM apolices 
-                ORDER BY data_final_de_vigencia DESC;
-            """)
+        with conexao_db() as conn, conn.cursor(cursor_factory=DictCursor) as cur:
+            if not paginado:
+                cur.execute(f"SELECT {COLUNAS_APOLICES} FROM apolices ORDER BY {ORDEM_APOLICES};")
+                apolices = cur.fetchall()
+                logger.info(f"Sem paginação: {len(apolices)} apólices.")
+                return [dict(row) for row in apolices]
+
+            # Busca uma linha a mais só para saber se existe próxima página
+            cur.execute(
+                f"SELECT {COLUNAS_APOLICES} FROM apolices {where} ORDER BY {ORDEM_APOLICES} LIMIT %s;",
+                params + [limit + 1],
+            )
             apolices = cur.fetchall()
-            logger.info(f"Encontradas {len(apolices)} apólices no banco de dados.")
-        conn.close()
-        
+
+        tem_proxima = len(apolices) > limit
+        apolices = apolices[:limit]
+        logger.info(f"Página com {len(apolices)} apólices (há próxima: {tem_proxima}).")
+        if tem_proxima:
+            proximo_cursor = _codificar_cursor(apolices[-1])
+            response.headers["X-Next-Cursor"] = proximo_cursor
+            response.headers["Link"] = f'</apolices/?limit={limit}&after={proximo_cursor}>; rel="next"'
+
         # Converte os resultados para uma lista de dicionários
         return [dict(row) for row in apolices]
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Este log irá mostrar o erro exato do banco de dados nos registos do Cloud Run
         logger.error(f"Erro ao executar a query de apólices: {e}", exc_info=True)
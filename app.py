@@ -13,11 +13,15 @@ import datetime
 from datetime import date, timedelta, timezone
 import os
 import re
-import calendar
-from dateutil.relativedelta import relativedelta
 import ast
+import uuid
 from supabase import create_client, Client
 from utils.supabase_client import get_apolices
+from utils.calendario_parcelas import gerar_cronograma
+from utils.storage import enviar_bytes, enviar_em_paralelo
+from utils.imagens import preprocessar_imagens
+from utils.cache_pdf import estatisticas_cache_pdf
+from utils.cache_extracao import estatisticas_cache_extracao
 import threading # <-- NOVO IMPORT PARA O AGENDADOR
 import time # <-- NOVO IMPORT PARA O AGENDADOR
 # Tenta importar a lógica de extração (IA) com proteção contra erros
@@ -38,10 +42,13 @@ import schedule  # Biblioteca para rodar o robô as 09:00
 
 # Tenta importar a lógica do Agente (O CÉREBRO QUE CRIAMOS)
 try:
-    from agent_logic import executar_agente
+    from agent_logic import executar_agente, transmitir_agente, thread_id_cobranca, estatisticas_roteador
 except ImportError:
     # Cria uma função falsa apenas para o app não quebrar se o arquivo sumir
-    def executar_agente(cmd): return f"Erro: agent_logic.py não encontrado."
+    def executar_agente(cmd, thread_id=None): return f"Erro: agent_logic.py não encontrado."
+    def transmitir_agente(cmd, thread_id=None): yield ("erro", "Erro: agent_logic.py não encontrado.")
+    def thread_id_cobranca(dia=None): return None
+    def estatisticas_roteador(): return None
 
 # Tenta importar as funções do banco de dados
 try:
@@ -49,8 +56,11 @@ try:
         supabase,
         get_apolices,
         buscar_todas_as_parcelas_pendentes,
+        buscar_resumo_dashboard,
         buscar_parcelas_vencendo_hoje,
-        atualizar_status_pagamento
+        atualizar_status_pagamento,
+        invalidar_snapshot_apolices,
+        gravar_boletos_do_carne
     )
 except ImportError as e:
     st.error(f"Erro crítico de importação: {e}")
@@ -102,51 +112,40 @@ ASSETS_DIR = "assets"
 
 # --- CONFIGURAÇÕES GLOBAIS ---
 ASSETS_DIR = "assets"
+# Limite de apólices exibidas por página na tela de pesquisa (cada uma é um expander com formulário)
+RESULTADOS_POR_PAGINA = 20
 LOGO_PATH = os.path.join(ASSETS_DIR, "logo_azul.png")
 ICONE_PATH = os.path.join(ASSETS_DIR, "Icone.png")
 
 
 # --- FUNÇÕES DE LÓGICA DO SISTEMA (Refatoradas para usar o cliente 'supabase') ---
 
+def _ficheiro_para_upload(ficheiro, chave=None):
+    """Lê o UploadedFile na thread do Streamlit e devolve o dict esperado por utils.storage."""
+    return {'chave': chave, 'nome': ficheiro.name, 'bytes': ficheiro.getvalue(), 'content_type': ficheiro.type}
+
+
 def salvar_ficheiros_supabase(ficheiro, numero_referencia, cliente, tipo_pasta):
     """Salva um único ficheiro no Supabase Storage."""
     try:
-        # --- VERSÃO CORRIGIDA ---
-        # Direciona cada tipo de arquivo para o seu respectivo bucket.
-        if tipo_pasta in ['apolices', 'boletos']:
-            bucket_name = "moreiraseg-apolices-pdfs-2025"
-        elif tipo_pasta == 'sinistros':
-            bucket_name = "sinistros"
-        else:
-            # Lógica segura para qualquer outro tipo de arquivo futuro
-            bucket_name = os.environ.get(f"BUCKET_{tipo_pasta.upper()}", tipo_pasta)
-        # --- FIM DA CORREÇÃO ---
-
-        safe_cliente = re.sub(r'[^a-zA-Z0-9\s-]', '', cliente).strip().replace(' ', '_')
-        file_bytes = ficheiro.getvalue()
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        # O caminho de destino agora usa o numero_referencia (pode ser apólice ou sinistro)
-        destination_path = f"{safe_cliente}/{numero_referencia}/{timestamp}_{ficheiro.name}"
-
-        supabase.storage.from_(bucket_name).upload(path=destination_path, file=file_bytes,
-                                                   file_options={"content-type": ficheiro.type})
-        public_url = supabase.storage.from_(bucket_name).get_public_url(destination_path)
-        return public_url
+        return enviar_bytes(ficheiro.getvalue(), ficheiro.name, ficheiro.type, numero_referencia, cliente, tipo_pasta)
     except Exception as e:
         st.error(f"❌ Falha no upload para o Supabase Storage: {e}")
         return None
 
 
-def salvar_multiplos_ficheiros_supabase(ficheiros, numero_sinistro, cliente, tipo_pasta):
-    """Salva múltiplos ficheiros no Supabase Storage e retorna uma lista de URLs."""
+def salvar_multiplos_ficheiros_supabase(ficheiros, numero_sinistro, cliente, tipo_pasta, ao_progredir=None):
+    """Salva múltiplos ficheiros no Supabase Storage (em paralelo) e retorna uma lista de URLs na ordem de entrada."""
     urls = []
     if not ficheiros:
         return urls
-    for ficheiro in ficheiros:
-        url = salvar_ficheiros_supabase(ficheiro, numero_sinistro, cliente, tipo_pasta)
-        if url:
-            urls.append(url)
+    resultados = enviar_em_paralelo([_ficheiro_para_upload(f) for f in ficheiros], numero_sinistro, cliente,
+                                    tipo_pasta, ao_progredir=ao_progredir)
+    for r in resultados:
+        if r['url']:
+            urls.append(r['url'])
+        else:
+            st.error(f"❌ Falha no upload de '{r['nome']}': {r['erro']}")
     return urls
 
 
@@ -174,17 +173,21 @@ def add_historico_sinistro(sinistro_id, usuario_email, status_anterior, status_n
         st.warning(f"⚠️ Não foi possível registrar a atualização do sinistro no histórico: {e}")
 
 
-def get_parcelas_da_apolice(apolice_id):
-    """Busca as parcelas de uma apólice específica e converte a data."""
+def get_parcelas_das_apolices(apolice_ids):
+    """Busca as parcelas de várias apólices numa única consulta e devolve {apolice_id: DataFrame}."""
+    if not apolice_ids:
+        return {}
     try:
-        response = supabase.table('parcelas').select("*").eq('apolice_id', apolice_id).order('numero_parcela').execute()
+        response = supabase.table('parcelas').select("*").in_('apolice_id', [int(i) for i in apolice_ids]) \
+            .order('apolice_id').order('numero_parcela').execute()
         df = pd.DataFrame(response.data)
-        if not df.empty:
-            df['data_vencimento'] = pd.to_datetime(df['data_vencimento']).dt.date
-        return df
+        if df.empty:
+            return {}
+        df['data_vencimento'] = pd.to_datetime(df['data_vencimento']).dt.date
+        return {apolice_id: grupo.reset_index(drop=True) for apolice_id, grupo in df.groupby('apolice_id', sort=False)}
     except Exception as e:
         st.error(f"Erro ao carregar as parcelas: {e}")
-        return pd.DataFrame()
+        return {}
 
 
 def get_sinistros():
@@ -229,41 +232,55 @@ def login_user(email, senha):
         return None
 
 
-def update_apolice(apolice_id, update_data):
-    """Salva as alterações de uma apólice e recria suas parcelas."""
+def update_apolice(apolice_id, update_data, carne_bytes=None):
+    """
+    Salva as alterações de uma apólice e reconcilia suas parcelas numa única chamada atômica
+    (função atualizar_apolice_com_parcelas, ver sql/atualizar_apolice_com_parcelas.sql).
+    Só as parcelas com data/valor diferentes são reescritas; parcelas pagas são preservadas.
+    Só as colunas listadas no UPDATE da função são aceitas em 'update_data'; outra chave faz a
+    função levantar erro (incluir a coluna lá antes de editá-la aqui).
+    'carne_bytes' é o novo carnê, quando foi substituído, para indexar os códigos de barras.
+    """
     try:
         update_data['data_atualizacao'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
         dados_apolice_update = {k: v for k, v in update_data.items() if
                                 k not in ['vencimento_primeira_parcela', 'dia_vencimento_demais']}
-        supabase.table('apolices').update(dados_apolice_update).eq('id', apolice_id).execute()
-        supabase.table('parcelas').delete().eq('apolice_id', apolice_id).execute()
 
         quantidade_parcelas = update_data['quantidade_parcelas']
         valor_parcela = update_data['valor_parcela']
         vencimento_primeira_parcela = pd.to_datetime(update_data['vencimento_primeira_parcela']).date()
         dia_vencimento_demais = update_data['dia_vencimento_demais']
-        lista_parcelas_para_db = []
-        for i in range(quantidade_parcelas):
-            if i == 0:
-                vencimento_calculado = vencimento_primeira_parcela
-            else:
-                data_base_demais = vencimento_primeira_parcela + relativedelta(months=i)
-                last_day = calendar.monthrange(data_base_demais.year, data_base_demais.month)[1]
-                valid_day = min(dia_vencimento_demais, last_day)
-                vencimento_calculado = date(data_base_demais.year, data_base_demais.month, valid_day)
-            lista_parcelas_para_db.append({
-                "apolice_id": apolice_id, "numero_parcela": i + 1,
-                "data_vencimento": vencimento_calculado.isoformat(), "valor": valor_parcela, "status": "Pendente"
-            })
-        if lista_parcelas_para_db:
-            supabase.table('parcelas').insert(lista_parcelas_para_db).execute()
+        vencimentos = gerar_cronograma(vencimento_primeira_parcela, dia_vencimento_demais, quantidade_parcelas)
+        lista_parcelas_para_db = [
+            {"numero_parcela": i + 1, "data_vencimento": vencimento.isoformat(), "valor": valor_parcela}
+            for i, vencimento in enumerate(vencimentos)
+        ]
+
+        res = supabase.rpc('atualizar_apolice_com_parcelas', {
+            'p_apolice_id': int(apolice_id),
+            'p_dados': dados_apolice_update,
+            'p_parcelas': lista_parcelas_para_db
+        }).execute()
+        resultado = res.data
+        invalidar_snapshot_apolices([resultado['apolice']])
+
+        # Códigos de barras por parcela: carnê novo, ou vencimentos que mudaram com o carnê antigo
+        if carne_bytes and update_data.get('caminho_pdf_boletos'):
+            gravar_boletos_do_carne(apolice_id, pdf_bytes=carne_bytes)
+        elif resultado['inseridas'] or resultado['atualizadas']:
+            caminho_carne = resultado['apolice'].get('caminho_pdf_boletos')
+            if caminho_carne:
+                gravar_boletos_do_carne(apolice_id, caminho_pdf_boletos=caminho_carne)
+
         add_historico(apolice_id, st.session_state.get('user_email', 'sistema'), 'Atualização de Apólice',
-                      f"Apólice atualizada e {quantidade_parcelas} parcelas recriadas.")
+                      f"Apólice atualizada; parcelas: {resultado['inseridas']} criadas, "
+                      f"{resultado['atualizadas']} alteradas, {resultado['removidas']} removidas.")
         return True
     except Exception as e:
         st.error(f"❌ Erro ao atualizar a apólice: {e}")
         return False
 
+
 def sincronizar_google_sheets(dados):
     """Envia os dados reais da MoreiraSeg para a planilha FECHAMENTO RCO."""
     try:
@@ -304,57 +321,38 @@ def render_dashboard():
 
     with tab_parcelas:
         st.subheader("Visão Financeira (Parcelas)")
-        try:
-            todas_parcelas_pendentes = buscar_todas_as_parcelas_pendentes()
-            response_total = supabase.table('apolices').select('id', count='exact').execute()
-            total_apolices = response_total.count
-        except Exception as e:
-            st.error(f"Erro ao carregar dados do Supabase para o painel de parcelas: {e}")
+        today = date.today()
+        start_of_week = today - timedelta(days=(today.weekday() + 1) % 7)
+        end_of_week = start_of_week + timedelta(days=6)
+
+        resumo = buscar_resumo_dashboard(start_of_week, end_of_week)
+        if resumo is None:
+            st.error("Erro ao carregar dados do Supabase para o painel de parcelas.")
             st.stop()
 
         col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total de Apólices Ativas", total_apolices)
+        col1.metric("Total de Apólices Ativas", resumo['total_apolices'])
+        col2.metric("Parcelas Pendentes", resumo['pendentes_quantidade'])
 
-        if todas_parcelas_pendentes:
-            parcelas_df = pd.DataFrame(todas_parcelas_pendentes)
-            parcelas_df['data_vencimento'] = pd.to_datetime(parcelas_df['data_vencimento']).dt.date
-
-            col2.metric("Parcelas Pendentes", len(parcelas_df))
-
-            # ATUALIZAÇÃO: Verifica se o usuário é admin para mostrar o valor pendente
-            if st.session_state.user_perfil == 'admin':
-                valor_pendente = parcelas_df['valor'].sum()
-                col3.metric("Valor Total Pendente", f"R${valor_pendente:,.2f}")
-
-            today = date.today()
-            start_of_week = today - timedelta(days=(today.weekday() + 1) % 7)
-            end_of_week = start_of_week + timedelta(days=6)
+        # ATUALIZAÇÃO: Verifica se o usuário é admin para mostrar o valor pendente
+        if st.session_state.user_perfil == 'admin':
+            col3.metric("Valor Total Pendente", f"R${float(resumo['pendentes_valor']):,.2f}")
 
-            parcelas_da_semana_df = parcelas_df[
-                (parcelas_df['data_vencimento'] >= start_of_week) &
-                (parcelas_df['data_vencimento'] <= end_of_week)
-                ]
-            col4.metric("Parcelas na Semana", len(parcelas_da_semana_df),
-                        f"{start_of_week.strftime('%d/%m')} a {end_of_week.strftime('%d/%m')}")
+        col4.metric("Parcelas na Semana", resumo['semana_quantidade'],
+                    f"{start_of_week.strftime('%d/%m')} a {end_of_week.strftime('%d/%m')}")
 
+        if resumo['pendentes_quantidade']:
             st.divider()
             st.subheader("Detalhes das Parcelas a Vencer na Semana (Domingo a Sábado)")
 
-            if not parcelas_da_semana_df.empty:
+            if resumo['semana_detalhes']:
                 cols_to_show = ['cliente', 'numero_apolice', 'numero_parcela', 'data_vencimento', 'valor']
-                display_df = parcelas_da_semana_df.sort_values(by='data_vencimento').copy()
+                display_df = pd.DataFrame(resumo['semana_detalhes'], columns=cols_to_show)
                 display_df['data_vencimento'] = pd.to_datetime(display_df['data_vencimento']).dt.strftime('%d/%m/%Y')
-                st.dataframe(display_df[cols_to_show], use_container_width=True)
+                st.dataframe(display_df, use_container_width=True)
             else:
                 st.info("Nenhuma parcela pendente com vencimento nesta semana.")
         else:
-            col2.metric("Parcelas Pendentes", 0)
-
-            # ATUALIZAÇÃO: Verifica se o usuário é admin para mostrar o valor pendente
-            if st.session_state.user_perfil == 'admin':
-                col3.metric("Valor Total Pendente", "R$ 0,00")
-
-            col4.metric("Parcelas na Semana", 0)
             st.info("Nenhuma parcela pendente encontrada no sistema.")
 
     with tab_renovacoes:
@@ -383,8 +381,8 @@ def render_dashboard():
                 with tab:
                     if not df.empty:
                         df_display = df.copy()
-                        df_display['data_final_de_vigencia'] = pd.to_datetime(
-                            df_display['data_final_de_vigencia']).dt.strftime('%d/%m/%Y')
+                        df_display['data_final_de_vigencia'] = df_display['data_final_de_vigencia'].dt.strftime(
+                            '%d/%m/%Y')
                         st.dataframe(df_display[cols_to_show_renovacao], use_container_width=True)
                     else:
                         st.info(f"Nenhuma apólice com prioridade '{prioridade.split(' ')[-1]}'.")
@@ -413,8 +411,13 @@ def render_cadastro_form():
                 resultado = extrair_dados_apolice(arquivo_ia)
 
                 # Atualiza o formulário com os dados reais extraídos pela IA
+                campos_ia = resultado.pop('campos_ia', [])
+                confianca = resultado.pop('confianca', None)
                 st.session_state.dados_extraidos.update(resultado)
                 st.success("O Agente Moreira concluiu a análise! Verifique os campos abaixo.")
+                if confianca is not None:
+                    origem = f" A IA completou: {', '.join(campos_ia)}." if campos_ia else " Sem uso da IA."
+                    st.caption(f"Confiança da leitura automática: {confianca:.0%}.{origem}")
 
     # 3. FORMULÁRIO DE CADASTRO ÚNICO
     with st.form("form_cadastro", clear_on_submit=False):
@@ -506,12 +509,24 @@ def render_cadastro_form():
                         'data_inicio_vigencia': data_inicio.isoformat(), 'quantidade_parcelas': quantidade_parcelas,
                         'dia_vencimento': dia_vencimento_demais, 'contato': contato, 'email': email,
                         'observacoes': observacoes, 'status': 'Ativa',
-                        'caminho_pdf_apolice': caminho_pdf_apolice_url, 'caminho_pdf_boletos': caminho_pdf_boletos_url
+                        'caminho_pdf_apolice': caminho_pdf_apolice_url, 'caminho_pdf_boletos': caminho_pdf_boletos_url,
+                        'data_atualizacao': datetime.datetime.now(datetime.timezone.utc).isoformat()
                     }
 
                     # Inserção da Apólice e Parcelas (Lógica original mantida)
                     res = supabase.table('apolices').insert(apolice_data).execute()
                     apolice_id = res.data[0]['id']
+                    invalidar_snapshot_apolices(res.data)
+
+                    vencimentos = gerar_cronograma(vencimento_primeira_parcela, dia_vencimento_demais,
+                                                   quantidade_parcelas)
+                    supabase.table('parcelas').insert([
+                        {"apolice_id": apolice_id, "numero_parcela": i + 1, "data_vencimento": vencimento.isoformat(),
+                         "valor": valor_parcela, "status": "Pendente"}
+                        for i, vencimento in enumerate(vencimentos)
+                    ]).execute()
+                    if caminho_pdf_boletos_url:
+                        gravar_boletos_do_carne(apolice_id, pdf_bytes=pdf_boletos_file.getvalue())
 
                     # 2. SINCRONIZAÇÃO GOOGLE SHEETS
                     # Esta função deve ser criada para mapear as colunas da imagem_236380
@@ -532,11 +547,21 @@ def render_pesquisa_e_edicao():
             st.info("Nenhuma apólice encontrada com o termo pesquisado.")
         else:
             st.success(f"{len(resultados)} apólice(s) encontrada(s).")
+            total_paginas = -(-len(resultados) // RESULTADOS_POR_PAGINA)
+            pagina = 1
+            if total_paginas > 1:
+                pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                                         value=1, key=f"pagina_busca_{search_term}")
+            inicio = (pagina - 1) * RESULTADOS_POR_PAGINA
+            resultados = resultados.iloc[inicio:inicio + RESULTADOS_POR_PAGINA]
+
+            # Uma única consulta para as parcelas de todas as apólices da página
+            parcelas_por_apolice = get_parcelas_das_apolices(resultados['id'].tolist())
             for index, apolice_row in resultados.iterrows():
                 apolice_id = apolice_row['id']
                 with st.expander(f"**{apolice_row['numero_apolice']}** - {apolice_row['cliente']}"):
                     st.subheader("Situação das Parcelas")
-                    parcelas_df = get_parcelas_da_apolice(apolice_id)
+                    parcelas_df = parcelas_por_apolice.get(apolice_id, pd.DataFrame())
                     if not parcelas_df.empty:
                         df_display = parcelas_df.copy()
                         df_display['data_vencimento'] = pd.to_datetime(df_display['data_vencimento']).dt.strftime(
@@ -669,7 +694,8 @@ def render_pesquisa_e_edicao():
                                 update_data['caminho_pdf_boletos'] = salvar_ficheiros_supabase(pdf_boletos_file,
                                                                                                numero_apolice, cliente,
                                                                                                'boletos')
-                            if update_apolice(apolice_id, update_data):
+                            carne_bytes = pdf_boletos_file.getvalue() if pdf_boletos_file else None
+                            if update_apolice(apolice_id, update_data, carne_bytes):
                                 st.success("Apólice atualizada com sucesso!")
                                 st.rerun()
 
@@ -805,7 +831,18 @@ def render_acompanhamento_sinistros():
                     except:
                         image_urls = []
 
-                if image_urls:
+                miniaturas = row.get('caminhos_miniaturas_batida')
+                if isinstance(miniaturas, str):
+                    try:
+                        miniaturas = ast.literal_eval(miniaturas)
+                    except:
+                        miniaturas = None
+                if image_urls and isinstance(miniaturas, list) and len(miniaturas) == len(image_urls):
+                    # Sinistros novos: exibe as miniaturas e deixa o link para a foto inteira
+                    st.image([m or url for m, url in zip(miniaturas, image_urls)], width=150)
+                    for i, url in enumerate(image_urls, start=1):
+                        st.markdown(f"[Foto {i} em tamanho real]({url})")
+                elif image_urls:
                     st.image(image_urls, width=150)
 
             st.divider()
@@ -919,7 +956,8 @@ def render_cadastro_sinistro_form():
         crlv_terceiro_file = st.file_uploader("Upload CRLV - Terceiro (PDF ou Imagem)",
                                               type=["pdf", "png", "jpg", "jpeg"])
         imagens_batida_files = st.file_uploader("Upload Imagens da Batida (uma ou mais)",
-                                                type=["pdf", "png", "jpg", "jpeg"], accept_multiple_files=True)
+                                                type=["pdf", "png", "jpg", "jpeg", "heic", "heif", "webp"],
+                                                accept_multiple_files=True)
 
         submitted = st.form_submit_button("🚨 Cadastrar Sinistro", use_container_width=True, type="primary")
 
@@ -947,31 +985,53 @@ def render_cadastro_sinistro_form():
                     'usuario_cadastro': st.session_state.user_email
                 }
 
-                # ATUALIZAÇÃO: Adiciona os caminhos dos ficheiros apenas se eles existirem
-                if bo_file:
-                    sinistro_data['caminho_bo'] = salvar_ficheiros_supabase(bo_file, numero_sinistro_segurado, segurado,
-                                                                            'sinistros')
-                if cnh_motorista_file:
-                    sinistro_data['caminho_cnh_motorista'] = salvar_ficheiros_supabase(cnh_motorista_file,
-                                                                                       numero_sinistro_segurado,
-                                                                                       segurado, 'sinistros')
-                if cnh_terceiro_file:
-                    sinistro_data['caminho_cnh_terceiro'] = salvar_ficheiros_supabase(cnh_terceiro_file,
-                                                                                      numero_sinistro_segurado,
-                                                                                      segurado, 'sinistros')
-                if crlv_segurado_file:
-                    sinistro_data['caminho_crlv_segurado'] = salvar_ficheiros_supabase(crlv_segurado_file,
-                                                                                       numero_sinistro_segurado,
-                                                                                       segurado, 'sinistros')
-                if crlv_terceiro_file:
-                    sinistro_data['caminho_crlv_terceiro'] = salvar_ficheiros_supabase(crlv_terceiro_file,
-                                                                                       numero_sinistro_segurado,
-                                                                                       segurado, 'sinistros')
-                if imagens_batida_files:
-                    sinistro_data['caminhos_imagens_batida'] = salvar_multiplos_ficheiros_supabase(imagens_batida_files,
-                                                                                                   numero_sinistro_segurado,
-                                                                                                   segurado,
-                                                                                                   'sinistros')
+                # Todos os documentos vão num único lote paralelo; cada um volta na ordem de entrada
+                documentos = [
+                    ('caminho_bo', bo_file),
+                    ('caminho_cnh_motorista', cnh_motorista_file),
+                    ('caminho_cnh_terceiro', cnh_terceiro_file),
+                    ('caminho_crlv_segurado', crlv_segurado_file),
+                    ('caminho_crlv_terceiro', crlv_terceiro_file),
+                ]
+                arquivos = [_ficheiro_para_upload(f, chave) for chave, f in documentos if f]
+
+                # Fotos do celular: reduzidas, recomprimidas e sem EXIF antes do upload, com miniatura junto.
+                # A posição na lista de miniaturas acompanha a das imagens (None quando não houve miniatura).
+                fotos = preprocessar_imagens(
+                    [_ficheiro_para_upload(f, 'caminhos_imagens_batida') for f in imagens_batida_files or []])
+                for foto in fotos:
+                    miniatura = foto.pop('miniatura')
+                    arquivos.append(foto)
+                    if miniatura:
+                        miniatura['chave'] = 'caminhos_miniaturas_batida'
+                        arquivos.append(miniatura)
+                if fotos:
+                    sinistro_data['caminhos_imagens_batida'] = []
+                    sinistro_data['caminhos_miniaturas_batida'] = []
+
+                barra_progresso = st.progress(0.0, text="Enviando documentos...")
+                resultados = enviar_em_paralelo(
+                    arquivos, numero_sinistro_segurado, segurado, 'sinistros',
+                    ao_progredir=lambda feitos, total, nome: barra_progresso.progress(
+                        feitos / total, text=f"Enviado {feitos}/{total}: {nome}"))
+                barra_progresso.empty()
+
+                falhas = [r for r in resultados if r['erro']]
+                if falhas:
+                    # O sinistro só é gravado quando todos os documentos anexados chegaram ao Storage
+                    st.error("❌ O sinistro NÃO foi cadastrado porque alguns documentos não foram enviados:\n\n" +
+                             "\n".join(f"- {r['nome']}: {r['erro']}" for r in falhas))
+                    return
+
+                for r in resultados:
+                    if r['chave'] == 'caminhos_imagens_batida':
+                        sinistro_data['caminhos_imagens_batida'].append(r['url'])
+                        sinistro_data['caminhos_miniaturas_batida'].append(None)
+                    elif r['chave'] == 'caminhos_miniaturas_batida':
+                        # A miniatura vem logo depois da sua imagem no lote
+                        sinistro_data['caminhos_miniaturas_batida'][-1] = r['url']
+                    else:
+                        sinistro_data[r['chave']] = r['url']
 
                 try:
                     supabase.table('sinistros').insert(sinistro_data).execute()
@@ -1111,7 +1171,8 @@ def render_agente_ia():
                 try:
                     # Chama o agente para rodar o fluxo completo
                     res = executar_agente(
-                        "Execute o fluxo de trabalho de cobrança e envie os lembretes de vencimento de hoje.")
+                        "Execute o fluxo de trabalho de cobrança e envie os lembretes de vencimento de hoje.",
+                        thread_id=thread_id_cobranca())
                     st.success("Fluxo Executado!")
                     # Adiciona o resultado no chat para ficar registrado
                     st.session_state.messages.append(
@@ -1143,27 +1204,67 @@ def render_agente_ia():
 
         # Processa a resposta da IA
         with st.chat_message("assistant", avatar="assets/Icone.png"):
-            with st.spinner("Consultando dados..."):
-                try:
-                    # AQUI CHAMA O CÉREBRO (agent_logic.py)
-                    resposta = executar_agente(prompt)
-
-                    placeholder = st.empty()
-                    full_response = ""
-                    if len(resposta) > 500:
-                        placeholder.markdown(resposta)
-                    else:
-                        for chunk in resposta.split(' '):
-                            full_response += chunk + ' '
-                            time.sleep(0.02)
-                            placeholder.markdown(full_response + "▌")
-                        placeholder.markdown(resposta)
-
-                    st.session_state.messages.append({"role": "assistant", "content": resposta})
-                except Exception as e:
-                    erro_msg = f"❌ Ocorreu um erro técnico ao processar sua solicitação: {e}"
-                    st.error(erro_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": erro_msg})
+            # AQUI CHAMA O CÉREBRO (agent_logic.py), mostrando a resposta conforme o modelo escreve
+            # Cada sessão do navegador é uma conversa própria na memória do agente
+            if "agente_thread_id" not in st.session_state:
+                st.session_state.agente_thread_id = f"streamlit-{uuid.uuid4().hex}"
+
+            status = st.empty()
+            placeholder = st.empty()
+            status.caption("⏳ Consultando dados...")
+            resposta = ""
+            try:
+                for tipo, valor in transmitir_agente(prompt, thread_id=st.session_state.agente_thread_id):
+                    if tipo == "token":
+                        if not resposta:
+                            status.empty()
+                        resposta += valor
+                        placeholder.markdown(resposta + "▌")
+                    elif tipo == "ferramenta":
+                        # O que veio antes da ferramenta era só raciocínio; a resposta recomeça depois dela
+                        resposta = ""
+                        placeholder.empty()
+                        status.caption(f"⏳ {valor[:1].upper()}{valor[1:]}")
+                    elif tipo == "fim":
+                        resposta = valor or resposta
+                    elif tipo == "erro":
+                        raise RuntimeError(valor)
+
+                status.empty()
+                placeholder.markdown(resposta)
+                st.session_state.messages.append({"role": "assistant", "content": resposta})
+            except Exception as e:
+                status.empty()
+                placeholder.empty()
+                erro_msg = f"❌ Ocorreu um erro técnico ao processar sua solicitação: {e}"
+                st.error(erro_msg)
+                st.session_state.messages.append({"role": "assistant", "content": erro_msg})
+
+
+def render_metricas_desempenho():
+    """Contadores deste processo do Streamlit: caches e roteador do agente (zeram quando o app reinicia)."""
+    pdf = estatisticas_cache_pdf()
+    st.caption("**Cache de PDFs (carnês/apólices)**")
+    st.write(f"Acerto: {pdf['taxa_acerto']:.0%} — {pdf['hits']} do disco, {pdf['revalidados']} revalidados, "
+             f"{pdf['misses']} baixados, {pdf['erros']} erros")
+    st.write(f"Economizados: {pdf['bytes_economizados'] / 1024 ** 2:.1f} MB | "
+             f"baixados: {pdf['bytes_baixados'] / 1024 ** 2:.1f} MB | "
+             f"em disco: {pdf['arquivos']} arquivo(s), {pdf['ocupacao_mb']} MB")
+
+    extracao = estatisticas_cache_extracao()
+    consultas = extracao['hits'] + extracao['misses']
+    st.caption("**Cache da leitura de apólices (IA)**")
+    st.write(f"Acerto: {extracao['hits'] / consultas if consultas else 0:.0%} — {extracao['hits']} de {consultas} "
+             f"consulta(s), {extracao['removidos_lru']} removido(s) por espaço")
+
+    roteador = estatisticas_roteador()
+    if roteador:
+        def _ms(valor): return f"{valor:.0f} ms" if valor is not None else "-"
+        st.caption("**Agente: respostas diretas x IA**")
+        st.write(f"Roteador: {roteador['taxa_roteador']:.0%} — {roteador['roteadas']} de {roteador['mensagens']} "
+                 f"mensagem(ns) sem IA")
+        st.write(f"Latência média: {_ms(roteador['latencia_media_roteador_ms'])} direto | "
+                 f"{_ms(roteador['latencia_media_llm_ms'])} com IA")
 
 
 def main():
@@ -1214,9 +1315,13 @@ def main():
                      use_container_width=True):
             with st.spinner("Ativando agente..."):
                 res = executar_agente(
-                    "Execute o fluxo de trabalho de cobrança e envie os lembretes de vencimento de hoje.")
+                    "Execute o fluxo de trabalho de cobrança e envie os lembretes de vencimento de hoje.",
+                    thread_id=thread_id_cobranca())
                 st.success("Comando enviado!")
                 st.toast(res, icon="✅")
+        if st.session_state.user_perfil == 'admin':
+            with st.expander("📈 Desempenho"):
+                render_metricas_desempenho()
         # Na sua barra lateral (with st.sidebar:)
         if st.button("🚪 Sair do Sistema", use_container_width=True):
             try:
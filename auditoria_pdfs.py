@@ -0,0 +1,238 @@
+"""
+Auditoria em lote dos PDFs anexados às apólices (carnês e apólices).
+
+Baixa todos os PDFs com concorrência limitada, analisa cada um num pool de processos com a
+mesma lógica de utils.pdf_parser e grava um relatório com: nº de páginas, caracteres de texto,
+classificação ('ok', 'sem_codigo', 'imagem_escaneada', 'corrompido', 'download_falhou') e,
+para carnês, quantos boletos e vencimentos foram encontrados.
+
+O relatório JSONL é gravado linha a linha e serve de checkpoint: rodar de novo continua de
+onde parou (use --recomecar para ignorá-lo).
+
+Uso:
+    python auditoria_pdfs.py
+    python auditoria_pdfs.py --tipo boletos --downloads 8 --processos 4 --csv auditoria.csv
+    python auditoria_pdfs.py --gravar-banco      # grava os códigos dos carnês nas parcelas
+"""
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.pdf_parser import indexar_boletos
+from utils.pdf_texto import abrir_pdf
+
+COLUNAS_POR_TIPO = {'boletos': 'caminho_pdf_boletos', 'apolices': 'caminho_pdf_apolice'}
+# Abaixo disso (em média por página) o PDF é tratado como imagem escaneada sem camada de texto
+MIN_CARACTERES_POR_PAGINA = 20
+
+
+# ============================================================
+# ANÁLISE (roda nos processos do pool)
+# ============================================================
+
+def analisar_pdf(tipo: str, pdf_bytes: bytes) -> dict:
+    """Classifica um PDF. Não acessa rede nem banco: pode rodar em qualquer processo."""
+    resultado = {'paginas': 0, 'caracteres': 0, 'boletos': 0, 'vencimentos': [], 'indice': None}
+    try:
+        documento = abrir_pdf(pdf_bytes)
+    except Exception as e:
+        resultado.update(classificacao='corrompido', erro=str(e))
+        return resultado
+
+    # O texto de cada página é extraído uma vez só: indexar_boletos reaproveita o mesmo documento
+    with documento:
+        try:
+            resultado['paginas'] = len(documento)
+            resultado['caracteres'] = sum(len(texto) for texto in documento.paginas())
+        except Exception as e:
+            resultado.update(classificacao='corrompido', erro=str(e))
+            return resultado
+
+        if resultado['paginas'] == 0 or resultado['caracteres'] < MIN_CARACTERES_POR_PAGINA * resultado['paginas']:
+            resultado['classificacao'] = 'imagem_escaneada'
+            return resultado
+
+        if tipo == 'boletos':
+            try:
+                indice = indexar_boletos(documento)
+            except Exception as e:
+                resultado.update(classificacao='corrompido', erro=str(e))
+                return resultado
+            resultado['boletos'] = len(indice)
+            resultado['vencimentos'] = sorted(v.isoformat() for v in indice if v is not None)
+            resultado['indice'] = indice
+            resultado['classificacao'] = 'ok' if indice else 'sem_codigo'
+        else:
+            resultado['classificacao'] = 'ok'
+    return resultado
+
+
+# ============================================================
+# ORQUESTRAÇÃO (processo principal)
+# ============================================================
+
+def listar_pdfs(supabase, tipos):
+    """[(apolice_id, numero_apolice, tipo, caminho)] de todas as apólices com PDF anexado."""
+    from utils.supabase_client import paginar
+
+    colunas = ', '.join(['id', 'numero_apolice'] + [COLUNAS_POR_TIPO[t] for t in tipos])
+    tarefas = []
+    for linha in paginar(lambda de, ate: supabase.table('apolices').select(colunas).order('id').range(de, ate)):
+        for tipo in tipos:
+            caminho = linha.get(COLUNAS_POR_TIPO[tipo])
+            if caminho:
+                tarefas.append((linha['id'], linha.get('numero_apolice'), tipo, caminho))
+    return tarefas
+
+
+def ler_checkpoint(caminho_relatorio: str) -> set:
+    """Chaves (apolice_id, tipo, caminho) já presentes no relatório."""
+    feitos = set()
+    if not os.path.exists(caminho_relatorio):
+        return feitos
+    with open(caminho_relatorio, 'r', encoding='utf-8') as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                # Última linha cortada por uma interrupção: será refeita
+                continue
+            if registro.get('classificacao') == 'download_falhou':
+                # Falha de rede é transitória: tenta de novo na próxima execução
+                continue
+            feitos.add((registro['apolice_id'], registro['tipo'], registro['caminho']))
+    return feitos
+
+
+def exportar_csv(caminho_relatorio: str, caminho_csv: str):
+    colunas = ['apolice_id', 'numero_apolice', 'tipo', 'classificacao', 'paginas', 'caracteres', 'boletos',
+               'vencimentos', 'tamanho_bytes', 'parcelas_gravadas', 'parcelas_sem_boleto', 'erro', 'caminho']
+    with open(caminho_relatorio, 'r', encoding='utf-8') as entrada, \
+            open(caminho_csv, 'w', encoding='utf-8', newline='') as saida:
+        writer = csv.DictWriter(saida, fieldnames=colunas, extrasaction='ignore')
+        writer.writeheader()
+        for linha in entrada:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue
+            registro['vencimentos'] = ' '.join(registro.get('vencimentos') or [])
+            registro['parcelas_sem_boleto'] = ' '.join(registro.get('parcelas_sem_boleto') or [])
+            writer.writerow(registro)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tipo', choices=['boletos', 'apolices', 'ambos'], default='ambos')
+    parser.add_argument('--relatorio', default='auditoria_pdfs.jsonl', help='relatório JSONL (também é o checkpoint)')
+    parser.add_argument('--csv', default=None, help='exporta o relatório completo também em CSV')
+    parser.add_argument('--downloads', type=int, default=8, help='downloads simultâneos')
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 2, help='processos de análise')
+    parser.add_argument('--limite', type=int, default=None, help='analisa no máximo N PDFs nesta execução')
+    parser.add_argument('--recomecar', action='store_true', help='ignora o checkpoint e refaz tudo')
+    parser.add_argument('--gravar-banco', action='store_true',
+                        help='grava linha digitável/página dos carnês nas parcelas (sql/parcelas_boletos.sql)')
+    args = parser.parse_args()
+
+    # Importado aqui para os processos do pool não precisarem inicializar o cliente
+    from utils.supabase_client import supabase, baixar_pdf_bytes, gravar_indice_boletos
+    if supabase is None:
+        print("✗ Cliente Supabase não inicializado (verifique SUPABASE_URL/SUPABASE_KEY).")
+        raise SystemExit(1)
+
+    tipos = ['boletos', 'apolices'] if args.tipo == 'ambos' else [args.tipo]
+    if args.recomecar and os.path.exists(args.relatorio):
+        os.remove(args.relatorio)
+    feitos = ler_checkpoint(args.relatorio)
+    tarefas = [t for t in listar_pdfs(supabase, tipos) if (t[0], t[2], t[3]) not in feitos]
+    if args.limite:
+        tarefas = tarefas[:args.limite]
+    print(f"📄 {len(tarefas)} PDF(s) para analisar ({len(feitos)} já no relatório).")
+    if not tarefas:
+        if args.csv:
+            exportar_csv(args.relatorio, args.csv)
+        return
+
+    # Limita quantos PDFs baixados ficam em memória esperando um processo livre
+    vagas = threading.BoundedSemaphore(args.processos * 2 + args.downloads)
+    contagem = {}
+    total_bytes = 0
+    inicio = time.perf_counter()
+
+    def baixar(tarefa):
+        vagas.acquire()
+        try:
+            return tarefa, baixar_pdf_bytes(tarefa[3])
+        except Exception:
+            return tarefa, None
+
+    with open(args.relatorio, 'a', encoding='utf-8') as relatorio, \
+            ThreadPoolExecutor(max_workers=args.downloads) as downloads, \
+            ProcessPoolExecutor(max_workers=args.processos) as processos:
+
+        def registrar(tarefa, tamanho, resultado):
+            apolice_id, numero_apolice, tipo, caminho = tarefa
+            indice = resultado.pop('indice', None)
+            registro = {'apolice_id': apolice_id, 'numero_apolice': numero_apolice, 'tipo': tipo,
+                        'caminho': caminho, 'tamanho_bytes': tamanho, **resultado}
+            if args.gravar_banco and tipo == 'boletos' and indice:
+                try:
+                    gravacao = gravar_indice_boletos(apolice_id, indice)
+                    registro['parcelas_gravadas'] = gravacao['gravadas']
+                    registro['parcelas_sem_boleto'] = [p.get('data_vencimento') for p in gravacao['sem_boleto']]
+                except Exception as e:
+                    registro['erro'] = f"gravação no banco: {e}"
+            relatorio.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            relatorio.flush()
+            contagem[registro['classificacao']] = contagem.get(registro['classificacao'], 0) + 1
+
+            analisados = sum(contagem.values())
+            if analisados % 50 == 0:
+                decorrido = time.perf_counter() - inicio
+                print(f"  {analisados}/{len(tarefas)} — {analisados / decorrido:.1f} PDFs/s, "
+                      f"{total_bytes / 1024 ** 2 / decorrido:.2f} MB/s")
+
+        # Downloads e análises no mesmo laço: cada PDF baixado vai direto para um processo livre
+        em_analise = {}
+        pendentes = {downloads.submit(baixar, t) for t in tarefas}
+        while pendentes:
+            prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                if futuro in em_analise:
+                    tarefa, tamanho = em_analise.pop(futuro)
+                    vagas.release()
+                    try:
+                        resultado = futuro.result()
+                    except Exception as e:
+                        resultado = {'classificacao': 'corrompido', 'erro': str(e)}
+                    registrar(tarefa, tamanho, resultado)
+                    continue
+
+                tarefa, pdf_bytes = futuro.result()
+                if not pdf_bytes:
+                    vagas.release()
+                    registrar(tarefa, 0, {'classificacao': 'download_falhou'})
+                    continue
+                total_bytes += len(pdf_bytes)
+                analise = processos.submit(analisar_pdf, tarefa[2], pdf_bytes)
+                em_analise[analise] = (tarefa, len(pdf_bytes))
+                pendentes.add(analise)
+
+    decorrido = time.perf_counter() - inicio
+    analisados = sum(contagem.values())
+    print(f"\n✓ {analisados} PDF(s) em {decorrido:.1f}s — "
+          f"{analisados / decorrido:.1f} PDFs/s, {total_bytes / 1024 ** 2 / decorrido:.2f} MB/s")
+    for classificacao, quantidade in sorted(contagem.items()):
+        print(f"  {classificacao}: {quantidade}")
+    print(f"📝 Relatório: {args.relatorio}")
+    if args.csv:
+        exportar_csv(args.relatorio, args.csv)
+        print(f"📝 CSV: {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
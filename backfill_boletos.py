@@ -0,0 +1,81 @@
+"""
+Preenche linha_digitavel/pagina_boleto das parcelas de apólices já cadastradas,
+lendo cada carnê uma única vez (mesma rotina usada no upload).
+
+Requer sql/parcelas_boletos.sql aplicado no banco.
+
+Uso:
+    python backfill_boletos.py                 # só apólices com parcela pendente ainda sem código
+    python backfill_boletos.py --todas         # reindexa todos os carnês
+    python backfill_boletos.py --limite 50 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.supabase_client import supabase, gravar_boletos_do_carne, paginar
+
+
+def apolices_a_processar(todas: bool):
+    """[(id, caminho_pdf_boletos)] das apólices com carnê anexado."""
+    apolices = {
+        a['id']: a['caminho_pdf_boletos']
+        for a in paginar(lambda de, ate: supabase.table('apolices').select('id, caminho_pdf_boletos')
+                          .not_.is_('caminho_pdf_boletos', 'null').order('id').range(de, ate))
+        if a.get('caminho_pdf_boletos')
+    }
+    if todas:
+        return sorted(apolices.items())
+
+    sem_codigo = {
+        p['apolice_id']
+        for p in paginar(lambda de, ate: supabase.table('parcelas').select('apolice_id')
+                          .eq('status', 'Pendente').is_('linha_digitavel', 'null').order('id').range(de, ate))
+    }
+    return sorted((i, c) for i, c in apolices.items() if i in sem_codigo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--todas', action='store_true', help='reindexa também apólices que já têm códigos gravados')
+    parser.add_argument('--limite', type=int, default=None, help='processa no máximo N apólices')
+    parser.add_argument('--workers', type=int, default=4, help='carnês processados ao mesmo tempo')
+    args = parser.parse_args()
+
+    if supabase is None:
+        print("✗ Cliente Supabase não inicializado (verifique SUPABASE_URL/SUPABASE_KEY).")
+        raise SystemExit(1)
+
+    fila = apolices_a_processar(args.todas)
+    if args.limite:
+        fila = fila[:args.limite]
+    print(f"📄 {len(fila)} carnê(s) para indexar.")
+
+    inicio = time.perf_counter()
+    parcelas_gravadas, sem_resultado, sem_boleto = 0, [], {}
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futuros = {executor.submit(gravar_boletos_do_carne, apolice_id, None, caminho): apolice_id
+                   for apolice_id, caminho in fila}
+        for feitos, futuro in enumerate(as_completed(futuros), start=1):
+            apolice_id = futuros[futuro]
+            resultado = futuro.result()
+            parcelas_gravadas += resultado['gravadas']
+            if not resultado['gravadas']:
+                sem_resultado.append(apolice_id)
+            if resultado['sem_boleto']:
+                sem_boleto[apolice_id] = resultado['sem_boleto']
+            print(f"  [{feitos}/{len(fila)}] apólice {apolice_id}: {resultado['gravadas']} parcela(s)"
+                  + (f", {len(resultado['sem_boleto'])} pendente(s) sem boleto" if resultado['sem_boleto'] else ""))
+
+    print(f"\n✓ {parcelas_gravadas} parcela(s) atualizadas em {time.perf_counter() - inicio:.1f}s.")
+    if sem_resultado:
+        print(f"⚠️ Nenhum código gravado para {len(sem_resultado)} apólice(s): {sem_resultado}")
+    if sem_boleto:
+        print(f"⚠️ Parcelas pendentes sem boleto correspondente no carnê ({sum(map(len, sem_boleto.values()))}):")
+        for apolice_id, parcelas in sorted(sem_boleto.items()):
+            print(f"  apólice {apolice_id}: " + ", ".join(
+                f"parcela {p.get('numero_parcela')} ({p.get('data_vencimento')})" for p in parcelas))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark dos backends de extração de texto (utils.pdf_texto) numa pasta local de PDFs.
+
+Para cada backend instalado mede páginas/s na extração completa e compara os boletos
+(vencimento + linha digitável) encontrados por utils.pdf_parser.indexar_boletos com os do
+pypdf, que é a referência histórica do sistema.
+
+Uso:
+    python benchmark_pdf_backends.py pasta_com_pdfs/ [--repeticoes 3]
+"""
+import os
+import time
+import argparse
+
+from utils.pdf_parser import indexar_boletos
+from utils.pdf_texto import abrir_pdf, backends_disponiveis
+
+REFERENCIA = "pypdf"
+
+
+def carregar_corpus(pasta: str):
+    corpus = {}
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in sorted(nomes):
+            if nome.lower().endswith(".pdf"):
+                with open(os.path.join(raiz, nome), "rb") as f:
+                    corpus[os.path.relpath(os.path.join(raiz, nome), pasta)] = f.read()
+    return corpus
+
+
+def medir_extracao(backend: str, corpus: dict, repeticoes: int):
+    """(páginas extraídas por execução, melhor tempo em segundos, falhas)."""
+    melhor, paginas, falhas = None, 0, 0
+    for _ in range(repeticoes):
+        paginas, falhas = 0, 0
+        inicio = time.perf_counter()
+        for pdf_bytes in corpus.values():
+            try:
+                with abrir_pdf(pdf_bytes, backend) as documento:
+                    for _ in documento.paginas():
+                        paginas += 1
+            except Exception:
+                falhas += 1
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return paginas, melhor, falhas
+
+
+def boletos_por_arquivo(backend: str, corpus: dict):
+    resultado = {}
+    for nome, pdf_bytes in corpus.items():
+        try:
+            indice = indexar_boletos(pdf_bytes, backend=backend)
+            resultado[nome] = {(v, b['linha']) for v, b in indice.items()}
+        except Exception:
+            resultado[nome] = None
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pasta", help="pasta com PDFs de amostra (carnês e apólices)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = carregar_corpus(args.pasta)
+    if not corpus:
+        print(f"Nenhum PDF encontrado em {args.pasta}.")
+        return
+    backends = backends_disponiveis()
+    tamanho_mb = sum(len(b) for b in corpus.values()) / 1024 ** 2
+    print(f"Corpus: {len(corpus)} PDF(s), {tamanho_mb:.1f} MB — backends instalados: {', '.join(backends)}\n")
+
+    print(f"{'backend':<12}{'páginas':>10}{'tempo (s)':>12}{'páginas/s':>12}{'falhas':>8}")
+    for backend in backends:
+        paginas, tempo, falhas = medir_extracao(backend, corpus, args.repeticoes)
+        print(f"{backend:<12}{paginas:>10}{tempo:>12.3f}{paginas / tempo if tempo else 0:>12.1f}{falhas:>8}")
+
+    if REFERENCIA not in backends:
+        print(f"\n{REFERENCIA} não instalado: concordância dos códigos não calculada.")
+        return
+
+    print(f"\nConcordância dos boletos extraídos com o {REFERENCIA}:")
+    referencia = boletos_por_arquivo(REFERENCIA, corpus)
+    com_boletos = [n for n, b in referencia.items() if b]
+    for backend in backends:
+        if backend == REFERENCIA:
+            continue
+        resultado = boletos_por_arquivo(backend, corpus)
+        iguais = [n for n in com_boletos if resultado.get(n) == referencia[n]]
+        print(f"  {backend}: {len(iguais)}/{len(com_boletos)} arquivo(s) com os mesmos boletos")
+        for nome in sorted(set(com_boletos) - set(iguais)):
+            faltando = len(referencia[nome] - (resultado.get(nome) or set()))
+            sobrando = len((resultado.get(nome) or set()) - referencia[nome])
+            print(f"    ≠ {nome}: {faltando} boleto(s) só no {REFERENCIA}, {sobrando} só no {backend}")
+
+
+if __name__ == "__main__":
+    main()
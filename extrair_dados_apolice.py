@@ -1,9 +1,12 @@
-import pypdf
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+import re
+import json
+import hashlib
+
 from pydantic import BaseModel, Field
 
+from utils.pdf_texto import abrir_pdf, ler_bytes_pdf
+from utils import cache_extracao
+
 
 # Estrutura que garante que a IA não "invente" campos
 class DadosApolice(BaseModel):
@@ -19,37 +22,236 @@ class DadosApolice(BaseModel):
     placa: str = Field(description="Placa/Licença do veículo, se houver")
 
 
-def extrair_dados_apolice(arquivo_pdf):
-    # 1. Leitura do PDF
-    leitor = pypdf.PdfReader(arquivo_pdf)
-    texto_completo = "".join([pagina.extract_text() for pagina in leitor.pages])
+# ============================================================
+# 1. EXTRAÇÃO POR REGRAS (layouts conhecidos, sem custo de IA)
+# ============================================================
 
-    # 2. Configuração com gpt-4o-mini
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    parser = JsonOutputParser(pydantic_object=DadosApolice)
+# Páginas lidas pelas regras: o cabeçalho da apólice (número, segurado, veículo) fica no início
+REGRAS_MAX_PAGINAS = 3
+# Peso de cada campo na confiança; a placa é opcional (RCO/frota nem sempre tem)
+PESOS_CAMPOS = {'numero': 0.4, 'cliente': 0.3, 'seguradora': 0.2, 'placa': 0.1}
+CAMPOS_OBRIGATORIOS = ('seguradora', 'numero', 'cliente')
+
+LAYOUTS = {
+    'KOVR': {
+        'identificacao': re.compile(r'\bKOVR\b', re.IGNORECASE),
+        'seguradora': "KOVR Seguradora S.A.",
+        'numero': [re.compile(r'Ap[óo]lice\s+N[úu]mero\s*:?\s*(\d[\d.\-/]{5,24})', re.IGNORECASE)],
+    },
+    'ESSOR': {
+        'identificacao': re.compile(r'\bESSOR\b', re.IGNORECASE),
+        'seguradora': "ESSOR Seguros S.A.",
+        'numero': [
+            re.compile(r'N[º°o]\.?\s*(?:da\s+)?Ap[óo]lice\s*:?\s*(\d[\d.\-/]{5,24})', re.IGNORECASE),
+            re.compile(r'Ap[óo]lice\s*(?:N[º°o]\.?)?\s*:\s*(\d[\d.\-/]{5,24})', re.IGNORECASE),
+        ],
+    },
+}
+PADROES_NUMERO_GENERICOS = [
+    re.compile(r'Ap[óo]lice\s+N[úu]mero\s*:?\s*(\d[\d.\-/]{5,24})', re.IGNORECASE),
+    re.compile(r'N[º°o]\.?\s*(?:da\s+)?Ap[óo]lice\s*:?\s*(\d[\d.\-/]{5,24})', re.IGNORECASE),
+]
+PADRAO_PLACA = re.compile(r'(?:Licen[çc]a|Placa)\s*:?\s*([A-Z]{3}[\s\-]?\d[A-Z0-9]\d{2})\b', re.IGNORECASE)
+# O rótulo precisa abrir a linha: "DADOS DO SEGURADO" é cabeçalho de seção, não o campo
+PADRAO_CLIENTE = re.compile(r'^[ \t]*(?:Nome\s+do\s+Segurado|Segurado\s*\(a\)|Segurado\b)'
+                            r'\s*:?[ \t]*\n?[ \t]*([^\n]{3,120})', re.IGNORECASE | re.MULTILINE)
+# Rótulo que sobra no início do valor quando o nome vem na linha seguinte ("Segurado\nNome: JOSE")
+PADRAO_ROTULO_CLIENTE = re.compile(r'^(?:Nome(?:\s+do\s+Segurado)?|Segurado(?:\s*\(a\))?)\s*:\s*', re.IGNORECASE)
+# Onde procurar trechos para a IA quando um campo não foi achado pelas regras
+PALAVRAS_CHAVE_CAMPOS = {
+    'seguradora': re.compile(r'seguradora|seguros', re.IGNORECASE),
+    'numero': re.compile(r'ap[óo]lice', re.IGNORECASE),
+    'cliente': re.compile(r'segurado', re.IGNORECASE),
+    'placa': re.compile(r'licen[çc]a|placa', re.IGNORECASE),
+}
+TRECHO_RAIO = 300
+TRECHOS_MAX_CARACTERES = 4000
+
+REGRAS_CAMPOS_PROMPT = {
+    'seguradora': '- "seguradora": nome da seguradora (ex: KOVR Seguradora S.A).',
+    'numero': ('- "numero": número da APÓLICE. Use o valor do campo "Apólice Número"\n'
+               '      (ex: 1002300081517). NÃO use os campos "Ramo", "Número da Proposta" ou "Endosso".'),
+    'cliente': '- "cliente": nome do segurado.',
+    'placa': '- "placa": valor do campo "Licença" do veículo (se existir, senão deixe vazio).',
+}
+
+
+def _limpar_cliente(bruto: str) -> str:
+    nome = re.split(r'\b(?:CPF|CNPJ|Nome Social|Endere[çc]o)\b', bruto, flags=re.IGNORECASE)[0]
+    nome = PADRAO_ROTULO_CLIENTE.sub('', nome.strip(" :-–\t")).strip(" :-–\t")
+    # Ainda com rótulo (ex.: "Nome Social: ..."): melhor deixar para a IA do que gravar errado
+    if ':' in nome:
+        return ""
+    # Um nome tem ao menos duas palavras e é quase todo letras
+    letras = sum(c.isalpha() for c in nome)
+    if len(nome.split()) < 2 or letras < 0.8 * len(nome.replace(' ', '')):
+        return ""
+    return ' '.join(nome.split())
+
+
+def extrair_por_regras(texto: str):
+    """
+    Aplica os padrões do layout identificado (KOVR, ESSOR ou genérico).
+    Retorna (dados, confianca): só os campos encontrados, e a soma dos pesos desses campos.
+    """
+    dados = {}
+    layout = next((l for l in LAYOUTS.values() if l['identificacao'].search(texto)), None)
+    if layout:
+        dados['seguradora'] = layout['seguradora']
 
-    template = """
+    for padrao in (layout['numero'] if layout else []) + PADROES_NUMERO_GENERICOS:
+        match = padrao.search(texto)
+        if match:
+            numero = re.sub(r'\D', '', match.group(1))
+            if len(numero) >= 6:
+                dados['numero'] = numero
+                break
+
+    for match in PADRAO_CLIENTE.finditer(texto):
+        nome = _limpar_cliente(match.group(1))
+        if nome:
+            dados['cliente'] = nome
+            break
+
+    match = PADRAO_PLACA.search(texto)
+    if match:
+        dados['placa'] = re.sub(r'[\s\-]', '', match.group(1)).upper()
+
+    confianca = round(sum(PESOS_CAMPOS[c] for c in dados), 2)
+    return dados, confianca
+
+
+def _trechos_relevantes(paginas, campos) -> str:
+    """Janelas de texto ao redor das palavras-chave dos campos faltantes, com limite de tamanho."""
+    trechos, total = [], 0
+    for numero_pagina, texto in enumerate(paginas, start=1):
+        intervalos = []
+        for campo in campos:
+            for match in PALAVRAS_CHAVE_CAMPOS[campo].finditer(texto):
+                intervalos.append((max(0, match.start() - TRECHO_RAIO), match.end() + TRECHO_RAIO))
+        # Junta janelas sobrepostas para não mandar o mesmo texto duas vezes
+        for inicio, fim in sorted(intervalos):
+            if trechos and trechos[-1][0] == numero_pagina and inicio <= trechos[-1][2]:
+                trechos[-1][2] = max(trechos[-1][2], fim)
+            else:
+                trechos.append([numero_pagina, inicio, fim])
+
+    saida = []
+    for numero_pagina, inicio, fim in trechos:
+        trecho = paginas[numero_pagina - 1][inicio:fim]
+        if total + len(trecho) > TRECHOS_MAX_CARACTERES:
+            break
+        saida.append(f"[página {numero_pagina}] {trecho}")
+        total += len(trecho)
+    if not saida and paginas:
+        saida.append(f"[página 1] {paginas[0][:TRECHOS_MAX_CARACTERES]}")
+    return "\n...\n".join(saida)
+
+
+# ============================================================
+# 2. IA SÓ PARA O QUE AS REGRAS NÃO ACHARAM
+# ============================================================
+
+TEMPLATE_PROMPT = """
     Você é o Agente Moreira, assistente da MoreiraSeg.
-    Leia cuidadosamente a apólice abaixo e preencha os campos do JSON seguindo estas regras:
-
-    - "seguradora": nome da seguradora (ex: KOVR Seguradora S.A).
-    - "numero": número da APÓLICE. Use o valor do campo "Apólice Número"
-      (ex: 1002300081517). NÃO use os campos "Ramo", "Número da Proposta" ou "Endosso".
-    - "cliente": nome do segurado.
-    - "placa": valor do campo "Licença" do veículo (se existir, senão deixe vazio).
-    
+    Leia cuidadosamente os trechos da apólice abaixo e preencha os campos do JSON seguindo estas regras:
+
+    {regras}
+
+    Deixe vazios os campos que não foram pedidos acima.
     Retorne somente o JSON válido.
 
-    TEXTO DA APÓLICE:
+    TRECHOS DA APÓLICE:
     {texto}
     {format_instructions}
     """
+MODELO_LLM = "gpt-4o-mini"
 
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm | parser
 
-    # Retorna o JSON validado para o Streamlit
-    return chain.invoke({
-        "texto": texto_completo,
+def _completar_com_llm(trechos: str, campos):
+    # LangChain só é carregado quando a IA é realmente necessária (layout desconhecido ou campo faltando)
+    from langchain_openai import ChatOpenAI
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import JsonOutputParser
+
+    llm = ChatOpenAI(model=MODELO_LLM, temperature=0)
+    parser = JsonOutputParser(pydantic_object=DadosApolice)
+
+    prompt = ChatPromptTemplate.from_template(TEMPLATE_PROMPT)
+    chain = prompt | llm | parser
+    resultado = chain.invoke({
+        "regras": "\n    ".join(REGRAS_CAMPOS_PROMPT[c] for c in campos),
+        "texto": trechos,
         "format_instructions": parser.get_format_instructions()
-    })
\ No newline at end of file
+    })
+    return {c: resultado.get(c, "") for c in campos}
+
+
+# ============================================================
+# 3. CACHE POR CONTEÚDO DO PDF
+# ============================================================
+
+# Incrementar ao mudar a lógica de extração de um jeito que o hash abaixo não capture
+EXTRATOR_VERSAO = "2"
+
+
+def versao_extrator() -> str:
+    """Hash de tudo que influencia o resultado: schema, prompt, modelo, regras e EXTRATOR_VERSAO."""
+    componentes = {
+        "versao": EXTRATOR_VERSAO,
+        "schema": DadosApolice.model_json_schema(),
+        "prompt": TEMPLATE_PROMPT,
+        "regras_prompt": REGRAS_CAMPOS_PROMPT,
+        "modelo": MODELO_LLM,
+        "padroes": [p.pattern for l in LAYOUTS.values() for p in l['numero']]
+                   + [p.pattern for p in PADROES_NUMERO_GENERICOS + [PADRAO_PLACA, PADRAO_CLIENTE]],
+    }
+    return hashlib.sha256(json.dumps(componentes, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def extrair_dados_apolice(arquivo_pdf):
+    """
+    Como _extrair_dados_apolice, mas guardando o resultado por SHA-256 do PDF
+    (utils.cache_extracao): o mesmo arquivo enviado de novo volta na hora, sem custo de IA.
+    """
+    pdf_bytes = ler_bytes_pdf(arquivo_pdf)
+    sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+    versao = versao_extrator()
+
+    resultado = cache_extracao.obter(sha256, versao)
+    if resultado is not None:
+        return resultado
+
+    resultado = _extrair_dados_apolice(pdf_bytes)
+    cache_extracao.gravar(sha256, versao, resultado)
+    return resultado
+
+
+def _extrair_dados_apolice(arquivo_pdf):
+    """
+    Lê a apólice e devolve {'seguradora', 'numero', 'cliente', 'placa'} para o formulário,
+    mais 'confianca' (0 a 1, só das regras) e 'campos_ia' (campos que precisaram da IA).
+
+    As regras cobrem os layouts KOVR e ESSOR; a IA só é chamada para os campos obrigatórios
+    que faltaram (ou para todos, em layout desconhecido), recebendo apenas os trechos relevantes.
+    """
+    with abrir_pdf(arquivo_pdf) as documento:
+        dados, confianca = {}, 0.0
+        for quantidade in range(1, min(REGRAS_MAX_PAGINAS, len(documento)) + 1):
+            dados, confianca = extrair_por_regras(documento.texto_completo(max_paginas=quantidade))
+            if all(c in dados for c in CAMPOS_OBRIGATORIOS):
+                break
+
+        layout_conhecido = 'seguradora' in dados
+        faltando = [c for c in PESOS_CAMPOS if c not in dados
+                    and (c in CAMPOS_OBRIGATORIOS or not layout_conhecido)]
+        campos_ia = []
+        if faltando:
+            paginas = list(documento.paginas())
+            dados.update({c: v for c, v in _completar_com_llm(_trechos_relevantes(paginas, faltando),
+                                                              faltando).items() if v})
+            campos_ia = faltando
+
+    resultado = {c: dados.get(c, "") for c in PESOS_CAMPOS}
+    resultado.update(confianca=confianca, campos_ia=campos_ia)
+    return resultado
@@ -4,9 +4,6 @@ import os
 from datetime import datetime
 from dotenv import load_dotenv
 
-# Importa o módulo do agente de IA
-from agent_logic import executar_agente
-
 # --- CONFIGURAÇÃO DE AMBIENTE E SECRETS ---
 # O agendador precisa carregar as credenciais por conta própria
 # Força o carregamento do .env se não estiver no ambiente Streamlit
@@ -27,8 +24,11 @@ def executar_fluxo_de_cobranca():
     comando = "Execute o fluxo de trabalho de cobrança e envie os lembretes de vencimento de hoje."
 
     try:
-        # Chama a função principal do seu agente de IA
-        resultado = executar_agente(comando)
+        # Importado só aqui: o app.py importa este módulo no arranque e não deve pagar pelo agente
+        from agent_logic import executar_agente, thread_id_cobranca
+
+        # Chama a função principal do seu agente de IA (uma conversa por dia, separada dos clientes)
+        resultado = executar_agente(comando, thread_id=thread_id_cobranca())
 
         print(f"RESULTADO DO AGENTE: {resultado}")
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] FLUXO DE COBRANÇA CONCLUÍDO.")
@@ -37,22 +37,24 @@ def executar_fluxo_de_cobranca():
         print(f"ERRO CRÍTICO no Agendador ao executar o agente: {e}")
 
 
-# --- CONFIGURAÇÃO DO AGENDAMENTO (SCHEDULE) ---
+# --- LOOP PRINCIPAL DO AGENDADOR ---
 
-# Agende a função para rodar todos os dias úteis (Monday a Friday) às 09:00 AM (fuso horário local do Streamlit/servidor)
-# Ajuste o horário conforme o fuso horário da sua corretora e o melhor horário para o lembrete.
-schedule.every().day.at("09:00").do(executar_fluxo_de_cobranca)
-# Você pode agendar para mais vezes:
-# schedule.every(10).minutes.do(executar_fluxo_de_cobranca)
+if __name__ == '__main__':
+    # --- CONFIGURAÇÃO DO AGENDAMENTO (SCHEDULE) ---
+    # Só ao rodar este arquivo diretamente; no Streamlit quem agenda é o agendador_loop do app.py
+    # (antes o import também agendava aqui, e a tarefa acabava registrada duas vezes).
 
-print("=" * 80)
-print(f"Agendador configurado para rodar a tarefa diariamente às 09:00.")
-print(f"Verificando agora para ver se a tarefa deve ser executada...")
-print("=" * 80 + "\n")
+    # Agende a função para rodar todos os dias úteis (Monday a Friday) às 09:00 AM (fuso horário local do Streamlit/servidor)
+    # Ajuste o horário conforme o fuso horário da sua corretora e o melhor horário para o lembrete.
+    schedule.every().day.at("09:00").do(executar_fluxo_de_cobranca)
+    # Você pode agendar para mais vezes:
+    # schedule.every(10).minutes.do(executar_fluxo_de_cobranca)
 
-# --- LOOP PRINCIPAL DO AGENDADOR ---
+    print("=" * 80)
+    print(f"Agendador configurado para rodar a tarefa diariamente às 09:00.")
+    print(f"Verificando agora para ver se a tarefa deve ser executada...")
+    print("=" * 80 + "\n")
 
-if __name__ == '__main__':
     # Esta parte é importante. No ambiente de produção do Streamlit,
     # um script rodando o tempo todo não é ideal, mas para fins de teste
     # e simulação, o loop abaixo manterá o agendador ativo.
@@ -0,0 +1,127 @@
+-- Salva a edição de uma apólice e reconcilia o cronograma de parcelas numa única transação.
+-- Usado por app.update_apolice via supabase.rpc(). Executar no SQL Editor do Supabase.
+--
+-- p_dados:    colunas da apólice a alterar (chaves ausentes mantêm o valor atual). Só as colunas
+--             do UPDATE abaixo são aceitas; qualquer outra chave gera erro, em vez de ser ignorada.
+--             Coluna nova editável = incluir no UPDATE e em v_colunas_editaveis.
+-- p_parcelas: cronograma novo, [{"numero_parcela": 1, "data_vencimento": "2025-01-10", "valor": 150.0}, ...]
+--
+-- A comparação é feita por numero_parcela:
+--   * parcela nova                   -> INSERT como 'Pendente'
+--   * data ou valor diferente        -> UPDATE só dessas colunas
+--   * fora do cronograma novo        -> DELETE
+-- Parcelas com status 'Pago' nunca são alteradas nem apagadas (status e data_pagamento preservados).
+
+create unique index if not exists parcelas_apolice_numero_idx
+    on public.parcelas (apolice_id, numero_parcela);
+
+create or replace function public.atualizar_apolice_com_parcelas(
+    p_apolice_id bigint,
+    p_dados jsonb,
+    p_parcelas jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_novo public.apolices;
+    v_inseridas integer;
+    v_atualizadas integer;
+    v_removidas integer;
+    v_colunas_editaveis text[] := array[
+        'seguradora', 'cliente', 'numero_apolice', 'placa', 'tipo_seguro', 'tipo_cobranca',
+        'valor_parcela', 'comissao', 'data_inicio_vigencia', 'quantidade_parcelas', 'dia_vencimento',
+        'contato', 'email', 'observacoes', 'caminho_pdf_apolice', 'caminho_pdf_boletos', 'data_atualizacao'
+    ];
+    v_nao_suportadas text;
+begin
+    -- 0. Recusa chaves que o UPDATE abaixo não grava (seriam descartadas em silêncio)
+    select string_agg(k, ', ' order by k)
+      into v_nao_suportadas
+      from jsonb_object_keys(coalesce(p_dados, '{}'::jsonb)) as k
+     where k <> all (v_colunas_editaveis);
+
+    if v_nao_suportadas is not null then
+        raise exception 'Colunas não suportadas em p_dados: %', v_nao_suportadas;
+    end if;
+
+    -- 1. Apólice: linha atual + campos enviados
+    select jsonb_populate_record(null::public.apolices, to_jsonb(a) || coalesce(p_dados, '{}'::jsonb))
+      into v_novo
+      from public.apolices a
+     where a.id = p_apolice_id
+       for update;
+
+    if not found then
+        raise exception 'Apólice % não encontrada', p_apolice_id;
+    end if;
+
+    update public.apolices
+       set seguradora = v_novo.seguradora,
+           cliente = v_novo.cliente,
+           numero_apolice = v_novo.numero_apolice,
+           placa = v_novo.placa,
+           tipo_seguro = v_novo.tipo_seguro,
+           tipo_cobranca = v_novo.tipo_cobranca,
+           valor_parcela = v_novo.valor_parcela,
+           comissao = v_novo.comissao,
+           data_inicio_vigencia = v_novo.data_inicio_vigencia,
+           quantidade_parcelas = v_novo.quantidade_parcelas,
+           dia_vencimento = v_novo.dia_vencimento,
+           contato = v_novo.contato,
+           email = v_novo.email,
+           observacoes = v_novo.observacoes,
+           caminho_pdf_apolice = v_novo.caminho_pdf_apolice,
+           caminho_pdf_boletos = v_novo.caminho_pdf_boletos,
+           data_atualizacao = coalesce((p_dados ->> 'data_atualizacao')::timestamptz, now())
+     where id = p_apolice_id
+    returning * into v_novo;
+
+    -- 2. Parcelas: aplica só a diferença
+    with novas as (
+        select (x ->> 'numero_parcela')::integer as numero_parcela,
+               (x ->> 'data_vencimento')::date as data_vencimento,
+               (x ->> 'valor')::numeric as valor
+          from jsonb_array_elements(coalesce(p_parcelas, '[]'::jsonb)) as x
+    ),
+    removidas as (
+        delete from public.parcelas p
+         where p.apolice_id = p_apolice_id
+           and p.status is distinct from 'Pago'
+           and not exists (select 1 from novas n where n.numero_parcela = p.numero_parcela)
+        returning 1
+    ),
+    atualizadas as (
+        update public.parcelas p
+           set data_vencimento = n.data_vencimento,
+               valor = n.valor
+          from novas n
+         where p.apolice_id = p_apolice_id
+           and p.numero_parcela = n.numero_parcela
+           and p.status is distinct from 'Pago'
+           and (p.data_vencimento, p.valor) is distinct from (n.data_vencimento, n.valor)
+        returning 1
+    ),
+    inseridas as (
+        insert into public.parcelas (apolice_id, numero_parcela, data_vencimento, valor, status)
+        select p_apolice_id, n.numero_parcela, n.data_vencimento, n.valor, 'Pendente'
+          from novas n
+         where not exists (
+                   select 1 from public.parcelas p
+                    where p.apolice_id = p_apolice_id and p.numero_parcela = n.numero_parcela
+               )
+        returning 1
+    )
+    select (select count(*) from inseridas),
+           (select count(*) from atualizadas),
+           (select count(*) from removidas)
+      into v_inseridas, v_atualizadas, v_removidas;
+
+    return jsonb_build_object(
+        'apolice', to_jsonb(v_novo),
+        'inseridas', v_inseridas,
+        'atualizadas', v_atualizadas,
+        'removidas', v_removidas
+    );
+end;
+$$;
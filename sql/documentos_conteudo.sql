@@ -0,0 +1,32 @@
+-- Índice de documentos por conteúdo (SHA-256), usado por utils.storage para não reenviar
+-- ficheiros que já estão no Storage. Executar no SQL Editor do Supabase.
+
+-- Um registro por objeto físico no Storage
+create table if not exists public.documentos (
+    id bigint generated by default as identity primary key,
+    sha256 text not null,
+    bucket text not null,
+    caminho text not null,
+    url text not null,
+    tamanho bigint,
+    content_type text,
+    criado_em timestamptz not null default now(),
+    unique (bucket, sha256)
+);
+
+-- Quem usa cada documento (apólice, carnê, sinistro...); vários registros podem apontar para o mesmo sha256
+create table if not exists public.documentos_referencias (
+    id bigint generated by default as identity primary key,
+    sha256 text not null,
+    bucket text not null,
+    tipo_pasta text not null,
+    numero_referencia text,
+    cliente text,
+    nome_original text,
+    criado_em timestamptz not null default now()
+);
+
+create index if not exists documentos_referencias_sha_idx
+    on public.documentos_referencias (bucket, sha256);
+create index if not exists documentos_referencias_ref_idx
+    on public.documentos_referencias (tipo_pasta, numero_referencia);
@@ -0,0 +1,86 @@
+-- Linha digitável de cada parcela, extraída do carnê uma única vez no upload
+-- (utils.supabase_client.gravar_boletos_do_carne e backfill_boletos.py).
+-- Executar no SQL Editor do Supabase.
+
+alter table public.parcelas add column if not exists linha_digitavel text;
+alter table public.parcelas add column if not exists pagina_boleto integer;
+
+-- p_boletos: [{"data_vencimento": "2025-01-10", "linha": "23790.12345 ...", "pagina": 1}, ...]
+--
+-- O casamento é pelo vencimento, com a mesma regra de utils.pdf_parser.vencimento_correspondente:
+-- o boleto de mesma data; senão o único a até 5 dias (vencimento empurrado para dia útil);
+-- senão o único do mesmo mês. Casamento ambíguo não grava nada.
+-- As linhas gravadas antes para a apólice são limpas primeiro, para que um carnê substituído
+-- (ou um cronograma alterado) nunca deixe código de outro boleto.
+--
+-- Retorna {"gravadas": n, "sem_boleto": [{"id", "numero_parcela", "data_vencimento"}, ...]},
+-- com as parcelas pendentes que ficaram sem código.
+
+-- O tipo de retorno mudou (integer -> jsonb): a versão anterior precisa sair antes
+drop function if exists public.gravar_boletos_parcelas(bigint, jsonb);
+
+create or replace function public.gravar_boletos_parcelas(
+    p_apolice_id bigint,
+    p_boletos jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_gravadas integer;
+    v_sem_boleto jsonb;
+begin
+    update public.parcelas
+       set linha_digitavel = null, pagina_boleto = null
+     where apolice_id = p_apolice_id
+       and linha_digitavel is not null;
+
+    with boletos as (
+        select *
+          from jsonb_to_recordset(coalesce(p_boletos, '[]'::jsonb))
+               as b(data_vencimento date, linha text, pagina integer)
+    ),
+    candidatos as (
+        select p.id as parcela_id, b.linha, b.pagina,
+               b.data_vencimento = p.data_vencimento as exato,
+               abs(b.data_vencimento - p.data_vencimento) <= 5 as proximo,
+               date_trunc('month', b.data_vencimento) = date_trunc('month', p.data_vencimento) as mesmo_mes
+          from public.parcelas p
+          join boletos b
+            on abs(b.data_vencimento - p.data_vencimento) <= 5
+            or date_trunc('month', b.data_vencimento) = date_trunc('month', p.data_vencimento)
+         where p.apolice_id = p_apolice_id
+    ),
+    -- Nível 0: mesma data; 1: até 5 dias; 2: mesmo mês. Vale o primeiro nível com um único boleto.
+    por_nivel as (
+        select c.parcela_id, n.nivel, count(*) as quantidade, min(c.linha) as linha, min(c.pagina) as pagina
+          from candidatos c
+          join (values (0), (1), (2)) as n(nivel)
+            on case n.nivel when 0 then c.exato when 1 then c.proximo else c.mesmo_mes end
+         group by c.parcela_id, n.nivel
+    ),
+    escolhidos as (
+        select distinct on (parcela_id) parcela_id, linha, pagina
+          from por_nivel
+         where quantidade = 1
+         order by parcela_id, nivel
+    )
+    update public.parcelas p
+       set linha_digitavel = e.linha, pagina_boleto = e.pagina
+      from escolhidos e
+     where p.id = e.parcela_id;
+
+    get diagnostics v_gravadas = row_count;
+
+    select coalesce(jsonb_agg(jsonb_build_object(
+               'id', id, 'numero_parcela', numero_parcela, 'data_vencimento', data_vencimento)
+               order by data_vencimento), '[]'::jsonb)
+      into v_sem_boleto
+      from public.parcelas
+     where apolice_id = p_apolice_id
+       and status = 'Pendente'
+       and linha_digitavel is null;
+
+    return jsonb_build_object('gravadas', v_gravadas, 'sem_boleto', v_sem_boleto);
+end;
+$$;
@@ -0,0 +1,35 @@
+-- Resumo do "Controle de Parcelas" do Dashboard numa única chamada.
+-- Usado por utils.supabase_client.buscar_resumo_dashboard via supabase.rpc().
+-- Executar no SQL Editor do Supabase.
+
+create index if not exists parcelas_status_vencimento_idx
+    on public.parcelas (status, data_vencimento);
+
+create or replace function public.resumo_dashboard_parcelas(p_inicio_semana date, p_fim_semana date)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        'total_apolices', (select count(*) from public.apolices),
+        'pendentes_quantidade', count(*),
+        'pendentes_valor', coalesce(sum(p.valor), 0),
+        'semana_quantidade', count(*) filter (where p.data_vencimento between p_inicio_semana and p_fim_semana),
+        'semana_detalhes', coalesce(
+            json_agg(
+                json_build_object(
+                    'cliente', a.cliente,
+                    'numero_apolice', a.numero_apolice,
+                    'numero_parcela', p.numero_parcela,
+                    'data_vencimento', p.data_vencimento,
+                    'valor', p.valor
+                )
+                order by p.data_vencimento
+            ) filter (where p.data_vencimento between p_inicio_semana and p_fim_semana),
+            '[]'::json
+        )
+    )
+    from public.parcelas p
+    left join public.apolices a on a.id = p.apolice_id
+    where p.status = 'Pendente';
+$$;
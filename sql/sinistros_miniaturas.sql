@@ -0,0 +1,3 @@
+-- Miniaturas das fotos da batida, na mesma ordem de caminhos_imagens_batida
+-- (posição nula quando a foto não pôde ser convertida, ex.: PDF).
+alter table sinistros add column if not exists caminhos_miniaturas_batida jsonb;
@@ -0,0 +1,57 @@
+"""
+Teste de regressão da extração por regras (extrair_dados_apolice.extrair_por_regras).
+
+Cada caso é um trecho de texto de apólice e o que as regras devem devolver. Não usa IA,
+banco nem PDF: roda em qualquer máquina e sai com código 1 se algum caso falhar.
+
+Uso:
+    python teste_extracao_regras.py
+"""
+import sys
+
+from extrair_dados_apolice import extrair_por_regras
+
+# (descrição, texto, campos esperados; None = o campo não pode ser preenchido pelas regras)
+CASOS = [
+    ("cabeçalho 'DADOS DO SEGURADO' seguido de 'Nome:'",
+     "DADOS DO SEGURADO\nNome: JOSE DA SILVA CPF: 123",
+     {'cliente': None}),
+    ("cabeçalho 'Dados do Segurado' seguido de 'Segurado:'",
+     "Dados do Segurado\nSegurado: TRANSPORTES XYZ LTDA",
+     {'cliente': "TRANSPORTES XYZ LTDA"}),
+    ("cabeçalho 'Dados da Segurado(a)' seguido de outro campo",
+     "Dados da Segurado(a)\nVeículo: ONIBUS",
+     {'cliente': None}),
+    ("rótulo sozinho e 'Nome:' na linha seguinte",
+     "Segurado\nNome: MARIA SOUZA",
+     {'cliente': "MARIA SOUZA"}),
+    ("layout KOVR completo",
+     "KOVR Seguradora\nApólice Número: 1002300081517\nNome do Segurado: JOAO PEREIRA CPF 111\nLicença: ABC1D23",
+     {'seguradora': "KOVR Seguradora S.A.", 'numero': "1002300081517", 'cliente': "JOAO PEREIRA",
+      'placa': "ABC1D23"}),
+    ("layout ESSOR com rótulo 'Segurado(a)'",
+     "ESSOR Seguros\nNº da Apólice: 12.345.678\nSegurado(a): ANA LIMA\nPlaca: XYZ-1234",
+     {'seguradora': "ESSOR Seguros S.A.", 'numero': "12345678", 'cliente': "ANA LIMA", 'placa': "XYZ1234"}),
+]
+
+
+def main():
+    falhas = 0
+    for descricao, texto, esperado in CASOS:
+        dados, _ = extrair_por_regras(texto)
+        erros = [f"{campo}: esperado {valor!r}, veio {dados.get(campo)!r}"
+                 for campo, valor in esperado.items() if dados.get(campo) != valor]
+        if erros:
+            falhas += 1
+            print(f"✗ {descricao}\n    " + "\n    ".join(erros))
+        else:
+            print(f"✓ {descricao}")
+
+    if falhas:
+        print(f"\n{falhas} de {len(CASOS)} caso(s) falharam.")
+        sys.exit(1)
+    print(f"\nTodos os {len(CASOS)} casos passaram.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Teste do roteador determinístico do agente (agent_logic._responder_por_regras).
+
+Troca as consultas ao banco por dados fixos e confere, para cada mensagem, a resposta do
+roteador e quantas consultas ele fez: nenhuma quando a mensagem segue para o LangGraph e no
+máximo uma de cada quando responde. Não usa IA nem banco; sai com código 1 se algum caso falhar.
+
+Uso:
+    python teste_roteador_agente.py
+"""
+import sys
+from collections import Counter
+
+import agent_logic
+
+APOLICE = {'numero_apolice': "1002300081517", 'cliente': "JOAO PEREIRA", 'placa': "ABC1D23",
+           'seguradora': "KOVR", 'data_inicio_vigencia': "2025-01-10", 'status': "Ativa"}
+
+chamadas = Counter()
+
+
+def _buscar_apolice(termo):
+    chamadas['apolice'] += 1
+    return [APOLICE] if termo in (APOLICE['numero_apolice'], APOLICE['placa']) else []
+
+
+def _buscar_parcela(numero_apolice, mes_referencia=0):
+    chamadas['boleto'] += 1
+    return None
+
+
+agent_logic.buscar_apolice_inteligente = _buscar_apolice
+agent_logic.buscar_parcela_atual = _buscar_parcela
+
+# (descrição, mensagem, trecho esperado na resposta ou None = segue ao LangGraph, consultas esperadas)
+CASOS = [
+    ("'dados da apólice N' traz a apólice, não o boleto",
+     "dados da apólice 1002300081517", "JOAO PEREIRA", {'apolice': 1}),
+    ("número de apólice sem boleto pendente",
+     "boleto da apólice 1002300081517", "Não encontrei boletos pendentes", {'boleto': 1}),
+    ("placa pedindo boleto consulta a apólice e depois o boleto",
+     "boleto placa ABC1D23", "Não encontrei boletos pendentes", {'apolice': 1, 'boleto': 1}),
+    ("número desconhecido",
+     "apólice 9999999999", "Não encontrei nenhuma apólice", {'apolice': 1}),
+    ("conversa livre segue ao LangGraph sem consultar nada",
+     "quero cancelar meu seguro 1002300081517", None, {}),
+]
+
+
+def main():
+    falhas = 0
+    for descricao, mensagem, esperado, consultas in CASOS:
+        chamadas.clear()
+        resposta = agent_logic._responder_por_regras(mensagem)
+        erros = []
+        if esperado is None and resposta is not None:
+            erros.append(f"esperado seguir ao LangGraph, veio {resposta!r}")
+        elif esperado is not None and (resposta is None or esperado not in resposta):
+            erros.append(f"esperado {esperado!r} na resposta, veio {resposta!r}")
+        if dict(chamadas) != consultas:
+            erros.append(f"consultas: esperado {consultas}, veio {dict(chamadas)}")
+        if erros:
+            falhas += 1
+            print(f"✗ {descricao}\n    " + "\n    ".join(erros))
+        else:
+            print(f"✓ {descricao}")
+
+    if falhas:
+        print(f"\n{falhas} de {len(CASOS)} caso(s) falharam.")
+        sys.exit(1)
+    print(f"\nTodos os {len(CASOS)} casos passaram.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Teste de regressão do tempo de importação das dependências do app.py.
+
+Roda um Python novo com -X importtime, importa os módulos que o app.py carrega no
+arranque e falha (código de saída 1) se:
+  - o tempo total passar do orçamento, ou
+  - algum módulo pesado que deveria ser carregado só sob demanda (LangChain, LangGraph,
+    OpenAI) aparecer na lista de importados.
+
+Uso:
+    python teste_tempo_importacao.py [--orcamento-ms 2500] [--detalhes 15]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# O que o app.py importa no topo (o próprio app.py executa comandos do Streamlit e não é importável fora dele)
+MODULOS_DO_APP = [
+    "scheduler",
+    "agent_logic",
+    "extrair_dados_apolice",
+    "utils.supabase_client",
+    "utils.calendario_parcelas",
+    "utils.storage",
+    "utils.imagens",
+]
+# Prefixos que só podem ser carregados no primeiro uso do agente / da extração por IA
+MODULOS_PROIBIDOS = ("langchain", "langchain_core", "langchain_openai", "langgraph", "openai", "tiktoken")
+ORCAMENTO_PADRAO_MS = int(os.environ.get("ORCAMENTO_IMPORTACAO_MS", 2500))
+
+_LINHA_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def medir(codigo: str):
+    """[(modulo, cumulativo_us, nivel)] do -X importtime para o código informado."""
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", codigo],
+                              capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "falha")
+    registros = []
+    for linha in processo.stderr.splitlines():
+        match = _LINHA_IMPORTTIME.match(linha)
+        if match:
+            registros.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return registros
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orcamento-ms", type=int, default=ORCAMENTO_PADRAO_MS)
+    parser.add_argument("--detalhes", type=int, default=15, help="quantos módulos mais lentos listar")
+    args = parser.parse_args()
+
+    try:
+        # O que o interpretador já carrega sozinho (site, encodings...) não entra na conta
+        base = {modulo for modulo, _, _ in medir("pass")}
+        registros = medir("import " + ", ".join(MODULOS_DO_APP))
+    except RuntimeError as e:
+        print(f"✗ Não foi possível importar as dependências do app: {e}")
+        sys.exit(2)
+
+    raiz = [(m, us) for m, us, nivel in registros if nivel == 0 and m not in base]
+    total_ms = sum(us for _, us in raiz) / 1000
+    carregados = {m for m, _, _ in registros}
+    proibidos = sorted(m for m in carregados if m.split(".")[0] in MODULOS_PROIBIDOS)
+
+    print(f"Tempo de importação das dependências do app: {total_ms:.0f} ms (orçamento: {args.orcamento_ms} ms)")
+    print(f"\nMódulos mais lentos (cumulativo):")
+    for modulo, us in sorted(raiz, key=lambda r: r[1], reverse=True)[:args.detalhes]:
+        print(f"  {us / 1000:8.1f} ms  {modulo}")
+
+    falhou = False
+    if proibidos:
+        falhou = True
+        print(f"\n✗ Módulos pesados carregados no import (deveriam ser sob demanda): {', '.join(proibidos[:10])}"
+              + (" ..." if len(proibidos) > 10 else ""))
+    if total_ms > args.orcamento_ms:
+        falhou = True
+        print(f"\n✗ Orçamento estourado em {total_ms - args.orcamento_ms:.0f} ms.")
+
+    if falhou:
+        sys.exit(1)
+    print("\n✓ Dentro do orçamento.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+# ============================================================
+# CACHE PERSISTENTE DOS RESULTADOS DE extrair_dados_apolice
+# ============================================================
+#
+# Chave: SHA-256 do PDF + versão do extrator (hash do schema, do prompt e das regras).
+# Qualquer mudança no extrator gera outra versão. As linhas de versões antigas não são
+# apagadas de propósito (num deploy gradual, processos com código diferente dividem o
+# arquivo): deixam de ser usadas e saem pelo limite de CACHE_EXTRACAO_MAX_ITENS (LRU).
+
+CACHE_EXTRACAO_DB = os.environ.get("CACHE_EXTRACAO_DB",
+                                   os.path.join(tempfile.gettempdir(), "moreiraseg_extracao.sqlite3"))
+# Acima disso, os resultados usados há mais tempo são removidos
+CACHE_EXTRACAO_MAX_ITENS = int(os.environ.get("CACHE_EXTRACAO_MAX_ITENS", 2000))
+
+_lock = threading.Lock()
+_estatisticas = {"hits": 0, "misses": 0, "removidos_lru": 0}
+
+
+def _conectar() -> sqlite3.Connection:
+    pasta = os.path.dirname(CACHE_EXTRACAO_DB)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conn = sqlite3.connect(CACHE_EXTRACAO_DB, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS extracoes (
+            sha256 TEXT NOT NULL,
+            versao TEXT NOT NULL,
+            resultado TEXT NOT NULL,
+            criado_em REAL NOT NULL,
+            ultimo_uso REAL NOT NULL,
+            PRIMARY KEY (sha256, versao)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS extracoes_ultimo_uso_idx ON extracoes (ultimo_uso)")
+    return conn
+
+
+def obter(sha256: str, versao: str) -> Optional[Dict[str, Any]]:
+    """Resultado guardado para este PDF e esta versão do extrator, ou None."""
+    try:
+        with _lock, closing(_conectar()) as conn, conn:
+            linha = conn.execute("SELECT resultado FROM extracoes WHERE sha256 = ? AND versao = ?",
+                                 (sha256, versao)).fetchone()
+            if linha is None:
+                _estatisticas["misses"] += 1
+                return None
+            conn.execute("UPDATE extracoes SET ultimo_uso = ? WHERE sha256 = ? AND versao = ?",
+                         (time.time(), sha256, versao))
+            _estatisticas["hits"] += 1
+            return json.loads(linha[0])
+    except (sqlite3.Error, ValueError) as e:
+        # Cache indisponível nunca impede a extração
+        print(f"Aviso: cache de extração indisponível: {e}")
+        return None
+
+
+def gravar(sha256: str, versao: str, resultado: Dict[str, Any]) -> None:
+    try:
+        agora = time.time()
+        with _lock, closing(_conectar()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extracoes (sha256, versao, resultado, criado_em, ultimo_uso) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sha256, versao, json.dumps(resultado, ensure_ascii=False, default=str), agora, agora))
+            excedente = conn.execute("SELECT COUNT(*) FROM extracoes").fetchone()[0] - CACHE_EXTRACAO_MAX_ITENS
+            if excedente > 0:
+                conn.execute("DELETE FROM extracoes WHERE rowid IN "
+                             "(SELECT rowid FROM extracoes ORDER BY ultimo_uso LIMIT ?)", (excedente,))
+                _estatisticas["removidos_lru"] += excedente
+    except sqlite3.Error as e:
+        print(f"Aviso: não foi possível gravar no cache de extração: {e}")
+
+
+def estatisticas_cache_extracao() -> Dict[str, int]:
+    with _lock:
+        return dict(_estatisticas)
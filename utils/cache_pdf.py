@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ============================================================
+# CACHE EM DISCO DOS PDFs (CARNÊS E APÓLICES)
+# ============================================================
+
+CACHE_PDF_DIR = os.environ.get("CACHE_PDF_DIR", os.path.join(tempfile.gettempdir(), "moreiraseg_cache_pdf"))
+# Limite de espaço em disco; ao passar dele, os PDFs usados há mais tempo são apagados
+CACHE_PDF_MAX_MB = int(os.environ.get("CACHE_PDF_MAX_MB", 500))
+# Dentro desta janela o PDF é servido do disco sem perguntar nada ao servidor
+CACHE_PDF_FRESCOR_SEGUNDOS = int(os.environ.get("CACHE_PDF_FRESCOR_SEGUNDOS", 300))
+CACHE_PDF_TIMEOUT = 15
+
+# Objetos gravados por utils.storage em conteudo/<sha256>: o conteúdo nunca muda para o mesmo caminho
+_CAMINHO_IMUTAVEL = re.compile(r'(^|/)conteudo/[0-9a-f]{2}/[0-9a-f]{64}(\.[A-Za-z0-9]+)?($|\?)')
+
+_lock = threading.Lock()
+# bytes_economizados: tamanho dos PDFs servidos do disco (hits e revalidações 304) em vez de baixados
+_estatisticas = {"hits": 0, "revalidados": 0, "misses": 0, "erros": 0, "bytes_baixados": 0, "bytes_economizados": 0,
+                 "removidos_lru": 0}
+
+_sessao = None
+_sessao_lock = threading.Lock()
+
+
+def obter_sessao() -> requests.Session:
+    """Sessão HTTP única do processo: reaproveita conexões (keep-alive) e repete falhas transitórias."""
+    global _sessao
+    with _sessao_lock:
+        if _sessao is None:
+            sessao = requests.Session()
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(["GET", "HEAD"]))
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+def _contar(chave: str, quantidade: int = 1):
+    with _lock:
+        _estatisticas[chave] += quantidade
+
+
+def estatisticas_cache_pdf() -> Dict[str, float]:
+    """Contadores do processo, mais ocupação atual do diretório de cache."""
+    with _lock:
+        resultado = dict(_estatisticas)
+    consultas = resultado["hits"] + resultado["revalidados"] + resultado["misses"]
+    resultado["taxa_acerto"] = round((resultado["hits"] + resultado["revalidados"]) / consultas, 3) if consultas else 0.0
+    arquivos = _arquivos_do_cache()
+    resultado["arquivos"] = len(arquivos)
+    resultado["ocupacao_mb"] = round(sum(tamanho for _, _, tamanho in arquivos) / 1024 ** 2, 2)
+    return resultado
+
+
+def eh_imutavel(caminho_ou_url: str) -> bool:
+    return bool(_CAMINHO_IMUTAVEL.search(str(caminho_ou_url)))
+
+
+def _caminhos(chave: str):
+    nome = hashlib.sha256(chave.encode("utf-8")).hexdigest()
+    base = os.path.join(CACHE_PDF_DIR, nome[:2], nome)
+    return base + ".pdf", base + ".json"
+
+
+def _ler(chave: str):
+    caminho_pdf, caminho_meta = _caminhos(chave)
+    try:
+        with open(caminho_meta, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(caminho_pdf, "rb") as f:
+            conteudo = f.read()
+    except (OSError, ValueError):
+        return None, None
+    if meta.get("tamanho") != len(conteudo):
+        # Gravação interrompida ou arquivo mexido por fora: trata como ausente
+        return None, None
+    return conteudo, meta
+
+
+def _gravar_atomico(destino: str, dados: bytes):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+    try:
+        with os.fdopen(descritor, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, destino)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+def _gravar(chave: str, conteudo: bytes, etag: str = None, last_modified: str = None):
+    caminho_pdf, caminho_meta = _caminhos(chave)
+    meta = {"chave": chave, "etag": etag, "last_modified": last_modified,
+            "tamanho": len(conteudo), "verificado_em": time.time()}
+    try:
+        _gravar_atomico(caminho_pdf, conteudo)
+        _gravar_atomico(caminho_meta, json.dumps(meta).encode("utf-8"))
+    except OSError as e:
+        print(f"Aviso: não foi possível gravar o PDF no cache local: {e}")
+        return
+    _aplicar_limite_lru()
+
+
+def _marcar_verificado(chave: str, meta: dict):
+    """Renova a janela de frescor depois de um 304 e marca o uso para o LRU."""
+    caminho_pdf, caminho_meta = _caminhos(chave)
+    meta["verificado_em"] = time.time()
+    try:
+        _gravar_atomico(caminho_meta, json.dumps(meta).encode("utf-8"))
+        os.utime(caminho_pdf, None)
+    except OSError:
+        pass
+
+
+def _tocar(chave: str):
+    # A data de modificação do .pdf é o "último uso" do LRU
+    try:
+        os.utime(_caminhos(chave)[0], None)
+    except OSError:
+        pass
+
+
+def _arquivos_do_cache():
+    """[(caminho_pdf, ultimo_uso, tamanho)] de tudo que está no diretório."""
+    arquivos = []
+    if not os.path.isdir(CACHE_PDF_DIR):
+        return arquivos
+    for pasta, _, nomes in os.walk(CACHE_PDF_DIR):
+        for nome in nomes:
+            if nome.endswith(".pdf"):
+                caminho = os.path.join(pasta, nome)
+                try:
+                    info = os.stat(caminho)
+                except OSError:
+                    continue
+                arquivos.append((caminho, info.st_mtime, info.st_size))
+    return arquivos
+
+
+def _aplicar_limite_lru():
+    limite = CACHE_PDF_MAX_MB * 1024 ** 2
+    arquivos = _arquivos_do_cache()
+    ocupado = sum(tamanho for _, _, tamanho in arquivos)
+    if ocupado <= limite:
+        return
+    for caminho, _, tamanho in sorted(arquivos, key=lambda a: a[1]):
+        if ocupado <= limite:
+            break
+        for arquivo in (caminho, caminho[:-len(".pdf")] + ".json"):
+            try:
+                os.remove(arquivo)
+            except OSError:
+                pass
+        ocupado -= tamanho
+        _contar("removidos_lru")
+
+
+def _fresco(meta: dict, chave: str) -> bool:
+    if eh_imutavel(chave):
+        return True
+    return time.time() - float(meta.get("verificado_em") or 0) < CACHE_PDF_FRESCOR_SEGUNDOS
+
+
+def _baixar_url(url: str, conteudo_cache: Optional[bytes], meta: Optional[dict]) -> Optional[bytes]:
+    cabecalhos = {}
+    if meta:
+        if meta.get("etag"):
+            cabecalhos["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            cabecalhos["If-Modified-Since"] = meta["last_modified"]
+
+    response = obter_sessao().get(url, headers=cabecalhos, timeout=CACHE_PDF_TIMEOUT)
+    if response.status_code == 304 and conteudo_cache is not None:
+        _contar("revalidados")
+        _contar("bytes_economizados", len(conteudo_cache))
+        _marcar_verificado(url, meta)
+        return conteudo_cache
+    if response.status_code != 200:
+        return None
+
+    _contar("misses")
+    _contar("bytes_baixados", len(response.content))
+    _gravar(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    return response.content
+
+
+def obter_pdf(caminho_ou_url: str, baixar_do_storage: Callable[[str], bytes]) -> Optional[bytes]:
+    """
+    Devolve o PDF do cache local ou o baixa (e guarda) quando necessário.
+
+    URLs http(s) são revalidadas com ETag/Last-Modified depois da janela de frescor;
+    caminhos do Storage (sem cabeçalhos de validação) são baixados de novo com 'baixar_do_storage'.
+    Objetos endereçados por conteúdo (conteudo/<sha256>) nunca expiram.
+    """
+    chave = str(caminho_ou_url)
+    conteudo, meta = _ler(chave)
+    if conteudo is not None and _fresco(meta, chave):
+        _contar("hits")
+        _contar("bytes_economizados", len(conteudo))
+        _tocar(chave)
+        return conteudo
+
+    try:
+        if chave.startswith("http"):
+            return _baixar_url(chave, conteudo, meta)
+
+        novo = baixar_do_storage(chave)
+        if not novo:
+            return None
+        _contar("misses")
+        _contar("bytes_baixados", len(novo))
+        _gravar(chave, novo)
+        return novo
+    except Exception as e:
+        _contar("erros")
+        if conteudo is not None:
+            # Servidor fora do ar: melhor um carnê possivelmente desatualizado do que nenhum
+            print(f"Aviso: revalidação do PDF falhou, usando a cópia local: {e}")
+            return conteudo
+        return None
+
+
+def limpar_cache_pdf():
+    for caminho, _, _ in _arquivos_do_cache():
+        for arquivo in (caminho, caminho[:-len(".pdf")] + ".json"):
+            try:
+                os.remove(arquivo)
+            except OSError:
+                pass
@@ -0,0 +1,132 @@
+import os
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Faixa de anos coberta pelo calendário de feriados embutido
+ANO_INICIAL_FERIADOS = 2015
+ANO_FINAL_FERIADOS = 2050
+
+# Se True, vencimentos que caem em sábado, domingo ou feriado passam para o próximo dia útil
+AJUSTAR_VENCIMENTO_DIA_UTIL = os.environ.get("AJUSTAR_VENCIMENTO_DIA_UTIL", "false").lower() in ("1", "true", "sim")
+
+# (mês, dia, nome)
+FERIADOS_FIXOS_NACIONAIS = [
+    (1, 1, "Confraternização Universal"),
+    (4, 21, "Tiradentes"),
+    (5, 1, "Dia do Trabalho"),
+    (9, 7, "Independência do Brasil"),
+    (10, 12, "Nossa Senhora Aparecida"),
+    (11, 2, "Finados"),
+    (11, 15, "Proclamação da República"),
+    (12, 25, "Natal"),
+]
+# Feriados locais da praça de Goiânia/GO, onde fica a corretora
+FERIADOS_FIXOS_GOIAS = [
+    (10, 24, "Aniversário de Goiânia"),
+]
+# (dias em relação ao Domingo de Páscoa, nome) — Carnaval é ponto facultativo, mas os bancos não abrem
+FERIADOS_MOVEIS = [
+    (-48, "Carnaval (segunda-feira)"),
+    (-47, "Carnaval (terça-feira)"),
+    (-2, "Sexta-feira Santa"),
+    (60, "Corpus Christi"),
+]
+
+
+def domingo_de_pascoa(ano: int) -> date:
+    """Algoritmo de Meeus/Jones/Butcher (calendário gregoriano)."""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(ano, mes, dia + 1)
+
+
+def feriados(ano_inicio: int = ANO_INICIAL_FERIADOS, ano_fim: int = ANO_FINAL_FERIADOS) -> Dict[date, str]:
+    """Feriados nacionais e de Goiânia/GO entre os anos informados (inclusive)."""
+    resultado = {}
+    for ano in range(ano_inicio, ano_fim + 1):
+        for mes, dia, nome in FERIADOS_FIXOS_NACIONAIS + FERIADOS_FIXOS_GOIAS:
+            resultado[date(ano, mes, dia)] = nome
+        if ano >= 2024:
+            # Lei 14.759/2023
+            resultado[date(ano, 11, 20)] = "Dia Nacional de Zumbi e da Consciência Negra"
+        pascoa = domingo_de_pascoa(ano)
+        for deslocamento, nome in FERIADOS_MOVEIS:
+            resultado[pascoa + timedelta(days=deslocamento)] = nome
+    return resultado
+
+
+@lru_cache(maxsize=1)
+def calendario_dias_uteis() -> np.busdaycalendar:
+    """Calendário de segunda a sexta sem os feriados embutidos, para as funções np.busday_*."""
+    return np.busdaycalendar(weekmask="1111100", holidays=sorted(feriados()))
+
+
+def eh_dia_util(data: date) -> bool:
+    return bool(np.is_busday(np.datetime64(data, "D"), busdaycal=calendario_dias_uteis()))
+
+
+def adicionar_dias_uteis(data_inicial: date, dias_uteis: int) -> date:
+    """Data 'dias_uteis' dias úteis depois de 'data_inicial' (fins de semana e feriados não contam)."""
+    # roll='backward' reproduz a contagem "a partir do dia seguinte" quando a data inicial não é útil
+    resultado = np.busday_offset(np.datetime64(data_inicial, "D"), dias_uteis, roll="backward",
+                                 busdaycal=calendario_dias_uteis())
+    return resultado.item()
+
+
+def gerar_cronogramas(vencimentos_primeira: Sequence, dias_vencimento_demais: Sequence[int],
+                      quantidades: Sequence[int], ajustar_dia_util: bool = None) -> pd.DataFrame:
+    """
+    Gera, de uma vez, o cronograma de parcelas de várias apólices.
+
+    Regra (a mesma da tela de edição): a 1ª parcela vence em 'vencimento_primeira'; a parcela
+    i (i >= 1) vence no 'dia_vencimento_demais' do i-ésimo mês seguinte, limitado ao último dia
+    do mês (31 vira 28/29 em fevereiro). Com 'ajustar_dia_util', datas que caem em fim de
+    semana ou feriado passam para o próximo dia útil.
+
+    Retorna um DataFrame com 'indice' (posição da apólice nas entradas), 'numero_parcela'
+    (1..n) e 'data_vencimento' (datetime64[D]).
+    """
+    if ajustar_dia_util is None:
+        ajustar_dia_util = AJUSTAR_VENCIMENTO_DIA_UTIL
+
+    primeira = np.asarray(pd.to_datetime(pd.Series(vencimentos_primeira)).to_numpy(), dtype="datetime64[D]")
+    dias = np.asarray(dias_vencimento_demais, dtype=np.int64)
+    quantidades = np.asarray(quantidades, dtype=np.int64)
+
+    indice = np.repeat(np.arange(len(quantidades)), quantidades)
+    # Posição de cada parcela dentro da sua apólice (0, 1, 2, ... reiniciando a cada apólice)
+    posicao = np.arange(quantidades.sum()) - np.repeat(np.cumsum(quantidades) - quantidades, quantidades)
+
+    mes = primeira[indice].astype("datetime64[M]") + posicao.astype("timedelta64[M]")
+    inicio_mes = mes.astype("datetime64[D]")
+    dias_no_mes = ((mes + 1).astype("datetime64[D]") - inicio_mes).astype(np.int64)
+    vencimento = inicio_mes + (np.minimum(dias[indice], dias_no_mes) - 1).astype("timedelta64[D]")
+    vencimento = np.where(posicao == 0, primeira[indice], vencimento)
+
+    if ajustar_dia_util:
+        vencimento = np.busday_offset(vencimento, 0, roll="forward", busdaycal=calendario_dias_uteis())
+
+    return pd.DataFrame({
+        "indice": indice,
+        "numero_parcela": posicao + 1,
+        "data_vencimento": vencimento,
+    })
+
+
+def gerar_cronograma(vencimento_primeira: date, dia_vencimento_demais: int, quantidade: int,
+                     ajustar_dia_util: bool = None) -> List[date]:
+    """Cronograma de uma única apólice, como lista de datas (ver gerar_cronogramas)."""
+    cronograma = gerar_cronogramas([vencimento_primeira], [dia_vencimento_demais], [quantidade], ajustar_dia_util)
+    return [d.date() for d in pd.to_datetime(cronograma["data_vencimento"])]
@@ -0,0 +1,159 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import STATUS_READY
+
+logger = logging.getLogger(__name__)
+
+
+class PoolEsgotadoError(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera configurado."""
+
+
+class PoolConexoes:
+    """
+    Pool de conexões PostgreSQL compartilhado entre as threads da API.
+
+    Envolve o ThreadedConnectionPool do psycopg2 com:
+    - espera limitada quando todas as conexões estão em uso (o psycopg2 falha na hora);
+    - verificação de saúde no checkout (conexão fechada ou ociosa há muito tempo é testada);
+    - contadores de uso e de tempo de espera para dimensionar min/max.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout_espera: float = 10.0,
+                 ping_apos_segundos: float = 30.0, **parametros_conexao):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout_espera = timeout_espera
+        self.ping_apos_segundos = ping_apos_segundos
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **parametros_conexao)
+        self._vagas = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._ultimo_uso = {}  # id(conn) -> time.monotonic() da devolução
+        self._em_uso = 0
+        self._pico_em_uso = 0
+        self._checkouts = 0
+        self._espera_total = 0.0
+        self._espera_maxima = 0.0
+        self._timeouts = 0
+        self._descartadas = 0
+
+    @classmethod
+    def a_partir_do_ambiente(cls):
+        """Cria o pool com as variáveis de ambiente do Cloud Run (KeyError se faltar alguma obrigatória)."""
+        return cls(
+            minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+            maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+            timeout_espera=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+            ping_apos_segundos=float(os.environ.get("DB_POOL_PING_SEGUNDOS", 30)),
+            host=os.environ["DB_HOST"],
+            dbname=os.environ["DB_NAME"],
+            user=os.environ["DB_USER"],
+            password=os.environ["DB_PASS"],
+            port=os.environ.get("DB_PORT", 5432),
+        )
+
+    def _conexao_saudavel(self, conn) -> bool:
+        if conn.closed:
+            return False
+        ultimo_uso = self._ultimo_uso.get(id(conn))
+        if ultimo_uso is not None and time.monotonic() - ultimo_uso < self.ping_apos_segundos:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def obter(self):
+        """Retira uma conexão saudável do pool, esperando no máximo 'timeout_espera' segundos."""
+        inicio = time.monotonic()
+        if not self._vagas.acquire(timeout=self.timeout_espera):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolEsgotadoError(f"Nenhuma conexão livre após {self.timeout_espera}s.")
+        espera = time.monotonic() - inicio
+
+        try:
+            conn = self._pool.getconn()
+            # Uma nova tentativa basta: a conexão substituta é recém-aberta pelo pool
+            if not self._conexao_saudavel(conn):
+                self._descartar(conn)
+                conn = self._pool.getconn()
+                if not self._conexao_saudavel(conn):
+                    self._descartar(conn)
+                    raise psycopg2.OperationalError("Conexão com o banco de dados indisponível.")
+        except Exception:
+            self._vagas.release()
+            raise
+
+        with self._lock:
+            self._em_uso += 1
+            self._pico_em_uso = max(self._pico_em_uso, self._em_uso)
+            self._checkouts += 1
+            self._espera_total += espera
+            self._espera_maxima = max(self._espera_maxima, espera)
+        return conn
+
+    def _descartar(self, conn):
+        self._ultimo_uso.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self._descartadas += 1
+
+    def devolver(self, conn):
+        """Devolve a conexão ao pool, desfazendo qualquer transação deixada aberta."""
+        try:
+            if not conn.closed and conn.status != STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            pass
+
+        try:
+            if conn.closed:
+                self._descartar(conn)
+            else:
+                self._ultimo_uso[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            with self._lock:
+                self._em_uso -= 1
+            self._vagas.release()
+
+    @contextmanager
+    def conexao(self):
+        """Context manager: commit ao sair normalmente, rollback em caso de erro."""
+        conn = self.obter()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.devolver(conn)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "em_uso": self._em_uso,
+                "pico_em_uso": self._pico_em_uso,
+                "checkouts": self._checkouts,
+                "espera_media_ms": round(1000 * self._espera_total / self._checkouts, 3) if self._checkouts else 0.0,
+                "espera_maxima_ms": round(1000 * self._espera_maxima, 3),
+                "timeouts": self._timeouts,
+                "conexoes_descartadas": self._descartadas,
+            }
+
+    def fechar(self):
+        self._pool.closeall()
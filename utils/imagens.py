@@ -0,0 +1,126 @@
+import io
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    # Fotos de iPhone chegam em HEIC; sem o plugin elas seguem sem conversão
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# ============================================================
+# PRÉ-PROCESSAMENTO DAS FOTOS DE SINISTRO
+# ============================================================
+
+# Maior lado da imagem final, em pixels
+IMAGEM_LADO_MAXIMO = int(os.environ.get("IMAGEM_LADO_MAXIMO", 2048))
+# Qualidade de recompressão (1-95)
+IMAGEM_QUALIDADE = int(os.environ.get("IMAGEM_QUALIDADE", 82))
+# JPEG ou WEBP
+IMAGEM_FORMATO = os.environ.get("IMAGEM_FORMATO", "JPEG").upper()
+# Maior lado da miniatura exibida na lista de sinistros
+MINIATURA_LADO = int(os.environ.get("MINIATURA_LADO", 320))
+MINIATURA_QUALIDADE = 70
+IMAGEM_MAX_WORKERS = int(os.environ.get("IMAGEM_MAX_WORKERS", min(4, os.cpu_count() or 1)))
+
+_FORMATOS = {
+    "JPEG": (".jpg", "image/jpeg"),
+    "WEBP": (".webp", "image/webp"),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _eh_imagem(arquivo: Dict[str, Any]) -> bool:
+    content_type = (arquivo.get('content_type') or '').lower()
+    extensao = os.path.splitext(arquivo.get('nome') or '')[1].lower()
+    return content_type.startswith('image/') or extensao in ('.jpg', '.jpeg', '.png', '.heic', '.heif', '.webp')
+
+
+def _codificar(img, formato: str, qualidade: int) -> bytes:
+    saida = io.BytesIO()
+    # Sem o parâmetro 'exif' o Pillow não copia metadados (GPS, modelo do aparelho etc.)
+    img.save(saida, format=formato, quality=qualidade, optimize=True)
+    return saida.getvalue()
+
+
+def preprocessar_imagem(arquivo: Dict[str, Any], lado_maximo: int = IMAGEM_LADO_MAXIMO,
+                        qualidade: int = IMAGEM_QUALIDADE, formato: str = IMAGEM_FORMATO) -> Dict[str, Any]:
+    """
+    Normaliza uma foto para upload: aplica a rotação do EXIF, limita a resolução,
+    recomprime em JPEG/WebP sem metadados e gera uma miniatura.
+
+    Recebe e devolve o dict de upload de utils.storage ('nome', 'bytes', 'content_type', 'chave'),
+    acrescido de 'miniatura' (outro dict de upload, ou None). Se não for possível abrir a
+    imagem (PDF, formato sem plugin, Pillow ausente), devolve o ficheiro original sem miniatura.
+    """
+    resultado = dict(arquivo, miniatura=None)
+    if Image is None or not _eh_imagem(arquivo):
+        return resultado
+
+    extensao, content_type = _FORMATOS.get(formato, _FORMATOS["JPEG"])
+    base = os.path.splitext(arquivo['nome'])[0]
+    try:
+        with Image.open(io.BytesIO(arquivo['bytes'])) as original:
+            img = ImageOps.exif_transpose(original)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+            resultado.update(nome=f"{base}{extensao}", bytes=_codificar(img, formato, qualidade),
+                             content_type=content_type)
+
+            img.thumbnail((MINIATURA_LADO, MINIATURA_LADO), Image.LANCZOS)
+            resultado['miniatura'] = {
+                'chave': arquivo.get('chave'),
+                'nome': f"{base}_mini{extensao}",
+                'bytes': _codificar(img, formato, MINIATURA_QUALIDADE),
+                'content_type': content_type,
+            }
+    except Exception as e:
+        print(f"Aviso: imagem '{arquivo.get('nome')}' enviada sem pré-processamento: {e}")
+    return resultado
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # 'spawn' evita herdar por fork as threads do servidor Streamlit
+            _pool = ProcessPoolExecutor(max_workers=IMAGEM_MAX_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def preprocessar_imagens(arquivos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Pré-processa um lote num pool de processos; a saída mantém a ordem da entrada."""
+    global _pool
+    posicoes = [i for i, a in enumerate(arquivos) if Image is not None and _eh_imagem(a)]
+    resultados = [dict(a, miniatura=None) for a in arquivos]
+    if not posicoes:
+        return resultados
+
+    try:
+        processados = list(_obter_pool().map(preprocessar_imagem, [arquivos[i] for i in posicoes]))
+    except Exception as e:
+        # Pool indisponível (worker morto por falta de memória, falha ao criar processos,
+        # erro de serialização...): processa aqui mesmo para não perder o envio
+        print(f"Aviso: pool de imagens falhou ({type(e).__name__}: {e}); processando no próprio processo.")
+        if isinstance(e, BrokenProcessPool):
+            with _pool_lock:
+                _pool = None
+        processados = [preprocessar_imagem(arquivos[i]) for i in posicoes]
+
+    for posicao, processado in zip(posicoes, processados):
+        resultados[posicao] = processado
+    return resultados
@@ -0,0 +1,171 @@
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Apólices de frota guardam as placas juntas no mesmo campo: "ABC1D23, XYZ9876"
+SEPARADOR_FROTA = re.compile(r'[,;\n/]+')
+# Colunas onde o CPF/CNPJ do segurado pode estar, conforme a versão da tabela
+COLUNAS_DOCUMENTO = ('cpf', 'cpf_cnpj', 'documento')
+# Similaridade mínima de trigramas para um nome entrar no resultado
+SIMILARIDADE_MINIMA_NOME = 0.45
+# Placa/número digitado pela metade ("ABC", "10028001"), como o ilike antigo aceitava
+TAMANHO_MINIMO_TRECHO = 3
+PONTUACAO_PREFIXO = 0.9
+PONTUACAO_TRECHO = 0.8
+
+
+def normalizar_placa(texto: str) -> str:
+    """'abc-1234' -> 'ABC1234'."""
+    return re.sub(r'[^A-Z0-9]', '', str(texto or '').upper())
+
+
+def placas_da_apolice(texto: str) -> List[str]:
+    """Quebra o campo 'placa' (frota ou não) em tokens normalizados."""
+    return [p for p in (normalizar_placa(t) for t in SEPARADOR_FROTA.split(str(texto or ''))) if p]
+
+
+def dobrar_acentos(texto: str) -> str:
+    """'JOSÉ  da Conceição' -> 'jose da conceicao'."""
+    sem_acento = unicodedata.normalize('NFKD', str(texto or ''))
+    sem_acento = ''.join(c for c in sem_acento if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', sem_acento.lower()).split())
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas no estilo pg_trgm: cada palavra é acolchoada com dois espaços antes e um depois."""
+    resultado = set()
+    for palavra in dobrar_acentos(texto).split():
+        acolchoada = f"  {palavra} "
+        resultado.update(acolchoada[i:i + 3] for i in range(len(acolchoada) - 2))
+    return resultado
+
+
+def somente_digitos(texto: str) -> str:
+    return re.sub(r'\D', '', str(texto or ''))
+
+
+class IndiceBuscaApolices:
+    """
+    Índice invertido em memória para a busca por placa, nome, CPF e número de apólice.
+
+    É alimentado pelo snapshot de apólices (utils.supabase_client) e atualizado
+    incrementalmente, linha a linha, sempre que o snapshot recebe um delta.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._linhas = {}  # id -> linha original
+        self._trigramas_nome = {}  # id -> set de trigramas do cliente
+        self._por_placa = defaultdict(set)
+        self._por_trigrama = defaultdict(set)
+        self._por_documento = defaultdict(set)
+        self._por_numero = defaultdict(set)
+
+    def __len__(self):
+        return len(self._linhas)
+
+    def limpar(self) -> None:
+        with self._lock:
+            for estrutura in (self._linhas, self._trigramas_nome, self._por_placa, self._por_trigrama,
+                              self._por_documento, self._por_numero):
+                estrutura.clear()
+
+    def _chaves(self, linha: Dict[str, Any]):
+        placas = placas_da_apolice(linha.get('placa'))
+        documentos = [d for d in (somente_digitos(linha.get(c)) for c in COLUNAS_DOCUMENTO) if d]
+        numero = somente_digitos(linha.get('numero_apolice')) or str(linha.get('numero_apolice') or '')
+        return placas, documentos, numero, trigramas(linha.get('cliente'))
+
+    def remover(self, apolice_id) -> None:
+        with self._lock:
+            linha = self._linhas.pop(apolice_id, None)
+            if linha is None:
+                return
+            placas, documentos, numero, _ = self._chaves(linha)
+            for placa in placas:
+                self._por_placa[placa].discard(apolice_id)
+            for documento in documentos:
+                self._por_documento[documento].discard(apolice_id)
+            self._por_numero[numero].discard(apolice_id)
+            for trigrama in self._trigramas_nome.pop(apolice_id, ()):
+                self._por_trigrama[trigrama].discard(apolice_id)
+
+    def atualizar(self, linhas: Iterable[Dict[str, Any]]) -> None:
+        """Insere ou substitui as linhas informadas (chave: 'id')."""
+        with self._lock:
+            for linha in linhas:
+                apolice_id = linha.get('id')
+                if apolice_id is None:
+                    continue
+                self.remover(apolice_id)
+                placas, documentos, numero, tri_nome = self._chaves(linha)
+                self._linhas[apolice_id] = linha
+                self._trigramas_nome[apolice_id] = tri_nome
+                for placa in placas:
+                    self._por_placa[placa].add(apolice_id)
+                for documento in documentos:
+                    self._por_documento[documento].add(apolice_id)
+                if numero:
+                    self._por_numero[numero].add(apolice_id)
+                for trigrama in tri_nome:
+                    self._por_trigrama[trigrama].add(apolice_id)
+
+    def buscar(self, termo: str, limite: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Retorna até 'limite' pares (pontuação, linha), do mais relevante ao menos.
+        Correspondências exatas de placa, CPF ou número valem 1.0; início de placa/número
+        vale PONTUACAO_PREFIXO e trecho no meio, PONTUACAO_TRECHO; nomes usam a
+        similaridade de trigramas. Empates vão para a vigência mais recente.
+        """
+        termo = str(termo or '').strip()
+        if not termo:
+            return []
+
+        pontuacao = {}
+        with self._lock:
+            digitos = somente_digitos(termo)
+            placa = normalizar_placa(termo)
+            for apolice_id in self._por_placa.get(placa, ()):
+                pontuacao[apolice_id] = 1.0
+            so_digitos = bool(digitos) and len(digitos) == len(re.sub(r'[\s.\-/]', '', termo))
+            if so_digitos:
+                for indice in (self._por_documento, self._por_numero):
+                    for apolice_id in indice.get(digitos, ()):
+                        pontuacao[apolice_id] = 1.0
+
+            # Trechos de placa e número: varre as chaves (milhares, não linhas), como o ilike fazia
+            parciais = [(placa, self._por_placa)] if len(placa) >= TAMANHO_MINIMO_TRECHO else []
+            if so_digitos and len(digitos) >= TAMANHO_MINIMO_TRECHO:
+                parciais.append((digitos, self._por_numero))
+            for trecho, indice in parciais:
+                for chave, ids in indice.items():
+                    if chave == trecho or trecho not in chave:
+                        continue
+                    pontos = PONTUACAO_PREFIXO if chave.startswith(trecho) else PONTUACAO_TRECHO
+                    for apolice_id in ids:
+                        if pontos > pontuacao.get(apolice_id, 0.0):
+                            pontuacao[apolice_id] = pontos
+
+            tri_termo = trigramas(termo)
+            if tri_termo:
+                em_comum = Counter()
+                for trigrama in tri_termo:
+                    em_comum.update(self._por_trigrama.get(trigrama, ()))
+                for apolice_id, comuns in em_comum.items():
+                    tri_nome = self._trigramas_nome[apolice_id]
+                    # Média entre cobertura do termo (estilo word_similarity do pg_trgm) e Jaccard:
+                    # "silva" acha "TRANSPORTES SILVA LTDA", mas nomes mais parecidos sobem no ranking.
+                    cobertura = comuns / len(tri_termo)
+                    jaccard = comuns / (len(tri_termo) + len(tri_nome) - comuns)
+                    similaridade = (cobertura + jaccard) / 2
+                    if similaridade >= SIMILARIDADE_MINIMA_NOME and similaridade > pontuacao.get(apolice_id, 0.0):
+                        pontuacao[apolice_id] = similaridade
+
+            ordenados = sorted(
+                pontuacao.items(),
+                key=lambda item: (item[1], str(self._linhas[item[0]].get('data_inicio_vigencia') or '')),
+                reverse=True,
+            )
+            return [(pontos, self._linhas[apolice_id]) for apolice_id, pontos in ordenados[:limite]]
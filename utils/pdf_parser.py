@@ -1,50 +1,197 @@
-import io
 import re
-from pypdf import PdfReader
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from utils.pdf_texto import DocumentoPDF, abrir_pdf
+
+# Fator de vencimento (posições 34-37 da linha digitável): dias desde 07/10/1997.
+# Ao chegar em 9999 (21/02/2025) o fator voltou para 1000, que passou a valer 22/02/2025.
+DATA_BASE_FATOR = date(1997, 10, 7)
+DATA_BASE_FATOR_REINICIO = date(2025, 2, 22)
+
+PADRAO_LINHA_DIGITAVEL = re.compile(r'\d{5}\.?\d{5} ?\d{5}\.?\d{6} ?\d{5}\.?\d{6} ?\d ?\d{14}')
+PADRAO_DATA = re.compile(r'\b(\d{2})/(\d{2})/(\d{4})\b')
+PADRAO_VENCIMENTO = re.compile(r'vencimento', re.IGNORECASE)
+# O vencimento gravado na parcela pode ter sido empurrado para dia útil (utils.calendario_parcelas)
+# e não bater com a data impressa no boleto: até esta distância, o boleto mais próximo serve
+TOLERANCIA_DIAS_VENCIMENTO = 5
+
+
+def formatar_linha_digitavel(digitos: str) -> str:
+    """'23790123...' (47 dígitos) -> 'AAAAA.BBBBB CCCCC.DDDDDD EEEEE.FFFFFF G HHHHHHHHHHHHHH'."""
+    c = digitos
+    return f"{c[:5]}.{c[5:10]} {c[10:15]}.{c[15:21]} {c[21:26]}.{c[26:32]} {c[32]} {c[33:]}"
+
+
+def _para_data(valor) -> Optional[date]:
+    """Aceita date, datetime, 'dd/mm/aaaa' ou 'aaaa-mm-dd'."""
+    if valor is None or isinstance(valor, date) and not isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, datetime):
+        return valor.date()
+    texto = str(valor).strip()
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto[:10], formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def data_do_fator(fator: int, referencia: date = None) -> Optional[date]:
+    """
+    Converte o fator de vencimento em data. Como o fator reinicia, o mesmo número tem
+    duas datas possíveis; fica a mais próxima de 'referencia' (data impressa ou hoje).
+    """
+    if fator < 1000:
+        # Fator zerado: boleto sem vencimento codificado
+        return None
+    referencia = referencia or date.today()
+    candidatas = [DATA_BASE_FATOR + timedelta(days=fator),
+                  DATA_BASE_FATOR_REINICIO + timedelta(days=fator - 1000)]
+    return min(candidatas, key=lambda d: abs((d - referencia).days))
+
+
+def _datas_do_texto(texto: str) -> List[date]:
+    """Datas impressas na página, com as que aparecem logo após 'Vencimento' primeiro."""
+    datas, preferidas = [], []
+    for match in PADRAO_DATA.finditer(texto):
+        try:
+            d = date(int(match.group(3)), int(match.group(2)), int(match.group(1)))
+        except ValueError:
+            continue
+        anterior = texto[max(0, match.start() - 40):match.start()]
+        (preferidas if PADRAO_VENCIMENTO.search(anterior) else datas).append(d)
+    return preferidas + datas
+
+
+def _linhas_da_pagina(texto: str) -> List[str]:
+    """Linhas digitáveis (47 dígitos, sem formatação) na ordem em que aparecem na página."""
+    texto_limpo = texto.replace('\n', ' ').replace('  ', ' ')
+    linhas = [re.sub(r'\D', '', m.group(0)) for m in PADRAO_LINHA_DIGITAVEL.finditer(texto_limpo)]
+    if not linhas:
+        # Busca bruta: o texto de alguns carnês sai com os blocos grudados ou quebrados
+        numeros = re.sub(r'\D', '', texto)
+        match_bruto = re.search(r'\d{47}', numeros)
+        if match_bruto:
+            linhas.append(match_bruto.group(0))
+    return linhas
+
+
+def _boletos_da_pagina(texto: str) -> List[Tuple[Optional[date], str]]:
+    """[(vencimento, linha_digitavel_formatada)] de uma página."""
+    datas_impressas = _datas_do_texto(texto)
+    boletos = []
+    for posicao, digitos in enumerate(_linhas_da_pagina(texto)):
+        impressa = datas_impressas[posicao] if posicao < len(datas_impressas) else (
+            datas_impressas[0] if datas_impressas else None)
+        vencimento = data_do_fator(int(digitos[33:37]), impressa) or impressa
+        boletos.append((vencimento, formatar_linha_digitavel(digitos)))
+    return boletos
+
+
+def _meses_entre(inicio: date, fim: date) -> int:
+    return (fim.year - inicio.year) * 12 + fim.month - inicio.month
+
+
+def _ordem_das_paginas(total: int, primeira_data: Optional[date], boletos_por_pagina: int,
+                       alvo: Optional[date]) -> Iterator[int]:
+    """
+    Páginas a visitar depois da primeira. Carnês têm uma parcela por mês em sequência,
+    então a página do alvo é estimada pela distância em meses e visitada antes das demais.
+    """
+    restantes = list(range(1, total))
+    if alvo and primeira_data and boletos_por_pagina:
+        estimada = _meses_entre(primeira_data, alvo) // boletos_por_pagina
+        restantes.sort(key=lambda p: abs(p - estimada))
+    return iter(restantes)
+
+
+def indexar_boletos(pdf, data_alvo=None,
+                    backend: str = None) -> Dict[Optional[date], Dict[str, Union[str, int]]]:
+    """
+    Monta o índice {vencimento: {'linha': linha digitável, 'pagina': nº da página (1..n)}} do carnê.
+
+    'pdf' são os bytes do arquivo ou um DocumentoPDF já aberto (utils.pdf_texto); neste caso as
+    páginas já extraídas nele são reaproveitadas e o documento continua aberto para quem o passou.
+    Sem 'data_alvo', percorre todas as páginas uma única vez. Com 'data_alvo', visita
+    primeiro a página estimada e para assim que encontra o vencimento pedido.
+    Boletos cujo vencimento não pôde ser determinado ficam na chave None (o primeiro encontrado).
+    'backend' escolhe a biblioteca de extração de texto (ver utils.pdf_texto).
+    """
+    if isinstance(pdf, DocumentoPDF):
+        return _indexar_documento(pdf, _para_data(data_alvo))
+    with abrir_pdf(pdf, backend) as documento:
+        return _indexar_documento(documento, _para_data(data_alvo))
+
+
+def _indexar_documento(documento: DocumentoPDF, alvo: Optional[date]):
+    indice = {}
+    total = len(documento)
+    if total == 0:
+        return indice
+
+    def visitar(numero_pagina: int) -> List[Tuple[Optional[date], str]]:
+        boletos = _boletos_da_pagina(documento.texto_pagina(numero_pagina))
+        for vencimento, linha in boletos:
+            indice.setdefault(vencimento, {'linha': linha, 'pagina': numero_pagina + 1})
+        return boletos
+
+    boletos_primeira = visitar(0)
+    if alvo in indice:
+        return indice
+    datas_primeira = [v for v, _ in boletos_primeira if v]
+    for numero_pagina in _ordem_das_paginas(total, min(datas_primeira, default=None),
+                                            len(boletos_primeira), alvo):
+        visitar(numero_pagina)
+        if alvo and alvo in indice:
+            break
+    return indice
+
+
+def vencimento_correspondente(vencimentos: Iterable[Optional[date]], data_alvo) -> Optional[date]:
+    """
+    Qual dos vencimentos do carnê corresponde a 'data_alvo': o exato; senão o único a até
+    TOLERANCIA_DIAS_VENCIMENTO dias; senão o único do mesmo mês. None se for ambíguo ou não houver.
+    """
+    alvo = _para_data(data_alvo)
+    datas = [v for v in vencimentos if v is not None]
+    if alvo is None or alvo in datas:
+        return alvo
+    proximas = [v for v in datas if abs((v - alvo).days) <= TOLERANCIA_DIAS_VENCIMENTO]
+    if len(proximas) == 1:
+        return proximas[0]
+    mesmo_mes = [v for v in datas if (v.year, v.month) == (alvo.year, alvo.month)]
+    return mesmo_mes[0] if len(mesmo_mes) == 1 else None
 
 
 def extrair_codigo_de_barras(pdf_bytes: bytes, data_vencimento: str = None) -> str:
     """
-    Lê um PDF em memória e tenta encontrar a linha digitável do boleto.
+    Lê um PDF em memória e devolve a linha digitável do boleto com o vencimento pedido.
+
+    Sem 'data_vencimento' devolve o primeiro boleto do carnê. Sem vencimento exato, aceita o
+    boleto correspondente (ver vencimento_correspondente); se o carnê tem vencimentos
+    identificáveis mas nenhum corresponde, devolve None (nunca o boleto de outro mês);
+    se nenhum vencimento pôde ser lido, cai para o primeiro boleto encontrado.
     """
     try:
-        # Cria um objeto de leitura de PDF a partir dos bytes
-        pdf_file = io.BytesIO(pdf_bytes)
-        reader = PdfReader(pdf_file)
-
-        texto_completo = ""
-
-        # Extrai texto de todas as páginas
-        for page in reader.pages:
-            texto_completo += page.extract_text() + "\n"
-
-        # Limpeza básica para facilitar a busca
-        texto_limpo = texto_completo.replace('\n', ' ').replace('  ', ' ')
-
-        # --- ESTRATÉGIA 1: REGEX ESPECÍFICO (Boleto Formatado) ---
-        # Procura por blocos de números comuns em boletos com pontuação
-        padrao_linha_digitavel = r'\d{5}\.?\d{5} ?\d{5}\.?\d{6} ?\d{5}\.?\d{6} ?\d ?\d{14}'
-        match = re.search(padrao_linha_digitavel, texto_limpo)
-
-        if match:
-            return match.group(0)
-
-        # --- ESTRATÉGIA 2: BUSCA BRUTA (Sequência de 47/48 dígitos) ---
-        # Remove tudo que não é número (pontos, espaços, letras)
-        numeros = re.sub(r'\D', '', texto_completo)
-
-        # Boletos bancários geralmente têm 47 ou 48 dígitos
-        # Se encontrarmos uma "tripa" de números desse tamanho, é quase certeza que é o boleto
-        if len(numeros) >= 47:
-            # Tenta achar uma sequência contínua de 47 dígitos
-            match_bruto = re.search(r'\d{47}', numeros)
-            if match_bruto:
-                c = match_bruto.group(0)
-                # Formata para ficar legível (AAAAA.BBBBB CCCCC.DDDDD ...)
-                # Essa formatação ajuda o cliente a ler e o app do banco a aceitar
-                return f"{c[:5]}.{c[5:10]} {c[10:15]}.{c[15:21]} {c[21:26]}.{c[26:32]} {c[32]} {c[33:]}"
+        alvo = _para_data(data_vencimento)
+        if alvo is None:
+            with abrir_pdf(pdf_bytes) as documento:
+                for texto in documento.paginas():
+                    boletos = _boletos_da_pagina(texto)
+                    if boletos:
+                        return boletos[0][1]
+            return None
 
-        return None
+        indice = indexar_boletos(pdf_bytes, alvo)
+        vencimento = vencimento_correspondente(indice, alvo)
+        if vencimento is not None:
+            return indice[vencimento]['linha']
+        if any(v is not None for v in indice):
+            return None
+        primeiro = indice.get(None)
+        return primeiro['linha'] if primeiro else None
 
     except Exception as e:
         print(f"Erro ao ler PDF: {e}")
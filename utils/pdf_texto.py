@@ -0,0 +1,190 @@
+import io
+import os
+import threading
+from typing import Dict, Iterator, List, Optional
+
+# ============================================================
+# EXTRAÇÃO DE TEXTO DE PDF COM BACKEND INTERCAMBIÁVEL
+# ============================================================
+#
+# pypdf é puro Python e está sempre instalado; PyMuPDF (fitz) e pypdfium2 são bibliotecas
+# nativas bem mais rápidas e, quando presentes, são escolhidas automaticamente.
+# PDF_TEXT_BACKEND=pymupdf|pypdfium2|pypdf força um backend específico.
+
+ORDEM_PREFERENCIA = ("pymupdf", "pypdfium2", "pypdf")
+
+
+class _BackendPyMuPDF:
+    nome = "pymupdf"
+
+    def __init__(self):
+        try:
+            import pymupdf as fitz
+        except ImportError:
+            # Versões antigas só expõem o nome 'fitz'
+            import fitz
+        self._fitz = fitz
+
+    def abrir(self, pdf_bytes: bytes):
+        return self._fitz.open(stream=pdf_bytes, filetype="pdf")
+
+    def num_paginas(self, documento) -> int:
+        return documento.page_count
+
+    def texto(self, documento, indice: int) -> str:
+        return documento.load_page(indice).get_text("text")
+
+    def fechar(self, documento):
+        documento.close()
+
+
+class _BackendPdfium:
+    nome = "pypdfium2"
+
+    def __init__(self):
+        import pypdfium2
+        self._pdfium = pypdfium2
+        # O PDFium não é thread-safe: chamadas de threads diferentes (ex.: backfill) são serializadas
+        self._lock = threading.Lock()
+
+    def abrir(self, pdf_bytes: bytes):
+        with self._lock:
+            return self._pdfium.PdfDocument(pdf_bytes)
+
+    def num_paginas(self, documento) -> int:
+        return len(documento)
+
+    def texto(self, documento, indice: int) -> str:
+        with self._lock:
+            pagina = documento[indice]
+            textpage = pagina.get_textpage()
+            try:
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+                pagina.close()
+
+    def fechar(self, documento):
+        with self._lock:
+            documento.close()
+
+
+class _BackendPypdf:
+    nome = "pypdf"
+
+    def __init__(self):
+        from pypdf import PdfReader
+        self._reader = PdfReader
+
+    def abrir(self, pdf_bytes: bytes):
+        return self._reader(io.BytesIO(pdf_bytes))
+
+    def num_paginas(self, documento) -> int:
+        return len(documento.pages)
+
+    def texto(self, documento, indice: int) -> str:
+        return documento.pages[indice].extract_text() or ""
+
+    def fechar(self, documento):
+        pass
+
+
+_CLASSES = {c.nome: c for c in (_BackendPyMuPDF, _BackendPdfium, _BackendPypdf)}
+_instancias: Dict[str, object] = {}
+_instancias_lock = threading.Lock()
+
+
+def _carregar(nome: str):
+    with _instancias_lock:
+        if nome not in _instancias:
+            _instancias[nome] = _CLASSES[nome]()
+        return _instancias[nome]
+
+
+def backends_disponiveis() -> List[str]:
+    """Backends importáveis neste ambiente, na ordem de preferência."""
+    disponiveis = []
+    for nome in ORDEM_PREFERENCIA:
+        try:
+            _carregar(nome)
+            disponiveis.append(nome)
+        except ImportError:
+            continue
+    return disponiveis
+
+
+def escolher_backend(nome: str = None):
+    """
+    Backend pedido (argumento ou PDF_TEXT_BACKEND) ou o mais rápido instalado.
+    Um backend pedido mas não instalado cai para a escolha automática, com aviso.
+    """
+    nome = (nome or os.environ.get("PDF_TEXT_BACKEND") or "").strip().lower()
+    if nome and nome != "auto":
+        if nome not in _CLASSES:
+            raise ValueError(f"Backend de PDF desconhecido: '{nome}'. Opções: {', '.join(ORDEM_PREFERENCIA)}")
+        try:
+            return _carregar(nome)
+        except ImportError:
+            print(f"Aviso: backend de PDF '{nome}' não instalado; usando a escolha automática.")
+    for candidato in ORDEM_PREFERENCIA:
+        try:
+            return _carregar(candidato)
+        except ImportError:
+            continue
+    raise ImportError("Nenhuma biblioteca de PDF instalada (instale pypdf).")
+
+
+def ler_bytes_pdf(pdf) -> bytes:
+    """Aceita bytes, UploadedFile do Streamlit ou qualquer arquivo aberto em modo binário."""
+    if isinstance(pdf, (bytes, bytearray)):
+        return bytes(pdf)
+    if hasattr(pdf, "getvalue"):
+        return pdf.getvalue()
+    return pdf.read()
+
+
+class DocumentoPDF:
+    """
+    PDF aberto com o backend escolhido. O texto de cada página só é extraído quando pedido
+    (e fica guardado), então quem para na página 2 não paga pelas outras 40.
+    """
+
+    def __init__(self, pdf, backend: str = None):
+        self._backend = escolher_backend(backend)
+        self._documento = self._backend.abrir(ler_bytes_pdf(pdf))
+        self._textos: Dict[int, str] = {}
+
+    @property
+    def backend(self) -> str:
+        return self._backend.nome
+
+    def __len__(self) -> int:
+        return self._backend.num_paginas(self._documento)
+
+    def texto_pagina(self, indice: int) -> str:
+        if indice not in self._textos:
+            self._textos[indice] = self._backend.texto(self._documento, indice) or ""
+        return self._textos[indice]
+
+    def paginas(self) -> Iterator[str]:
+        for indice in range(len(self)):
+            yield self.texto_pagina(indice)
+
+    def texto_completo(self, max_paginas: Optional[int] = None, separador: str = "\n") -> str:
+        total = len(self) if max_paginas is None else min(max_paginas, len(self))
+        return separador.join(self.texto_pagina(i) for i in range(total))
+
+    def fechar(self):
+        if self._documento is not None:
+            self._backend.fechar(self._documento)
+            self._documento = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def abrir_pdf(pdf, backend: str = None) -> DocumentoPDF:
+    return DocumentoPDF(pdf, backend)
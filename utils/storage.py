@@ -0,0 +1,169 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List
+
+from utils.supabase_client import supabase
+
+# ============================================================
+# UPLOAD DE FICHEIROS PARA O SUPABASE STORAGE
+# ============================================================
+
+BUCKET_APOLICES = "moreiraseg-apolices-pdfs-2025"
+BUCKET_SINISTROS = "sinistros"
+
+# Uploads simultâneos por lote (cada um é uma requisição HTTP ao Storage)
+UPLOAD_MAX_WORKERS = int(os.environ.get("UPLOAD_MAX_WORKERS", 6))
+# Tentativas por ficheiro antes de desistir (com espera exponencial entre elas)
+UPLOAD_TENTATIVAS = int(os.environ.get("UPLOAD_TENTATIVAS", 3))
+
+
+def bucket_do_tipo(tipo_pasta: str) -> str:
+    """Direciona cada tipo de arquivo para o seu respectivo bucket."""
+    if tipo_pasta in ['apolices', 'boletos']:
+        return BUCKET_APOLICES
+    if tipo_pasta == 'sinistros':
+        return BUCKET_SINISTROS
+    # Lógica segura para qualquer outro tipo de arquivo futuro
+    return os.environ.get(f"BUCKET_{tipo_pasta.upper()}", tipo_pasta)
+
+
+# Cache do processo: (bucket, sha256) -> URL pública já confirmada no Storage
+_urls_por_hash = {}
+_urls_por_hash_lock = threading.Lock()
+
+
+def hash_conteudo(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def caminho_por_conteudo(sha256: str, nome_ficheiro: str) -> str:
+    """Caminho endereçado pelo conteúdo: o mesmo ficheiro sempre cai no mesmo objeto."""
+    extensao = os.path.splitext(nome_ficheiro or '')[1].lower()
+    return f"conteudo/{sha256[:2]}/{sha256}{extensao}"
+
+
+def _buscar_url_conhecida(bucket_name: str, sha256: str):
+    """Procura o hash no cache local e depois na tabela 'documentos'."""
+    with _urls_por_hash_lock:
+        url = _urls_por_hash.get((bucket_name, sha256))
+    if url:
+        return url
+    try:
+        res = supabase.table('documentos').select('url') \
+            .eq('bucket', bucket_name).eq('sha256', sha256).limit(1).execute()
+        if res.data:
+            url = res.data[0]['url']
+            with _urls_por_hash_lock:
+                _urls_por_hash[(bucket_name, sha256)] = url
+            return url
+    except Exception as e:
+        # Tabela ainda não criada (sql/documentos_conteudo.sql): segue só com o cache local
+        print(f"Aviso: índice de documentos indisponível: {e}")
+    return None
+
+
+def _registrar_documento(bucket_name, sha256, caminho, url, file_bytes, content_type,
+                         nome_ficheiro, numero_referencia, cliente, tipo_pasta, novo):
+    with _urls_por_hash_lock:
+        _urls_por_hash[(bucket_name, sha256)] = url
+    try:
+        if novo:
+            supabase.table('documentos').upsert({
+                'sha256': sha256, 'bucket': bucket_name, 'caminho': caminho, 'url': url,
+                'tamanho': len(file_bytes), 'content_type': content_type
+            }, on_conflict='bucket,sha256').execute()
+        supabase.table('documentos_referencias').insert({
+            'sha256': sha256, 'bucket': bucket_name, 'tipo_pasta': tipo_pasta,
+            'numero_referencia': str(numero_referencia), 'cliente': cliente, 'nome_original': nome_ficheiro
+        }).execute()
+    except Exception as e:
+        print(f"Aviso: não foi possível registrar o documento {sha256[:12]}: {e}")
+
+
+def _objeto_ja_existe(erro: Exception) -> bool:
+    """
+    Conflito de objeto já existente, pelos campos estruturados do erro do Storage (nunca pelo texto:
+    a mensagem pode citar o caminho, e um SHA-256 em hexadecimal pode conter "409").
+    StorageApiError (storage3 recente) traz status/code; versões antigas passam o corpo como dict.
+    """
+    corpo = erro.args[0] if erro.args and isinstance(erro.args[0], dict) else {}
+    status = getattr(erro, 'status', None) or corpo.get('statusCode')
+    codigo = getattr(erro, 'code', None) or corpo.get('error')
+    return str(status) == '409' or str(codigo).lower() == 'duplicate'
+
+
+def enviar_bytes(file_bytes: bytes, nome_ficheiro: str, content_type: str, numero_referencia: str, cliente: str,
+                 tipo_pasta: str, tentativas: int = UPLOAD_TENTATIVAS) -> str:
+    """
+    Envia um ficheiro e retorna a URL pública. Levanta a última exceção se todas as tentativas falharem.
+
+    O objeto é gravado pelo SHA-256 do conteúdo: se o mesmo ficheiro já foi enviado antes
+    (carnê reenviado na edição, mesma CNH em vários sinistros), nada é transferido e a URL
+    existente é reutilizada; só o registro de referência da apólice/sinistro é criado.
+    """
+    bucket_name = bucket_do_tipo(tipo_pasta)
+    sha256 = hash_conteudo(file_bytes)
+    content_type = content_type or "application/octet-stream"
+
+    url = _buscar_url_conhecida(bucket_name, sha256)
+    if url:
+        _registrar_documento(bucket_name, sha256, None, url, file_bytes, content_type,
+                             nome_ficheiro, numero_referencia, cliente, tipo_pasta, novo=False)
+        return url
+
+    bucket = supabase.storage.from_(bucket_name)
+    destino = caminho_por_conteudo(sha256, nome_ficheiro)
+    for tentativa in range(1, tentativas + 1):
+        try:
+            bucket.upload(path=destino, file=file_bytes, file_options={"content-type": content_type})
+            break
+        except Exception as e:
+            # Mesmo conteúdo já gravado (por outro processo ou por uma tentativa anterior): serve como sucesso
+            if _objeto_ja_existe(e):
+                break
+            if tentativa == tentativas:
+                raise
+            time.sleep(0.5 * 2 ** (tentativa - 1))
+
+    url = bucket.get_public_url(destino)
+    _registrar_documento(bucket_name, sha256, destino, url, file_bytes, content_type,
+                         nome_ficheiro, numero_referencia, cliente, tipo_pasta, novo=True)
+    return url
+
+
+def enviar_em_paralelo(arquivos: List[Dict[str, Any]], numero_referencia: str, cliente: str, tipo_pasta: str,
+                       max_workers: int = UPLOAD_MAX_WORKERS, tentativas: int = UPLOAD_TENTATIVAS,
+                       ao_progredir: Callable[[int, int, str], None] = None) -> List[Dict[str, Any]]:
+    """
+    Envia vários ficheiros ao mesmo tempo num pool de threads limitado.
+
+    'arquivos' é uma lista de dicts com 'nome', 'bytes', 'content_type' e, opcionalmente,
+    'chave' (identificador livre para quem chamou, ex.: 'caminho_bo').
+
+    Retorna uma lista na MESMA ORDEM da entrada, com dicts {'chave', 'nome', 'url', 'erro'}:
+    'url' preenchida em caso de sucesso, 'erro' com a mensagem em caso de falha.
+    'ao_progredir(concluidos, total, nome)' é chamado na thread de quem chamou (seguro para o Streamlit).
+    """
+    resultados = [{'chave': a.get('chave'), 'nome': a['nome'], 'url': None, 'erro': None} for a in arquivos]
+    if not arquivos:
+        return resultados
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(arquivos)))) as executor:
+        futuros = {
+            executor.submit(enviar_bytes, a['bytes'], a['nome'], a.get('content_type'), numero_referencia, cliente,
+                            tipo_pasta, tentativas): posicao
+            for posicao, a in enumerate(arquivos)
+        }
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            posicao = futuros[futuro]
+            try:
+                resultados[posicao]['url'] = futuro.result()
+            except Exception as e:
+                resultados[posicao]['erro'] = str(e)
+            if ao_progredir:
+                ao_progredir(concluidos, len(arquivos), arquivos[posicao]['nome'])
+
+    return resultados
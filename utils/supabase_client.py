@@ -1,14 +1,18 @@
 import os
+import threading
+import time
 import streamlit as st
-import requests
 from typing import Union, Dict, Any, List
-from datetime import date, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import date
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import pandas as pd
+import numpy as np
 import re
 
+from utils import calendario_parcelas, cache_pdf
+from utils.indice_apolices import IndiceBuscaApolices
+
 # ============================================================
 # 1. LÓGICA DE CONEXÃO
 # ============================================================
@@ -56,92 +60,173 @@ def buscar_parcelas_vencendo_hoje() -> List[Dict[str, Any]]:
         return []
 
 
+# Colunas da apólice embutidas em cada parcela (join !inner feito pelo PostgREST)
+_SELECT_PARCELA_COM_APOLICE = "*, apolices!inner(id, numero_apolice, caminho_pdf_boletos, cliente, seguradora, placa)"
+
+
+def _escolher_parcela(lista_parcelas: List[Dict[str, Any]], mes_referencia: int = None) -> Union[Dict[str, Any], None]:
+    """
+    Escolhe a parcela a cobrar numa lista de pendentes ordenada por vencimento.
+    - Se 'mes_referencia' for informado (ex: 12), busca EXATAMENTE aquele mês.
+    - Se não (ou se o mês não existir), pega a MAIS ANTIGA pendente (regra de cobrança).
+    """
+    if not lista_parcelas: return None
+
+    if mes_referencia and mes_referencia > 0:
+        for p in lista_parcelas:
+            try:
+                # Extrai o mês da data 'YYYY-MM-DD'
+                if int(p['data_vencimento'].split('-')[1]) == mes_referencia:
+                    return p
+            except Exception:
+                continue
+    return lista_parcelas[0]
+
+
+def _montar_retorno_parcela(parcela: Dict[str, Any]) -> Dict[str, Any]:
+    """Achata os dados da apólice embutida no formato que o agente já consome."""
+    apolice_data = parcela.get('apolices') or {}
+    parcela['caminho_pdf_boletos'] = apolice_data.get('caminho_pdf_boletos')
+    parcela['seguradora'] = apolice_data.get('seguradora')
+    parcela['data_vencimento_atual'] = parcela['data_vencimento']
+    parcela['apolices'] = {'cliente': apolice_data.get('cliente'), 'placa': apolice_data.get('placa')}
+    return parcela
+
+
 def buscar_parcela_atual(numero_apolice: str, mes_referencia: int = None) -> Union[Dict[str, Any], None]:
     """
-    Busca parcelas.
+    Busca a parcela a cobrar de uma apólice numa única ida ao banco.
     - Se 'mes_referencia' for informado (ex: 12), busca EXATAMENTE aquele mês.
     - Se não, busca a MAIS ANTIGA pendente (regra de cobrança).
     """
     if not supabase: return None
 
     try:
-        # 1. Pega dados da apólice
-        res_apolice = supabase.table("apolices") \
-            .select("id, caminho_pdf_boletos, cliente, seguradora") \
-            .eq("numero_apolice", numero_apolice) \
+        # Parcelas pendentes com a apólice embutida, filtradas pelo número da apólice.
+        # No máximo ~24 linhas por apólice, então a escolha do mês fica em Python.
+        res_parcelas = supabase.table("parcelas") \
+            .select(_SELECT_PARCELA_COM_APOLICE) \
+            .eq("apolices.numero_apolice", numero_apolice) \
+            .eq("status", "Pendente") \
+            .order("data_vencimento", desc=False) \
             .execute()
 
-        if not res_apolice.data: return None
-        apolice_data = res_apolice.data[0]
-        apolice_id = apolice_data['id']
+        parcela_escolhida = _escolher_parcela(res_parcelas.data, mes_referencia)
+        return _montar_retorno_parcela(parcela_escolhida) if parcela_escolhida else None
+
+    except Exception as e:
+        print(f"Erro buscar_parcela_atual: {e}")
+        return None
+
+
+def buscar_parcelas_atuais(numeros_apolice: List[str], mes_referencia: int = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Versão em lote de buscar_parcela_atual: uma única consulta para várias apólices.
+    Retorna {numero_apolice: parcela}; apólices sem parcela pendente ficam de fora.
+    """
+    if not supabase or not numeros_apolice: return {}
 
-        # 2. Busca TODAS as pendentes ordenadas
+    try:
         res_parcelas = supabase.table("parcelas") \
-            .select("*") \
-            .eq("apolice_id", apolice_id) \
+            .select(_SELECT_PARCELA_COM_APOLICE) \
+            .in_("apolices.numero_apolice", list(set(numeros_apolice))) \
             .eq("status", "Pendente") \
             .order("data_vencimento", desc=False) \
             .execute()
 
-        if not res_parcelas.data: return None
-
-        lista_parcelas = res_parcelas.data
-        parcela_escolhida = None
-
-        # --- LÓGICA DE SELEÇÃO INTELIGENTE ---
-        if mes_referencia and mes_referencia > 0:
-            # Tenta encontrar o mês pedido pelo usuário
-            for p in lista_parcelas:
-                try:
-                    # Extrai o mês da data 'YYYY-MM-DD'
-                    mes_vencimento = int(p['data_vencimento'].split('-')[1])
-                    if mes_vencimento == mes_referencia:
-                        parcela_escolhida = p
-                        break
-                except:
-                    continue
-
-            # Se não achou o mês exato, pega a primeira (fallback)
-            if not parcela_escolhida:
-                parcela_escolhida = lista_parcelas[0]
-        else:
-            # Se não pediu mês, pega a mais antiga (Regra Padrão)
-            parcela_escolhida = lista_parcelas[0]
-
-        # 3. Monta o retorno
-        if parcela_escolhida:
-            parcela_escolhida['caminho_pdf_boletos'] = apolice_data.get('caminho_pdf_boletos')
-            parcela_escolhida['seguradora'] = apolice_data.get('seguradora')
-            parcela_escolhida['data_vencimento_atual'] = parcela_escolhida['data_vencimento']
-            parcela_escolhida['apolices'] = {'cliente': apolice_data['cliente']}
-            return parcela_escolhida
+        por_apolice = {}
+        for p in res_parcelas.data:
+            por_apolice.setdefault(p['apolices']['numero_apolice'], []).append(p)
 
-        return None
+        resultado = {}
+        for numero, lista in por_apolice.items():
+            parcela_escolhida = _escolher_parcela(lista, mes_referencia)
+            if parcela_escolhida:
+                resultado[numero] = _montar_retorno_parcela(parcela_escolhida)
+        return resultado
 
     except Exception as e:
-        print(f"Erro buscar_parcela_atual: {e}")
-        return None
+        print(f"Erro buscar_parcelas_atuais: {e}")
+        return {}
+
+
+def _baixar_do_storage(caminho: str) -> bytes:
+    bucket_name = "moreiraseg-apolices-pdfs-2025"
+    return supabase.storage.from_(bucket_name).download(caminho)
 
 
 def baixar_pdf_bytes(caminho_ou_url: str) -> Union[bytes, None]:
+    """Baixa o PDF passando pelo cache em disco (utils.cache_pdf); pedidos repetidos não vão à rede."""
     if not caminho_ou_url: return None
     try:
-        if str(caminho_ou_url).startswith("http"):
-            response = requests.get(caminho_ou_url, timeout=15)
-            return response.content if response.status_code == 200 else None
-        else:
-            bucket_name = "moreiraseg-apolices-pdfs-2025"
-            return supabase.storage.from_(bucket_name).download(caminho_ou_url)
+        return cache_pdf.obter_pdf(caminho_ou_url, _baixar_do_storage)
     except Exception:
         return None
 
 
+def gravar_boletos_do_carne(apolice_id: int, pdf_bytes: bytes = None,
+                            caminho_pdf_boletos: str = None) -> Dict[str, Any]:
+    """
+    Lê o carnê uma única vez e grava a linha digitável e a página de cada boleto na parcela
+    correspondente (RPC gravar_boletos_parcelas, ver sql/parcelas_boletos.sql).
+    Usa 'pdf_bytes' quando o arquivo acabou de ser enviado; senão baixa 'caminho_pdf_boletos'.
+    Retorna {'gravadas': n, 'sem_boleto': [parcelas pendentes que ficaram sem código]}.
+    """
+    vazio = {"gravadas": 0, "sem_boleto": []}
+    if not supabase: return vazio
+    try:
+        from utils.pdf_parser import indexar_boletos
+    except ImportError as e:
+        print(f"Aviso: leitor de PDF indisponível, boletos não indexados: {e}")
+        return vazio
+
+    try:
+        if pdf_bytes is None:
+            pdf_bytes = baixar_pdf_bytes(caminho_pdf_boletos)
+        if not pdf_bytes:
+            return vazio
+        resultado = gravar_indice_boletos(apolice_id, indexar_boletos(pdf_bytes))
+        if resultado["sem_boleto"]:
+            vencimentos = ", ".join(str(p.get('data_vencimento')) for p in resultado["sem_boleto"])
+            print(f"Aviso: apólice {apolice_id} tem parcela(s) pendente(s) sem boleto no carnê: {vencimentos}")
+        return resultado
+    except Exception as e:
+        # A consulta do agente continua funcionando lendo o PDF na hora
+        print(f"Erro gravar_boletos_do_carne (apólice {apolice_id}): {e}")
+        return vazio
+
+
+def gravar_indice_boletos(apolice_id: int, indice: Dict[Any, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Grava um índice já montado por utils.pdf_parser.indexar_boletos. Levanta exceção em caso de erro.
+    Retorna {'gravadas': n, 'sem_boleto': [{'id', 'numero_parcela', 'data_vencimento'}, ...]}.
+    """
+    boletos = [{"data_vencimento": vencimento.isoformat(), "linha": b['linha'], "pagina": b['pagina']}
+               for vencimento, b in indice.items() if vencimento is not None]
+    res = supabase.rpc("gravar_boletos_parcelas", {
+        "p_apolice_id": int(apolice_id),
+        "p_boletos": boletos
+    }).execute()
+    dados = res.data or {}
+    return {"gravadas": int(dados.get("gravadas") or 0), "sem_boleto": dados.get("sem_boleto") or []}
+
+
+def _id_da_apolice(numero_apolice: str):
+    """Resolve o id da apólice pelo snapshot em memória; só consulta o banco se ele não estiver carregado."""
+    with _snapshot_lock:
+        if _snapshot["carregado_em"] is not None:
+            for linha in _snapshot["linhas"].values():
+                if str(linha.get('numero_apolice')) == str(numero_apolice):
+                    return linha['id']
+    res = supabase.table("apolices").select("id").eq("numero_apolice", numero_apolice).execute()
+    return res.data[0]['id'] if res.data else None
+
+
 def atualizar_status_pagamento(numero_apolice: str, data_vencimento: date) -> bool:
     if not supabase: return False
     try:
-        res = supabase.table("apolices").select("id").eq("numero_apolice", numero_apolice).execute()
-        if not res.data: return False
-        apolice_id = res.data[0]['id']
+        apolice_id = _id_da_apolice(numero_apolice)
+        if apolice_id is None: return False
         data_str = data_vencimento.isoformat() if isinstance(data_vencimento, date) else data_vencimento
 
         supabase.table("parcelas").update({
@@ -152,18 +237,25 @@ def atualizar_status_pagamento(numero_apolice: str, data_vencimento: date) -> bo
         return False
 
 
-def buscar_apolice_inteligente(termo: str) -> List[Dict[str, Any]]:
+_CAMPOS_BUSCA_INTELIGENTE = ("cliente", "numero_apolice", "placa", "seguradora", "data_inicio_vigencia", "status")
+
+
+def buscar_apolice_inteligente(termo: str, limite: int = 5) -> List[Dict[str, Any]]:
     """
-    CORRIGIDO: Ordena por 'data_inicio_vigencia' para evitar erro de coluna inexistente.
+    Busca apólices por placa (com ou sem hífen, inclusive frota), nome (sem acento) ou CPF.
+    Usa o índice em memória do snapshot; o banco só é consultado se o snapshot não carregar.
     """
     if not supabase: return []
+    termo_limpo = termo.strip()
     try:
-        termo_limpo = termo.strip()
-        response = supabase.table('apolices').select(
-            "cliente, numero_apolice, placa, seguradora, data_inicio_vigencia, status"
-        ).or_(f"placa.ilike.%{termo_limpo}%,cliente.ilike.%{termo_limpo}%") \
+        if _sincronizar_snapshot():
+            return [{campo: linha.get(campo) for campo in _CAMPOS_BUSCA_INTELIGENTE}
+                    for _, linha in _indice_busca.buscar(termo_limpo, limite)]
+
+        response = supabase.table('apolices').select(", ".join(_CAMPOS_BUSCA_INTELIGENTE)) \
+            .or_(f"placa.ilike.%{termo_limpo}%,cliente.ilike.%{termo_limpo}%") \
             .order("data_inicio_vigencia", desc=True) \
-            .limit(5).execute()
+            .limit(limite).execute()
         return response.data
     except Exception as e:
         # Retorna lista vazia em caso de erro para não quebrar o fluxo
@@ -176,14 +268,8 @@ def buscar_apolice_inteligente(termo: str) -> List[Dict[str, Any]]:
 # ============================================================
 
 def adicionar_dias_uteis(data_inicial: date, dias_uteis: int) -> date:
-    """Calcula data útil futura (usada no cadastro de apólices)"""
-    dias_adicionados = 0
-    data_atual = data_inicial
-    while dias_adicionados < dias_uteis:
-        data_atual += timedelta(days=1)
-        if data_atual.weekday() < 5:
-            dias_adicionados += 1
-    return data_atual
+    """Calcula data útil futura (usada no cadastro de apólices), pulando fins de semana e feriados"""
+    return calendario_parcelas.adicionar_dias_uteis(data_inicial, dias_uteis)
 
 
 def buscar_cobrancas_boleto_do_dia():
@@ -208,30 +294,103 @@ def buscar_todas_as_parcelas_pendentes():
         return []
 
 
+def buscar_resumo_dashboard(inicio_semana: date, fim_semana: date) -> Union[Dict[str, Any], None]:
+    """
+    Números do painel 'Controle de Parcelas' numa única ida ao banco (RPC resumo_dashboard_parcelas,
+    ver sql/resumo_dashboard_parcelas.sql). O payload só cresce com as parcelas da semana.
+
+    Retorna: total_apolices, pendentes_quantidade, pendentes_valor, semana_quantidade e
+    semana_detalhes (lista de dicts com cliente, numero_apolice, numero_parcela, data_vencimento, valor).
+    """
+    if not supabase: return None
+    try:
+        res = supabase.rpc("resumo_dashboard_parcelas", {
+            "p_inicio_semana": inicio_semana.isoformat(),
+            "p_fim_semana": fim_semana.isoformat()
+        }).execute()
+        return res.data
+    except Exception as e:
+        # Função ainda não criada no banco: calcula do jeito antigo para o painel não parar
+        print(f"Erro buscar_resumo_dashboard (usando cálculo local): {e}")
+        return _resumo_dashboard_local(inicio_semana, fim_semana)
+
+
+def _resumo_dashboard_local(inicio_semana: date, fim_semana: date) -> Union[Dict[str, Any], None]:
+    try:
+        total_apolices = supabase.table('apolices').select('id', count='exact').execute().count
+    except Exception as e:
+        print(f"Erro ao contar apólices: {e}")
+        return None
+
+    pendentes = buscar_todas_as_parcelas_pendentes()
+    semana = [p for p in pendentes
+              if inicio_semana.isoformat() <= str(p.get('data_vencimento')) <= fim_semana.isoformat()]
+    semana.sort(key=lambda p: str(p.get('data_vencimento')))
+    campos = ('cliente', 'numero_apolice', 'numero_parcela', 'data_vencimento', 'valor')
+    return {
+        'total_apolices': total_apolices,
+        'pendentes_quantidade': len(pendentes),
+        'pendentes_valor': sum(float(p.get('valor') or 0) for p in pendentes),
+        'semana_quantidade': len(semana),
+        'semana_detalhes': [{c: p.get(c) for c in campos} for p in semana],
+    }
+
+
 def get_apolices(search_term=None):
-    """RESTAURADA: Popula a tabela principal e contadores do Dashboard"""
+    """RESTAURADA: Popula a tabela principal e contadores do Dashboard.
+
+    Lê do snapshot em memória (ver seção 4); o banco só é consultado para o delta.
+    """
     if not supabase: return pd.DataFrame()
     try:
-        query = supabase.table('apolices').select("*").order('id', desc=True)
+        df = _obter_snapshot_apolices()
+        if df.empty:
+            return pd.DataFrame()
         if search_term:
-            term = f"%{search_term}%"
-            query = query.or_(f"numero_apolice.ilike.{term},cliente.ilike.{term},placa.ilike.{term}")
-        res = query.execute()
-        df = pd.DataFrame(res.data)
+            termo = str(search_term).strip()
+            mascara = pd.Series(False, index=df.index)
+            for coluna in ('numero_apolice', 'cliente', 'placa'):
+                if coluna in df.columns:
+                    mascara |= df[coluna].fillna('').astype(str).str.contains(termo, case=False, regex=False)
+            df = df[mascara]
+        df = df.copy()
         if not df.empty:
-            # Conversão e cálculos de datas
-            df['data_inicio_vigencia'] = pd.to_datetime(df['data_inicio_vigencia']).dt.date
-            df['data_final_de_vigencia'] = df['data_inicio_vigencia'].apply(
-                lambda x: x + relativedelta(years=1) if pd.notnull(x) else None)
-            df['dias_restantes'] = (pd.to_datetime(df['data_final_de_vigencia']).dt.date - date.today()).apply(
-                lambda x: x.days)
-            df['prioridade'] = df['dias_restantes'].apply(lambda d: '⚪ Expirada' if d < 0 else (
-                '🔥 Urgente' if d <= 15 else ('⚠️ Alta' if d <= 30 else ('⚠️ Média' if d <= 60 else '✅ Baixa'))))
+            calcular_colunas_renovacao(df)
         return df
-    except:
+    except Exception as e:
+        print(f"Erro get_apolices: {e}")
         return pd.DataFrame()
 
 
+# Ordem das faixas de prioridade de renovação (também é a ordem das abas do Dashboard)
+PRIORIDADES_RENOVACAO = ['🔥 Urgente', '⚠️ Alta', '⚠️ Média', '✅ Baixa', '⚪ Expirada']
+
+
+def calcular_colunas_renovacao(df: pd.DataFrame, hoje: date = None) -> pd.DataFrame:
+    """
+    Preenche (no próprio df) as colunas derivadas de renovação, de forma vetorizada:
+    - data_inicio_vigencia / data_final_de_vigencia: datetime64 (início + 1 ano, 29/02 vira 28/02)
+    - dias_restantes: dias até o fim da vigência (Int64; nulo sem data de início)
+    - prioridade: categórica, nas faixas de PRIORIDADES_RENOVACAO
+    """
+    hoje = pd.Timestamp(hoje or date.today())
+    inicio = pd.to_datetime(df['data_inicio_vigencia'], errors='coerce')
+    final = inicio + pd.DateOffset(years=1)
+    dias = (final - hoje).dt.days
+
+    prioridade = np.select(
+        [dias < 0, dias <= 15, dias <= 30, dias <= 60, dias.notna()],
+        ['⚪ Expirada', '🔥 Urgente', '⚠️ Alta', '⚠️ Média', '✅ Baixa'],
+        default=None,
+    )
+
+    df['data_inicio_vigencia'] = inicio
+    df['data_final_de_vigencia'] = final
+    df['dias_restantes'] = dias.astype('Int64')
+    df['prioridade'] = pd.Categorical(prioridade, categories=PRIORIDADES_RENOVACAO)
+    return df
+
+
 def get_sinistros():
     """RESTAURADA: Popula a aba de Sinistros"""
     if not supabase: return pd.DataFrame()
@@ -258,4 +417,154 @@ def add_historico_sinistro(sinistro_id, usuario_email, status_anterior, status_n
             {'sinistro_id': sinistro_id, 'usuario': usuario_email, 'status_anterior': status_anterior,
              'status_novo': status_novo, 'observacao': observacao}).execute()
     except:
-        pass
\ No newline at end of file
+        pass
+
+
+# ============================================================
+# 4. SNAPSHOT DE APÓLICES (CACHE EM MEMÓRIA DO PROCESSO)
+# ============================================================
+# A tabela inteira é baixada uma vez por processo. Depois disso só buscamos as
+# linhas com 'data_atualizacao' maior que o último watermark. Exclusões e linhas
+# sem 'data_atualizacao' só aparecem na recarga completa, feita ao fim do TTL.
+
+# Intervalo mínimo entre duas consultas incrementais ao banco
+SNAPSHOT_REFRESH_SEGUNDOS = float(os.environ.get("SNAPSHOT_APOLICES_REFRESH_SEGUNDOS", 30))
+# Idade máxima do snapshot antes de uma recarga completa
+SNAPSHOT_TTL_SEGUNDOS = float(os.environ.get("SNAPSHOT_APOLICES_TTL_SEGUNDOS", 900))
+# O PostgREST do Supabase limita cada resposta a 1000 linhas por padrão
+SNAPSHOT_TAMANHO_PAGINA = 1000
+
+_snapshot_lock = threading.Lock()
+# Índice de busca (placa/nome/CPF) mantido junto com o snapshot
+_indice_busca = IndiceBuscaApolices()
+_snapshot = {
+    "linhas": {},  # id -> dict da apólice, como veio do banco
+    "watermark": None,  # maior 'data_atualizacao' já vista
+    "carregado_em": None,  # time.monotonic() da última carga completa
+    "verificado_em": None,  # time.monotonic() da última consulta incremental
+    "df": None,  # DataFrame montado a partir de 'linhas' (None = precisa remontar)
+}
+
+
+def _parse_timestamp(valor):
+    try:
+        return pd.Timestamp(valor)
+    except Exception:
+        return None
+
+
+def _mesclar_no_snapshot(linhas: List[Dict[str, Any]], avancar_watermark: bool = True) -> None:
+    """Incorpora linhas novas/alteradas ao snapshot e avança o watermark. Chamar com o lock."""
+    if not linhas:
+        return
+    watermark = _snapshot["watermark"]
+    watermark_ts = _parse_timestamp(watermark) if watermark else None
+    for linha in linhas:
+        if linha.get('id') is None:
+            continue
+        _snapshot["linhas"][linha['id']] = linha
+        if not avancar_watermark:
+            continue
+        atualizado = linha.get('data_atualizacao')
+        atualizado_ts = _parse_timestamp(atualizado) if atualizado else None
+        if atualizado_ts is not None and (watermark_ts is None or atualizado_ts > watermark_ts):
+            watermark, watermark_ts = atualizado, atualizado_ts
+    _snapshot["watermark"] = watermark
+    _snapshot["df"] = None
+    _indice_busca.atualizar(linhas)
+
+
+def paginar(consulta_por_faixa, tamanho_pagina: int = SNAPSHOT_TAMANHO_PAGINA):
+    """
+    Percorre todas as linhas de uma consulta, página a página.
+    'consulta_por_faixa(de, ate)' devolve a query já com .range(de, ate) e ordenação estável.
+    """
+    inicio = 0
+    while True:
+        dados = consulta_por_faixa(inicio, inicio + tamanho_pagina - 1).execute().data or []
+        yield from dados
+        if len(dados) < tamanho_pagina:
+            break
+        inicio += tamanho_pagina
+
+
+def _buscar_apolices_paginado(data_atualizacao_desde=None) -> List[Dict[str, Any]]:
+    def consulta(de, ate):
+        query = supabase.table('apolices').select("*")
+        if data_atualizacao_desde:
+            # gte: reler a linha do próprio watermark é barato e evita perder empates
+            query = query.gte('data_atualizacao', data_atualizacao_desde)
+        return query.order('id', desc=True).range(de, ate)
+
+    return list(paginar(consulta))
+
+
+def _recarregar_snapshot_completo() -> None:
+    linhas = _buscar_apolices_paginado()
+    agora = time.monotonic()
+    _snapshot["linhas"] = {}
+    _snapshot["watermark"] = None
+    _indice_busca.limpar()
+    _mesclar_no_snapshot(linhas)
+    _snapshot["df"] = None
+    _snapshot["carregado_em"] = agora
+    _snapshot["verificado_em"] = agora
+
+
+def _atualizar_snapshot_incremental() -> None:
+    linhas = _buscar_apolices_paginado(data_atualizacao_desde=_snapshot["watermark"])
+    _mesclar_no_snapshot(linhas)
+    _snapshot["verificado_em"] = time.monotonic()
+
+
+def _sincronizar_snapshot() -> bool:
+    """Atualiza o snapshot se o intervalo/TTL venceu. Retorna False se ele nunca carregou."""
+    with _snapshot_lock:
+        agora = time.monotonic()
+        carregado_em = _snapshot["carregado_em"]
+        verificado_em = _snapshot["verificado_em"]
+        precisa_verificar = verificado_em is None or agora - verificado_em > SNAPSHOT_REFRESH_SEGUNDOS
+        try:
+            if carregado_em is None or agora - carregado_em > SNAPSHOT_TTL_SEGUNDOS:
+                _recarregar_snapshot_completo()
+            elif precisa_verificar:
+                if _snapshot["watermark"] is None:
+                    # Sem nenhuma 'data_atualizacao' conhecida não há delta possível
+                    _recarregar_snapshot_completo()
+                else:
+                    _atualizar_snapshot_incremental()
+        except Exception as e:
+            # Se o banco falhar, continua servindo o último snapshot válido
+            print(f"Erro ao atualizar snapshot de apólices: {e}")
+        return _snapshot["carregado_em"] is not None
+
+
+def _obter_snapshot_apolices() -> pd.DataFrame:
+    """Retorna o DataFrame bruto das apólices (ordenado por id desc), atualizando-o se preciso."""
+    _sincronizar_snapshot()
+    with _snapshot_lock:
+        if _snapshot["df"] is None:
+            df = pd.DataFrame(list(_snapshot["linhas"].values()))
+            if not df.empty:
+                df = df.sort_values('id', ascending=False, ignore_index=True)
+            _snapshot["df"] = df
+        return _snapshot["df"]
+
+
+def invalidar_snapshot_apolices(linhas: List[Dict[str, Any]] = None, completo: bool = False) -> None:
+    """
+    Gancho de invalidação do snapshot, chamado após escrever em 'apolices'.
+
+    - linhas: linhas devolvidas pelo insert/update; entram no snapshot na hora.
+    - completo: descarta o snapshot e força recarga total na próxima leitura (ex.: exclusões).
+    Sem argumentos, apenas antecipa a próxima consulta incremental.
+    """
+    with _snapshot_lock:
+        if completo:
+            _snapshot["carregado_em"] = None
+            return
+        if linhas:
+            # O watermark não avança: escritas de outros processos no mesmo intervalo
+            # ainda precisam vir na próxima consulta incremental.
+            _mesclar_no_snapshot(linhas, avancar_watermark=False)
+        _snapshot["verificado_em"] = None